@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from os import getenv
+import metricas
+
+# Agendador de tarefas alinhado aos fechamentos de candle.
+#
+# Os monitores rodavam em `while True: trabalho; sleep(N)`: o início de cada
+# rodada dependia de quanto a anterior demorou, então o horário escorregava e
+# caía em qualquer ponto do candle. Aqui cada tarefa dispara no fechamento do
+# seu timeframe (múltiplos do período desde a época, em UTC, como os candles
+# da Binance) mais um pequeno deslocamento. Uma tarefa nunca roda duas vezes
+# ao mesmo tempo: se a execução anterior ainda não terminou no próximo
+# fechamento, aquele disparo é pulado e registrado.
+
+OFFSET_PADRAO = float(getenv("AGENDADOR_OFFSET", 2.0))  # Segundos depois do fechamento do candle
+PULOS_REGISTRADOS = 100  # Últimos disparos pulados guardados por tarefa
+
+duracao_tarefa = metricas.histograma("agendador_duracao_segundos", "Duração de cada execução das tarefas", ("tarefa",))
+atraso_tarefa = metricas.histograma("agendador_atraso_segundos", "Do fechamento do candle (mais offset) ao início da execução", ("tarefa",))
+eventos_tarefa = metricas.contador("agendador_eventos_total", "Execuções, falhas e disparos pulados", ("tarefa", "evento"))
+
+UNIDADES = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+def segundos_timeframe(timeframe):
+    """'1m' -> 60, '15m' -> 900, '4h' -> 14400."""
+    return int(timeframe[:-1]) * UNIDADES[timeframe[-1]]
+
+def proximo_fechamento(agora, periodo, offset=0.0):
+    """Primeiro instante depois de `agora` que é um fechamento de `periodo` mais `offset`."""
+    return (agora - offset) // periodo * periodo + periodo + offset
+
+class Tarefa:
+    """Uma tarefa do agendador e suas estatísticas."""
+
+    def __init__(self, nome, funcao, timeframe, offset):
+        self.nome = nome
+        self.funcao = funcao
+        self.timeframe = timeframe
+        self.periodo = segundos_timeframe(timeframe)
+        self.offset = offset
+        self.execucao = None
+        self.ultimo_disparo = None
+        self.pulos = deque(maxlen=PULOS_REGISTRADOS)  # (instante do disparo, motivo)
+        self.metricas = {
+            'execucoes': 0,
+            'falhas': 0,
+            'pulos': 0,
+            'atraso': 0.0,        # Do fechamento (mais offset) ao início da última execução
+            'duracao': 0.0,
+            'duracao_max': 0.0,
+        }
+
+    def pular(self, disparo, motivo):
+        self.pulos.append((disparo, motivo))
+        self.metricas['pulos'] += 1
+        eventos_tarefa.inc(tarefa=self.nome, evento="pulo")
+        logging.warning(f"Tarefa {self.nome}: disparo de {time.strftime('%H:%M:%S', time.gmtime(disparo))} UTC pulado ({motivo})")
+
+class Agendador:
+    """Executa tarefas assíncronas alinhadas aos candles, todas no mesmo event loop."""
+
+    def __init__(self, diferenca_relogio=0.0):
+        self.diferenca_relogio = diferenca_relogio  # Relógio da exchange menos o local, em segundos
+        self.tarefas = []
+
+    def agora(self):
+        return time.time() + self.diferenca_relogio
+
+    def adicionar(self, nome, funcao, timeframe='1m', offset=OFFSET_PADRAO):
+        """Agenda `funcao()` (corrotina) para cada fechamento de `timeframe` mais `offset` segundos."""
+        tarefa = Tarefa(nome, funcao, timeframe, offset)
+        self.tarefas.append(tarefa)
+        return tarefa
+
+    async def sincronizar_relogio(self, obter_tempo_ms):
+        """Ajusta o relógio pelo da exchange; `obter_tempo_ms()` devolve o horário do servidor em ms."""
+        try:
+            inicio = time.time()
+            servidor = await obter_tempo_ms() / 1000
+            fim = time.time()
+        except Exception as e:
+            logging.error(f"Não foi possível sincronizar o relógio com a exchange: {e}")
+            return
+        # O servidor respondeu, em média, no meio da ida e volta
+        self.diferenca_relogio = servidor - (inicio + fim) / 2
+        logging.info(f"Relógio local {-self.diferenca_relogio * 1000:+.0f} ms em relação à exchange")
+
+    async def _laco(self, tarefa):
+        while True:
+            disparo = proximo_fechamento(self.agora(), tarefa.periodo, tarefa.offset)
+            if tarefa.ultimo_disparo is not None:
+                if disparo <= tarefa.ultimo_disparo:
+                    # Acordou um pouco antes do horário: o próximo é o seguinte
+                    disparo = tarefa.ultimo_disparo + tarefa.periodo
+                perdidos = round((disparo - tarefa.ultimo_disparo) / tarefa.periodo) - 1
+                for i in range(perdidos):
+                    # Event loop travado ou máquina suspensa por mais de um período
+                    tarefa.pular(tarefa.ultimo_disparo + (i + 1) * tarefa.periodo, "atrasado")
+            await asyncio.sleep(max(0.0, disparo - self.agora()))
+            tarefa.ultimo_disparo = disparo
+            if tarefa.execucao is not None and not tarefa.execucao.done():
+                tarefa.pular(disparo, "execução anterior ainda em andamento")
+                continue
+            tarefa.execucao = asyncio.create_task(self._executar(tarefa, disparo))
+
+    async def _executar(self, tarefa, disparo):
+        inicio = self.agora()
+        tarefa.metricas['atraso'] = inicio - disparo
+        atraso_tarefa.observar(max(0.0, inicio - disparo), tarefa=tarefa.nome)
+        try:
+            await tarefa.funcao()
+            tarefa.metricas['execucoes'] += 1
+            eventos_tarefa.inc(tarefa=tarefa.nome, evento="execucao")
+        except Exception as e:
+            tarefa.metricas['falhas'] += 1
+            eventos_tarefa.inc(tarefa=tarefa.nome, evento="falha")
+            logging.error(f"Erro na tarefa {tarefa.nome}: {e}")
+        finally:
+            duracao = self.agora() - inicio
+            tarefa.metricas['duracao'] = duracao
+            tarefa.metricas['duracao_max'] = max(tarefa.metricas['duracao_max'], duracao)
+            duracao_tarefa.observar(duracao, tarefa=tarefa.nome)
+
+    async def executar(self):
+        """Roda todas as tarefas até ser cancelado."""
+        lacos = [asyncio.create_task(self._laco(tarefa), name=f"agendador-{tarefa.nome}") for tarefa in self.tarefas]
+        logging.info("Agendador: " + ", ".join(f"{t.nome} a cada {t.timeframe} (+{t.offset:g}s)" for t in self.tarefas))
+        try:
+            await asyncio.gather(*lacos)
+        finally:
+            pendentes = lacos + [t.execucao for t in self.tarefas if t.execucao is not None]
+            for tarefa in pendentes:
+                tarefa.cancel()
+            await asyncio.gather(*pendentes, return_exceptions=True)
+
+    def estatisticas(self):
+        return {tarefa.nome: dict(tarefa.metricas) for tarefa in self.tarefas}
@@ -0,0 +1,30 @@
+import numpy as np
+
+# Regra de sinal da agressão, compartilhada pelos monitores.
+#
+# Recebe o saldo de agressão (compra - venda) de cada intervalo, do mais
+# antigo para o mais recente. O último intervalo gera sinal de compra quando
+# passa de média + multiplicador * desvio padrão da janela, e de venda quando
+# fica abaixo de média - multiplicador * desvio padrão.
+
+def avaliar_agressao(saldos, multiplicador=1.0):
+    """Retorna um dicionário com média, limites, último saldo e o sinal ("compra", "venda" ou None)."""
+    saldos = np.asarray(saldos, dtype=np.float64)
+    media = saldos.mean()
+    desvio = saldos.std(ddof=1) if len(saldos) > 1 else 0.0
+    limite_superior = media + multiplicador * desvio
+    limite_inferior = media - multiplicador * desvio
+    ultimo = saldos[-1]
+    if ultimo > limite_superior:
+        sinal = "compra"
+    elif ultimo < limite_inferior:
+        sinal = "venda"
+    else:
+        sinal = None
+    return {
+        'media': media,
+        'limite_superior': limite_superior,
+        'limite_inferior': limite_inferior,
+        'ultimo': ultimo,
+        'sinal': sinal,
+    }
@@ -0,0 +1,196 @@
+import argparse
+import glob
+import logging
+import os
+from datetime import datetime, timezone
+from os import getenv
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Arquivo histórico de trades em Parquet, para as análises de agressão e treino de modelos.
+#
+#   <raiz>/symbol=BTCUSDT/date=2024-05-01/part-<primeiro id>-<último id>.parquet
+#
+# Cada dia de cada símbolo é uma partição (datas em UTC). Colunas:
+#   id, time  int64, gravados com DELTA_BINARY_PACKED (sequências quase contínuas)
+#   price, qty float64
+#   lado      dicionário {"compra", "venda"} com o lado agressor (venda = is_buyer_maker)
+#
+# A coleta gera várias partes por dia; `compactar_particao` junta as partes num
+# único arquivo ordenado por id e sem trades repetidos.
+
+logging.basicConfig(level=logging.INFO)
+
+DIRETORIO_ARQUIVO = getenv("TRADES_ARQUIVO_DIR", "arquivo")
+DIA_MS = 24 * 60 * 60 * 1000
+LADOS = pa.array(["compra", "venda"])
+
+SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('time', pa.int64()),
+    ('price', pa.float64()),
+    ('qty', pa.float64()),
+    ('lado', pa.dictionary(pa.int8(), pa.string())),
+])
+
+OPCOES_ESCRITA = {
+    'compression': 'zstd',
+    'use_dictionary': ['lado'],
+    'column_encoding': {'id': 'DELTA_BINARY_PACKED', 'time': 'DELTA_BINARY_PACKED'},
+    'row_group_size': 1_000_000,
+}
+
+def _data(dia):
+    return datetime.fromtimestamp(dia * DIA_MS / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+
+def diretorio_particao(symbol, data, raiz=DIRETORIO_ARQUIVO):
+    return os.path.join(raiz, f"symbol={symbol}", f"date={data}")
+
+def montar_tabela(colunas):
+    """Converte colunas no formato de trade_schema.decodificar_trades para uma tabela Arrow."""
+    lados = np.asarray(colunas['is_buyer_maker'], dtype=bool).astype(np.int8)
+    return pa.Table.from_arrays([
+        pa.array(np.asarray(colunas['id'], dtype=np.int64)),
+        pa.array(np.asarray(colunas['time'], dtype=np.int64)),
+        pa.array(np.asarray(colunas['price'], dtype=np.float64)),
+        pa.array(np.asarray(colunas['qty'], dtype=np.float64)),
+        pa.DictionaryArray.from_arrays(pa.array(lados), LADOS),
+    ], schema=SCHEMA)
+
+def _gravar(tabela, caminho):
+    # Grava num arquivo temporário e renomeia, para um leitor nunca ver um arquivo pela metade
+    temporario = caminho + ".tmp"
+    pq.write_table(tabela, temporario, **OPCOES_ESCRITA)
+    os.replace(temporario, caminho)
+
+def arquivar(symbol, colunas, raiz=DIRETORIO_ARQUIVO):
+    """Grava trades de um símbolo como novas partes, uma por dia. Retorna os arquivos criados."""
+    tabela = montar_tabela(colunas)
+    if tabela.num_rows == 0:
+        return []
+    tabela = tabela.sort_by('id')
+    dias = tabela.column('time').to_numpy() // DIA_MS
+    arquivos = []
+    for dia in np.unique(dias):
+        parte = tabela.filter(pa.array(dias == dia))
+        ids = parte.column('id')
+        diretorio = diretorio_particao(symbol, _data(dia), raiz)
+        os.makedirs(diretorio, exist_ok=True)
+        caminho = os.path.join(diretorio, f"part-{ids[0].as_py()}-{ids[-1].as_py()}.parquet")
+        _gravar(parte, caminho)
+        arquivos.append(caminho)
+    return arquivos
+
+def compactar_particao(symbol, data, raiz=DIRETORIO_ARQUIVO):
+    """Junta as partes de um dia num único arquivo ordenado por id, sem repetidos."""
+    diretorio = diretorio_particao(symbol, data, raiz)
+    partes = sorted(glob.glob(os.path.join(diretorio, "*.parquet")))
+    if len(partes) <= 1:
+        return len(partes)
+    tabela = pa.concat_tables([pq.read_table(parte, memory_map=True) for parte in partes]).sort_by('id')
+    ids = tabela.column('id').to_numpy()
+    unicos = np.ones(len(ids), dtype=bool)
+    unicos[1:] = ids[1:] != ids[:-1]
+    tabela = tabela.filter(pa.array(unicos))
+    caminho = os.path.join(diretorio, f"part-{ids[0]}-{ids[-1]}.parquet")
+    # Primeiro o arquivo compactado no nome final (via .tmp, fora do glob), depois
+    # as partes antigas: se o processo morrer no meio, sobram só trades repetidos,
+    # que a leitura descarta e a próxima compactação remove
+    _gravar(tabela, caminho)
+    for parte in partes:
+        if parte != caminho:
+            os.remove(parte)
+    logging.info(f"{symbol} {data}: {len(partes)} partes compactadas, {tabela.num_rows} trades")
+    return 1
+
+def _lado_venda(coluna):
+    # Converte a coluna de dicionário em is_buyer_maker sem criar strings
+    resultado = []
+    for pedaco in coluna.chunks:
+        indice_venda = pedaco.dictionary.index("venda").as_py()
+        resultado.append(pedaco.indices.to_numpy(zero_copy_only=False) == indice_venda)
+    return np.concatenate(resultado) if resultado else np.array([], dtype=bool)
+
+def ler_intervalo(symbol, inicio_ms, fim_ms, raiz=DIRETORIO_ARQUIVO):
+    """Lê os trades de um símbolo entre inicio_ms e fim_ms.
+
+    Os arquivos são abertos com memory_map e só as partições dos dias do
+    intervalo são lidas. Retorna um dicionário de arrays NumPy ordenados por id,
+    sem ids repetidos (partes ainda não compactadas podem se sobrepor), com as
+    mesmas chaves de trade_schema.decodificar_trades.
+    """
+    tabelas = []
+    for dia in range(inicio_ms // DIA_MS, fim_ms // DIA_MS + 1):
+        for caminho in sorted(glob.glob(os.path.join(diretorio_particao(symbol, _data(dia), raiz), "*.parquet"))):
+            tabelas.append(pq.read_table(
+                caminho, memory_map=True,
+                filters=[('time', '>=', inicio_ms), ('time', '<=', fim_ms)],
+            ))
+    if not tabelas:
+        tabela = SCHEMA.empty_table()
+    else:
+        tabela = pa.concat_tables(tabelas).sort_by('id')
+        ids = tabela.column('id').to_numpy()
+        if len(ids) > 1 and (ids[1:] == ids[:-1]).any():
+            unicos = np.ones(len(ids), dtype=bool)
+            unicos[1:] = ids[1:] != ids[:-1]
+            tabela = tabela.filter(pa.array(unicos))
+    return {
+        'id': tabela.column('id').to_numpy(),
+        'time': tabela.column('time').to_numpy(),
+        'price': tabela.column('price').to_numpy(),
+        'qty': tabela.column('qty').to_numpy(),
+        'is_buyer_maker': _lado_venda(tabela.column('lado')),
+    }
+
+# ----- Origens -----
+
+def _dia_ms(data):
+    inicio = int(datetime.strptime(data, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return inicio, inicio + DIA_MS - 1
+
+def colunas_sqlite(conn, symbol, inicio_ms, fim_ms):
+    """Lê do banco SQLite (database_config) as colunas de um intervalo."""
+    linhas = conn.execute("""
+        SELECT COALESCE(trade_id, id), time, price, qty, is_buyer_maker FROM trades
+        WHERE symbol = ? AND time >= ? AND time <= ?
+        ORDER BY time
+    """, (symbol, inicio_ms, fim_ms)).fetchall()
+    colunas = np.array(linhas, dtype=np.float64).reshape(-1, 5)
+    return {
+        'id': colunas[:, 0].astype(np.int64),
+        'time': colunas[:, 1].astype(np.int64),
+        'price': colunas[:, 2],
+        'qty': colunas[:, 3],
+        'is_buyer_maker': colunas[:, 4].astype(bool),
+    }
+
+def arquivar_dia(origem, symbol, data, raiz=DIRETORIO_ARQUIVO, db="trades.db"):
+    """Copia um dia de trades do SQLite ou do DynamoDB para o arquivo e compacta a partição."""
+    inicio_ms, fim_ms = _dia_ms(data)
+    if origem == "sqlite":
+        from database_config import create_connection
+        conn = create_connection(db)
+        try:
+            colunas = colunas_sqlite(conn, symbol, inicio_ms, fim_ms)
+        finally:
+            conn.close()
+    else:
+        from dynamodb_config import dynamodb_client, table_name
+        from trade_schema import ler_intervalo as ler_dynamodb
+        colunas = ler_dynamodb(dynamodb_client, table_name, symbol, inicio_ms, fim_ms)
+    arquivar(symbol, colunas, raiz)
+    compactar_particao(symbol, data, raiz)
+    logging.info(f"{symbol} {data}: {len(colunas['id'])} trades arquivados de {origem}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arquiva trades em Parquet particionado por símbolo e data.")
+    parser.add_argument("origem", choices=["sqlite", "dynamodb"])
+    parser.add_argument("--symbol", required=True)
+    parser.add_argument("--data", nargs="+", required=True, help="dias a arquivar (YYYY-MM-DD, UTC)")
+    parser.add_argument("--raiz", default=DIRETORIO_ARQUIVO, help="diretório do arquivo")
+    parser.add_argument("--db", default="trades.db", help="banco SQLite (origem sqlite)")
+    args = parser.parse_args()
+    for data in args.data:
+        arquivar_dia(args.origem, args.symbol, data, args.raiz, args.db)
@@ -1,11 +1,14 @@
-import ccxt.async_support as ccxt
 import asyncio
-import pandas as pd
-import time
-import telebot
 import logging
+import time
 from os import getenv
 import dotenv
+from notificador import notificador_compartilhado
+from ath_index import IndiceATH
+from exchange_pool import get_exchange, close_exchange
+from market_snapshot import fonte_compartilhada
+from agendador import Agendador
+import metricas
 from datetime import datetime, timedelta
 
 # Configurações de logging
@@ -15,88 +18,99 @@ logging.basicConfig(level=logging.INFO)
 dotenv.load_dotenv()
 CHAVE_API = getenv("CHAVE_API")
 CHANNEL_ID = getenv("CHANNEL_ID")
-bot = telebot.TeleBot(CHAVE_API, parse_mode=None)
+notificador = notificador_compartilhado(CHAVE_API)
+snapshots = fonte_compartilhada(get_exchange)
+IDADE_TICKERS = 5  # Tickers buscados depois do fechamento do candle que disparou a rodada
 
 # Função para enviar mensagem para o Telegram de forma assíncrona
 async def send_telegram_message(message, chat_id=CHANNEL_ID):
-    try:
-        bot.send_message(chat_id, message)
-        logging.info(f"Mensagem enviada: {message}")
-    except Exception as e:
-        logging.error(f"Erro ao enviar mensagem: {e}")
-
-# Função para obter dados da Binance de forma assíncrona
-async def get_binance_data(binance, symbol):
-    ticker = await binance.fetch_ticker(symbol)
-    return ticker
+    # Apenas enfileira; o envio acontece em segundo plano sem travar o monitoramento
+    notificador.enviar(message, [chat_id])
+    logging.debug(f"Mensagem enfileirada para o chat {chat_id}")
 
 # Função para filtrar símbolos por volume diário
-async def filter_symbols_by_daily_volume(binance, min_volume):
+async def filter_symbols_by_daily_volume(min_volume):
     logging.info(f"Filtrando símbolos com volume diário maior que {min_volume}")
-    tickers = await binance.fetch_tickers()
-    stablecoins = ["USDT", "BUSD", "USDC", "FDUSD", "TUSD", "DAI"]
-    symbols = [
-        symbol for symbol, ticker in tickers.items()
-        if ticker['quoteVolume'] > min_volume 
-        and symbol.endswith('/USDT')
-        and not any(stablecoin + '/USDT' == symbol for stablecoin in stablecoins)
-    ]
-    logging.info(f"Símbolos filtrados: {symbols}")
-    return symbols
+    # Pares /USDT sem stablecoins, já indexados por volume no snapshot compartilhado
+    snapshot = await snapshots.obter(max_idade=IDADE_TICKERS)
+    filtrados = {symbol: snapshot[symbol] for symbol in snapshot.acima_de(min_volume, usdt=True)}
+    logging.debug(f"Símbolos filtrados: {list(filtrados)}")
+    return filtrados
 
-# Função principal para monitorar o ATH
-async def monitor_ath():
+# Uma rodada de monitoramento do ATH
+async def rodada_ath(indice):
     min_daily_volume = 4_000_000  # Volume diário mínimo de 4 milhões de USDT (PEPE 4,5M)
-    binance = ccxt.binance()
-    
-    while True:
-        logging.info("Iniciando nova rodada de monitoramento de ATH")
-        symbols = await filter_symbols_by_daily_volume(binance, min_daily_volume)
-        
-        near_ath_symbols = []
-        passed_ath_symbols = []
-        
-        for symbol in symbols:
-            try:
-                ticker = await get_binance_data(binance, symbol)
-                current_price = ticker['last']
-                ath_price = ticker['high']
-                
-                # Considerando que o ATH é o maior valor histórico registrado
-                if current_price >= 0.98 * ath_price:
-                    now = datetime.now()
-                    ath_time = datetime.fromtimestamp(ticker['timestamp'] / 1000)
-                    
-                    if current_price > ath_price and (now - ath_time) < timedelta(hours=1):
-                        passed_ath_symbols.append(
-                            f"{symbol} acabou de ultrapassar o ATH!\n"
-                            f"ATH anterior: {ath_price:.8f} USDT\n"
-                            f"Preço atual: {current_price:.8f} USDT"
-                        )
-                    else:
-                        near_ath_symbols.append(
-                            f"{symbol} está a 2% ou menos de atingir o ATH!\n"
-                            f"ATH anterior: {ath_price:.8f} USDT\n"
-                            f"Preço atual: {current_price:.8f} USDT"
-                        )
-                
-            except Exception as e:
-                logging.error(f"Erro ao processar {symbol}: {e}")
-        
-        # Enviar mensagens consolidadas
-        if passed_ath_symbols:
-            passed_message = "Criptomoedas que ultrapassaram o ATH nos últimos 60 minutos:\n" + "\n\n".join(passed_ath_symbols)
-            await send_telegram_message(passed_message)
-        
-        if near_ath_symbols:
-            near_message = "Criptomoedas próximas de atingir o ATH:\n" + "\n\n".join(near_ath_symbols)
-            await send_telegram_message(near_message)
-        
-        # Aguardar 5 minutos antes da próxima verificação
-        logging.info("Aguardando 5 minutos para a próxima rodada de verificação")
-        await asyncio.sleep(300)
+    binance = await get_exchange()
+    inicio = time.monotonic()
+    logging.info("Iniciando nova rodada de monitoramento de ATH")
+    # Uma única chamada por rodada: os tickers trazem preço e máxima de 24h de todos os símbolos
+    tickers = await filter_symbols_by_daily_volume(min_daily_volume)
+
+    # Símbolos novos (ou desatualizados) têm o ATH calculado em segundo plano
+    indice.agendar_backfill(binance, tickers)
+    pendentes = set(indice.faltando(tickers))
+    anteriores = {symbol: indice.get(symbol)['ath'] for symbol in tickers if symbol not in pendentes}
+    indice.atualizar_com_tickers(tickers)
+    indice.salvar()
+
+    near_ath_symbols = []
+    passed_ath_symbols = []
+    now = datetime.now()
+
+    for symbol, ath_price in anteriores.items():
+        current_price = tickers[symbol]['last']
+        if not current_price:
+            continue
+        entrada = indice.get(symbol)
+
+        # Rompimento registrado na última hora: avisa com o ATH de antes do rompimento
+        rompido_em = entrada.get('rompido_em')
+        if rompido_em and (now - datetime.fromtimestamp(rompido_em / 1000)) < timedelta(hours=1):
+            passed_ath_symbols.append(
+                f"{symbol} acabou de ultrapassar o ATH!\n"
+                f"ATH anterior: {entrada['ath_anterior']:.8f} USDT\n"
+                f"Preço atual: {current_price:.8f} USDT"
+            )
+        elif current_price >= 0.98 * ath_price:
+            near_ath_symbols.append(
+                f"{symbol} está a 2% ou menos de atingir o ATH!\n"
+                f"ATH anterior: {ath_price:.8f} USDT\n"
+                f"Preço atual: {current_price:.8f} USDT"
+            )
+
+    metricas.registrar_ciclo("ath", len(tickers), time.monotonic() - inicio,
+                             len(passed_ath_symbols) + len(near_ath_symbols))
+
+    # Enviar mensagens consolidadas
+    if passed_ath_symbols:
+        passed_message = "Criptomoedas que ultrapassaram o ATH nos últimos 60 minutos:\n" + "\n\n".join(passed_ath_symbols)
+        await send_telegram_message(passed_message)
+
+    if near_ath_symbols:
+        near_message = "Criptomoedas próximas de atingir o ATH:\n" + "\n\n".join(near_ath_symbols)
+        await send_telegram_message(near_message)
+
+# Função principal para monitorar o ATH: uma rodada logo após o fechamento de cada candle de 5 minutos
+async def monitor_ath():
+    indice = IndiceATH.carregar()
+    agendador = Agendador()
+    agendador.adicionar("ath", lambda: rodada_ath(indice), "5m")
+    try:
+        await agendador.executar()
+    finally:
+        indice.salvar()
+
+async def main():
+    await metricas.servir()
+    try:
+        await monitor_ath()
+    finally:
+        await metricas.encerrar()
+        await snapshots.encerrar()
+        await close_exchange()
+        await notificador.encerrar()
 
 if __name__ == "__main__":
     # Iniciar o monitoramento de ATH de forma assíncrona
     logging.info("Iniciando o monitoramento de ATH")
-    asyncio.run(monitor_ath())
+    asyncio.run(main())
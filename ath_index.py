@@ -0,0 +1,136 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from os import getenv
+
+# Índice persistente de máximas históricas (ATH) por símbolo.
+#
+# O ATH de cada símbolo é calculado uma vez a partir dos candles mensais de
+# todo o histórico; o mês da máxima é então lido em candles diários para saber
+# o dia exato. Depois disso o índice só é atualizado com o lote de tickers de
+# cada rodada (a máxima de 24h do ticker), sem requisições por símbolo.
+# Símbolos novos entram por um backfill em segundo plano; símbolos que ficaram
+# mais de um dia sem atualização (processo parado) são recalculados, já que a
+# máxima de 24h não cobre o período em que o monitor não rodou.
+
+ARQUIVO_INDICE = getenv("ATH_INDEX_FILE", "ath_index.json")
+CONCORRENCIA_BACKFILL = 4
+DIA_MS = 24 * 60 * 60 * 1000
+
+class IndiceATH:
+    """ATH, momento do ATH e último rompimento de cada símbolo, salvo em JSON."""
+
+    def __init__(self, caminho=ARQUIVO_INDICE):
+        self.caminho = caminho
+        self.simbolos = {}  # symbol -> {'ath', 'ath_ts', 'ath_anterior', 'rompido_em', 'atualizado'}
+        self.alterado = False
+        self.tarefa_backfill = None
+
+    @classmethod
+    def carregar(cls, caminho=ARQUIVO_INDICE):
+        indice = cls(caminho)
+        try:
+            with open(caminho) as arquivo:
+                indice.simbolos = json.load(arquivo)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            logging.error(f"Índice de ATH inválido, recomeçando: {e}")
+        return indice
+
+    def salvar(self):
+        # Grava num arquivo temporário e troca, para nunca deixar o índice pela metade
+        if not self.alterado:
+            return
+        os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+        temporario = self.caminho + ".tmp"
+        with open(temporario, "w") as arquivo:
+            json.dump(self.simbolos, arquivo)
+        os.replace(temporario, self.caminho)
+        self.alterado = False
+
+    def get(self, symbol):
+        return self.simbolos.get(symbol)
+
+    def faltando(self, symbols, agora_ms=None):
+        """Símbolos sem ATH no índice ou sem atualização há mais de um dia."""
+        limite = (agora_ms or int(time.time() * 1000)) - DIA_MS
+        return [
+            symbol for symbol in symbols
+            if symbol not in self.simbolos or self.simbolos[symbol].get('atualizado', 0) < limite
+        ]
+
+    def atualizar_com_tickers(self, tickers):
+        """Atualiza os ATHs com a máxima de 24h dos tickers. Retorna os símbolos que romperam o ATH.
+
+        Símbolos ausentes ou desatualizados ficam de fora até o backfill recalculá-los.
+        """
+        rompidos = []
+        desatualizados = set(self.faltando(tickers))
+        for symbol, ticker in tickers.items():
+            if symbol in desatualizados:
+                continue
+            entrada = self.simbolos[symbol]
+            agora = ticker.get('timestamp') or int(time.time() * 1000)
+            entrada['atualizado'] = agora
+            self.alterado = True
+            maxima = max(ticker.get('high') or 0, ticker.get('last') or 0)
+            if maxima <= entrada['ath']:
+                continue
+            # Só guarda o ATH anterior no primeiro rompimento; altas seguidas mantêm a referência
+            if entrada.get('rompido_em') is None or agora - entrada['rompido_em'] > DIA_MS:
+                entrada['ath_anterior'] = entrada['ath']
+            entrada['ath'] = maxima
+            entrada['ath_ts'] = agora
+            entrada['rompido_em'] = agora
+            rompidos.append(symbol)
+        return rompidos
+
+    async def construir_simbolo(self, exchange, symbol):
+        """Calcula o ATH de um símbolo pelos candles mensais e diários."""
+        mensais = await exchange.fetch_ohlcv(symbol, '1M', since=0, limit=1000)
+        if not mensais:
+            return None
+        mes = max(mensais, key=lambda candle: candle[2])
+        ath, ath_ts = mes[2], mes[0]
+        # Candles diários do mês da máxima, para saber o dia do ATH
+        diarios = await exchange.fetch_ohlcv(symbol, '1d', since=mes[0], limit=31)
+        if diarios:
+            dia = max(diarios, key=lambda candle: candle[2])
+            ath, ath_ts = max(ath, dia[2]), dia[0]
+        anterior = self.simbolos.get(symbol, {})
+        self.simbolos[symbol] = {
+            'ath': ath,
+            'ath_ts': ath_ts,
+            'ath_anterior': anterior.get('ath_anterior'),
+            'rompido_em': anterior.get('rompido_em'),
+            'atualizado': int(time.time() * 1000),
+        }
+        self.alterado = True
+        return ath
+
+    async def backfill(self, exchange, symbols, concorrencia=CONCORRENCIA_BACKFILL):
+        semaforo = asyncio.Semaphore(concorrencia)
+
+        async def construir(symbol):
+            async with semaforo:
+                try:
+                    await self.construir_simbolo(exchange, symbol)
+                except Exception as e:
+                    logging.error(f"Erro ao calcular o ATH de {symbol}: {e}")
+
+        inicio = time.monotonic()
+        await asyncio.gather(*(construir(symbol) for symbol in symbols))
+        self.salvar()
+        logging.info(f"ATH calculado para {len(symbols)} símbolos em {time.monotonic() - inicio:.1f}s")
+
+    def agendar_backfill(self, exchange, symbols):
+        """Inicia em segundo plano o backfill dos símbolos ainda sem ATH (um por vez)."""
+        faltando = self.faltando(symbols)
+        if not faltando or (self.tarefa_backfill and not self.tarefa_backfill.done()):
+            return None
+        logging.info(f"Calculando o ATH de {len(faltando)} símbolos novos em segundo plano")
+        self.tarefa_backfill = asyncio.create_task(self.backfill(exchange, faltando))
+        return self.tarefa_backfill
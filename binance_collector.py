@@ -1,35 +1,240 @@
-from binance.client import Client
-from binance.websockets import BinanceSocketManager
-from datetime import datetime
+import asyncio
+import json
+import logging
+import queue
+import random
+import time
+import weakref
+from os import getenv
+import aiohttp
+import dotenv
+import metricas
 from dynamodb_config import save_trade_data
+from trade_schema import AgrupadorTrades, MINUTO_MS
+from limitador_binance import limitador, peso_endpoint
 
-# Inicialize o cliente da Binance
-api_key = "YOUR_BINANCE_API_KEY"
-api_secret = "YOUR_BINANCE_API_SECRET"
-client = Client(api_key, api_secret)
-
-# Função para processar os dados de trade
-def process_message(msg):
-    if msg['e'] == 'trade':
-        # Extraia os dados relevantes do trade
-        trade_data = {
-            'pair': msg['s'],  # Par de moedas
-            'trade_id': str(msg['t']),
-            'timestamp': str(datetime.fromtimestamp(msg['T'] / 1000.0)),
-            'buyer_is_maker': msg['m'],
-            'quantity': float(msg['q']),
-            'price': float(msg['p'])
+# Configurações de logging
+logging.basicConfig(level=logging.INFO)
+
+# Configurações da coleta
+dotenv.load_dotenv()
+BINANCE_API_KEY = getenv("BINANCE_API_KEY")
+WS_URL = getenv("BINANCE_WS_URL", "wss://stream.binance.com:9443")
+BASE_URL = getenv("BINANCE_REST_URL", "https://api.binance.com")
+SYMBOLS = [s.strip().lower() for s in getenv("COLLECTOR_SYMBOLS", "btcusdt").split(",") if s.strip()]
+TIPO_STREAM = getenv("COLLECTOR_STREAM", "trade")  # "trade" ou "aggTrade"
+STREAMS_POR_CONEXAO = 200    # A Binance aceita até 1024 streams por conexão
+TAMANHO_FILA = 50_000        # Trades aguardando gravação
+POLITICA_FILA = getenv("COLLECTOR_POLITICA_FILA", "bloquear")  # "bloquear" ou "descartar"
+INTERVALO_METRICAS = 30      # Segundos entre os logs de métricas
+GRANULARIDADE_MS = int(getenv("COLLECTOR_BUCKET_MS", MINUTO_MS))  # Trades por item: por minuto ou por segundo
+
+# Campo com o id sequencial de cada tipo de stream
+CAMPO_ID = {'trade': 't', 'aggTrade': 'a'}
+
+# Converte a mensagem do stream para o formato de /historicalTrades
+def converter_trade(msg):
+    return {
+        'symbol': msg['s'],  # Par de moedas
+        'id': msg[CAMPO_ID[msg['e']]],
+        'time': msg['T'],
+        'price': msg['p'],
+        'qty': msg['q'],
+        'isBuyerMaker': msg['m'],
+    }
+
+_coletores = weakref.WeakSet()  # Instâncias vivas, lidas na coleta das métricas
+
+class ColetorTrades:
+    """Recebe trades de vários símbolos por streams combinados e os grava.
+
+    Os símbolos são divididos em algumas conexões WebSocket. As mensagens vão
+    para uma fila limitada: com a política "bloquear", a leitura do socket
+    espera quando a fila enche (a pressão volta para o TCP); com "descartar",
+    o trade mais antigo da fila é descartado e contado. A cada mensagem o id
+    sequencial do símbolo é conferido; quando há um buraco (inclusive depois
+    de uma reconexão) os trades que faltam são buscados pela API REST.
+    """
+
+    def __init__(self, symbols, tipo_stream=TIPO_STREAM, ws_url=WS_URL, base_url=BASE_URL,
+                 tamanho_fila=TAMANHO_FILA, politica=POLITICA_FILA, gravar=save_trade_data,
+                 granularidade_ms=GRANULARIDADE_MS):
+        self.symbols = symbols
+        self.tipo_stream = tipo_stream
+        self.ws_url = ws_url
+        self.base_url = base_url
+        self.politica = politica
+        self.gravar = gravar
+        self.fila = asyncio.Queue(maxsize=tamanho_fila)
+        self.agrupador = AgrupadorTrades(granularidade_ms)
+        self.ultimo_id = {}  # símbolo -> último id sequencial recebido
+        self.recuperacoes = set()  # Tarefas de recuperação de buracos em andamento
+        self.session = None
+        self.metricas = {
+            'recebidas': 0,
+            'gravadas': 0,
+            'descartadas': 0,
+            'buracos': 0,
+            'recuperadas': 0,
+            'reconexoes': 0,
+            'erros_gravacao': 0,
+            'atraso_ms': 0,
+            'atraso_max_ms': 0,
         }
+        _coletores.add(self)
+
+    async def executar(self):
+        await metricas.servir()
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        grupos = [self.symbols[i:i + STREAMS_POR_CONEXAO] for i in range(0, len(self.symbols), STREAMS_POR_CONEXAO)]
+        tarefas = [asyncio.create_task(self._conexao(grupo)) for grupo in grupos]
+        tarefas.append(asyncio.create_task(self._gravador()))
+        tarefas.append(asyncio.create_task(self._liberar_buckets()))
+        tarefas.append(asyncio.create_task(self._reportar_metricas()))
+        logging.info(f"Coletando {self.tipo_stream} de {len(self.symbols)} símbolos em {len(grupos)} conexões")
+        try:
+            await asyncio.gather(*tarefas)
+        finally:
+            pendentes = tarefas + list(self.recuperacoes)
+            for tarefa in pendentes:
+                tarefa.cancel()
+            await asyncio.gather(*pendentes, return_exceptions=True)
+            # Trades ainda na fila vão para os buckets, e os buckets abertos são gravados antes de sair
+            while not self.fila.empty():
+                trade = self.fila.get_nowait()
+                self.agrupador.adicionar(trade['symbol'], trade)
+                self.fila.task_done()
+            await self._gravar_itens(self.agrupador.fechar_vencidos(0, todos=True))
+            await self.session.close()
+            await metricas.encerrar()
+
+    # ----- Recepção -----
+
+    async def _conexao(self, symbols):
+        streams = "/".join(f"{symbol}@{self.tipo_stream}" for symbol in symbols)
+        url = f"{self.ws_url}/stream?streams={streams}"
+        tentativa = 0
+        while True:
+            try:
+                async with self.session.ws_connect(url, heartbeat=60) as ws:
+                    tentativa = 0
+                    async for mensagem in ws:
+                        if mensagem.type != aiohttp.WSMsgType.TEXT:
+                            break
+                        await self._processar(json.loads(mensagem.data)['data'])
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+                logging.error(f"Erro na conexão WebSocket: {e}")
+            # Reconecta com espera exponencial e um pouco de aleatoriedade
+            tentativa += 1
+            self.metricas['reconexoes'] += 1
+            espera = min(2 ** tentativa, 60) * (0.5 + random.random() / 2)
+            logging.warning(f"Conexão WebSocket encerrada, reconectando em {espera:.1f}s")
+            await asyncio.sleep(espera)
+
+    async def _processar(self, msg):
+        self.metricas['recebidas'] += 1
+        atraso = int(time.time() * 1000) - msg['E']
+        self.metricas['atraso_ms'] = atraso
+        self.metricas['atraso_max_ms'] = max(self.metricas['atraso_max_ms'], atraso)
+
+        symbol = msg['s']
+        trade_id = msg[CAMPO_ID[msg['e']]]
+        anterior = self.ultimo_id.get(symbol)
+        if anterior is not None and trade_id <= anterior:
+            return  # Repetido (ex.: já recuperado pela API REST)
+        if anterior is not None and trade_id > anterior + 1:
+            self.metricas['buracos'] += 1
+            # A referência fica no conjunto até o fim: sem ela a tarefa pode ser coletada no meio
+            tarefa = asyncio.create_task(self._recuperar(symbol, anterior + 1, trade_id - 1))
+            self.recuperacoes.add(tarefa)
+            tarefa.add_done_callback(self.recuperacoes.discard)
+        self.ultimo_id[symbol] = trade_id
+        await self._enfileirar(converter_trade(msg))
+
+    async def _enfileirar(self, trade):
+        if self.politica == "descartar" and self.fila.full():
+            self.fila.get_nowait()
+            self.fila.task_done()
+            self.metricas['descartadas'] += 1
+        await self.fila.put(trade)
+
+    async def _recuperar(self, symbol, primeiro_id, ultimo_id):
+        """Busca pela API REST os trades perdidos entre dois ids do stream."""
+        if self.tipo_stream == 'aggTrade':
+            endpoint, headers = "/api/v3/aggTrades", {}
+        else:
+            endpoint, headers = "/api/v3/historicalTrades", {"X-MBX-APIKEY": BINANCE_API_KEY or ""}
+        from_id = primeiro_id
+        try:
+            while from_id <= ultimo_id:
+                params = {"symbol": symbol, "fromId": from_id, "limit": min(1000, ultimo_id - from_id + 1)}
+                await limitador.adquirir_async(peso_endpoint(endpoint))
+                async with self.session.get(f"{self.base_url}{endpoint}", params=params, headers=headers) as resposta:
+                    limitador.registrar_resposta(resposta.status, resposta.headers)
+                    resposta.raise_for_status()
+                    lote = await resposta.json()
+                if not lote:
+                    break
+                for item in lote:
+                    msg = self._rest_para_stream(symbol, item)
+                    if msg[CAMPO_ID[msg['e']]] <= ultimo_id:
+                        await self._enfileirar(converter_trade(msg))
+                        self.metricas['recuperadas'] += 1
+                from_id = lote[-1]['a' if self.tipo_stream == 'aggTrade' else 'id'] + 1
+            logging.info(f"Buraco de {symbol} recuperado: ids {primeiro_id}..{ultimo_id}")
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            logging.error(f"Erro ao recuperar buraco de {symbol} ({primeiro_id}..{ultimo_id}): {e}")
+
+    def _rest_para_stream(self, symbol, item):
+        # Converte a resposta REST para o mesmo formato das mensagens do stream
+        if self.tipo_stream == 'aggTrade':
+            return {'e': 'aggTrade', 's': symbol, 'a': item['a'], 'T': item['T'],
+                    'm': item['m'], 'q': item['q'], 'p': item['p']}
+        return {'e': 'trade', 's': symbol, 't': item['id'], 'T': item['time'],
+                'm': item['isBuyerMaker'], 'q': item['qty'], 'p': item['price']}
+
+    # ----- Gravação -----
+
+    async def _gravador(self):
+        # Agrupa os trades por (símbolo, bucket); o item só é gravado quando o bucket fecha
+        while True:
+            trade = await self.fila.get()
+            self.agrupador.adicionar(trade['symbol'], trade)
+            self.fila.task_done()
+
+    async def _liberar_buckets(self):
+        while True:
+            await asyncio.sleep(1)
+            await self._gravar_itens(self.agrupador.fechar_vencidos(int(time.time() * 1000)))
+
+    async def _gravar_itens(self, itens):
+        for item in itens:
+            try:
+                # save_trade_data só enfileira no escritor em lote; se a fila dele encher, espera aqui
+                while True:
+                    try:
+                        self.gravar(item, bloquear=False)
+                        break
+                    except queue.Full:
+                        await asyncio.sleep(0.05)
+                self.metricas['gravadas'] += item['n']
+            except Exception as e:
+                self.metricas['erros_gravacao'] += 1
+                logging.error(f"Erro ao gravar bloco {item['pk']}: {e}")
+
+    async def _reportar_metricas(self):
+        while True:
+            await asyncio.sleep(INTERVALO_METRICAS)
+            logging.info(f"Coletor: fila={self.fila.qsize()} {self.metricas}")
 
-        # Salve os dados no DynamoDB
-        save_trade_data(trade_data)
+# ----- Métricas -----
 
-# Inicialize o gerenciador de WebSocket da Binance
-bsm = BinanceSocketManager(client)
+EVENTOS = ('recebidas', 'gravadas', 'descartadas', 'buracos', 'recuperadas', 'reconexoes', 'erros_gravacao')
 
-# Inicialize o socket para o par de moedas desejado
-symbol = 'btcusdt'
-bsm.start_trade_socket(symbol, process_message)
+metricas.coletada("coletor_trades_total", "Trades recebidos, gravados, descartados e recuperados", "counter", ("evento",),
+                  lambda: [((evento,), sum(coletor.metricas[evento] for coletor in list(_coletores))) for evento in EVENTOS])
+metricas.coletada("coletor_fila", "Trades aguardando o agrupamento", "gauge", (),
+                  lambda: [((), sum(coletor.fila.qsize() for coletor in list(_coletores)))])
 
-# Inicie o loop
-bsm.start()
+if __name__ == "__main__":
+    asyncio.run(ColetorTrades(SYMBOLS).executar())
@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import random
+import time
+from os import getenv
+from urllib.parse import urlencode
+import aiohttp
+import dotenv
+import metricas
+from limitador_binance import latencia_rest, limitador, nome_endpoint, peso_endpoint
+
+# Cliente REST assíncrono para as chamadas diretas à API da Binance.
+#
+# Uma única sessão aiohttp por processo mantém as conexões TLS abertas
+# (keep-alive), então cada página de uma paginação custa uma ida e volta numa
+# conexão já aquecida. As respostas vêm comprimidas (gzip/deflate), cada
+# requisição passa pelo limitador global de peso e falhas temporárias (rede,
+# timeout, 5xx, 429) são repetidas com espera exponencial. Endpoints
+# assinados recebem timestamp e assinatura HMAC-SHA256 da chave secreta.
+
+dotenv.load_dotenv()
+BASE_URL = getenv("BINANCE_REST_URL", "https://api.binance.com")
+BINANCE_API_KEY = getenv("BINANCE_API_KEY")
+BINANCE_SECRET_KEY = getenv("BINANCE_SECRET_KEY")
+
+POOL_CONEXOES = 16
+KEEPALIVE_SEGUNDOS = 60
+TIMEOUT_SEGUNDOS = 10
+MAX_TENTATIVAS = 4
+RECV_WINDOW = 5000
+
+class ErroBinance(Exception):
+    """Resposta de erro da Binance (4xx que não adianta repetir)."""
+
+    def __init__(self, status, codigo, mensagem):
+        super().__init__(f"HTTP {status} (código {codigo}): {mensagem}")
+        self.status = status
+        self.codigo = codigo
+        self.mensagem = mensagem
+
+def assinar(query_string, secret_key=None):
+    """Assinatura HMAC-SHA256 de uma query string, como a Binance exige."""
+    secret_key = secret_key or BINANCE_SECRET_KEY
+    return hmac.new(secret_key.encode(), query_string.encode(), hashlib.sha256).hexdigest()
+
+class ClienteREST:
+    """Sessão HTTP compartilhada para a API REST da Binance."""
+
+    def __init__(self, base_url=BASE_URL, api_key=BINANCE_API_KEY, secret_key=BINANCE_SECRET_KEY,
+                 pool=POOL_CONEXOES, timeout=TIMEOUT_SEGUNDOS, max_tentativas=MAX_TENTATIVAS):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.pool = pool
+        self.timeout = timeout
+        self.max_tentativas = max_tentativas
+        self.session = None
+        self.metricas = {'requisicoes': 0, 'repeticoes': 0, 'erros': 0, 'ultima_latencia': 0.0}
+
+    def _sessao(self):
+        # Criada na primeira requisição, dentro do event loop que vai usá-la
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool,
+                ttl_dns_cache=300,
+                keepalive_timeout=KEEPALIVE_SEGUNDOS,
+                enable_cleanup_closed=True,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'Accept-Encoding': 'gzip, deflate'},
+            )
+        return self.session
+
+    async def get(self, caminho, params=None, chave=False, assinado=False):
+        return await self.requisitar('GET', caminho, params, chave, assinado)
+
+    async def requisitar(self, metodo, caminho, params=None, chave=False, assinado=False):
+        """Faz a requisição e devolve o JSON da resposta.
+
+        `chave` envia o X-MBX-APIKEY (ex.: /historicalTrades); `assinado`
+        também adiciona timestamp e signature (endpoints de conta e ordens).
+        """
+        params = {chave_param: valor for chave_param, valor in (params or {}).items() if valor is not None}
+        headers = {'X-MBX-APIKEY': self.api_key or ''} if chave or assinado else {}
+        peso = peso_endpoint(caminho, params)
+        endpoint = nome_endpoint(caminho)
+        url = f"{self.base_url}{caminho}"
+
+        for tentativa in range(self.max_tentativas):
+            await limitador.adquirir_async(peso)
+            if assinado:
+                # Timestamp e assinatura são refeitos a cada tentativa
+                texto = urlencode({**params, 'timestamp': int(time.time() * 1000), 'recvWindow': RECV_WINDOW})
+                url_final, query = f"{url}?{texto}&signature={assinar(texto, self.secret_key)}", None
+            else:
+                url_final, query = url, params
+            inicio = time.monotonic()
+            try:
+                async with self._sessao().request(metodo, url_final, params=query, headers=headers) as resposta:
+                    limitador.registrar_resposta(resposta.status, resposta.headers)
+                    corpo = await resposta.read()
+                    self.metricas['requisicoes'] += 1
+                    self.metricas['ultima_latencia'] = time.monotonic() - inicio
+                    latencia_rest.observar(self.metricas['ultima_latencia'], endpoint=endpoint)
+                    if resposta.status < 400:
+                        return json.loads(corpo)
+                    if resposta.status < 500 and resposta.status not in (418, 429):
+                        erro = json.loads(corpo) if corpo.startswith(b'{') else {}
+                        self.metricas['erros'] += 1
+                        raise ErroBinance(resposta.status, erro.get('code'), erro.get('msg', corpo[:200]))
+                    motivo = f"HTTP {resposta.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                motivo = str(e) or type(e).__name__
+            if tentativa + 1 == self.max_tentativas:
+                self.metricas['erros'] += 1
+                raise ErroBinance(0, None, f"{metodo} {caminho} falhou após {self.max_tentativas} tentativas: {motivo}")
+            self.metricas['repeticoes'] += 1
+            repeticoes.inc(endpoint=endpoint)
+            espera = random.uniform(0, min(0.25 * 2 ** tentativa, 5))
+            logging.warning(f"{metodo} {caminho}: {motivo}; repetindo em {espera:.2f}s")
+            await asyncio.sleep(espera)
+
+    async def tempo_servidor(self):
+        """Horário do servidor da Binance, em ms (peso 1)."""
+        return (await self.get("/api/v3/time"))['serverTime']
+
+    async def fechar(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+# Cliente compartilhado pelos módulos do processo
+cliente = ClienteREST()
+
+repeticoes = metricas.contador("binance_rest_repeticoes_total", "Requisições REST repetidas (rede, 5xx, 429)", ("endpoint",))
+metricas.coletada("binance_rest_cliente_total", "Contadores do cliente REST do processo", "counter", ("evento",),
+                  lambda: [((evento,), cliente.metricas[evento]) for evento in ('requisicoes', 'repeticoes', 'erros')])
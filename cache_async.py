@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+import weakref
+from cachetools import TTLCache
+import metricas
+
+# Camada assíncrona sobre o TTLCache.
+#
+# `obter(chave, buscar)` devolve o valor em cache ou chama `buscar()` (uma
+# função async sem argumentos). Pedidos simultâneos da mesma chave esperam a
+# mesma busca. Depois do `ttl` a entrada fica obsoleta por mais `ttl_obsoleto`
+# segundos: quem pede recebe o valor antigo na hora e a atualização roda em
+# segundo plano. Erros das exceções em `excecoes_negativas` (ex.: símbolo
+# inválido) e resultados None ficam em cache por `ttl_negativo` segundos, para
+# não irem à exchange a cada pedido repetido.
+
+_caches = weakref.WeakSet()  # Instâncias vivas, lidas na coleta das métricas
+
+class CacheAssincrono:
+    """TTLCache com deduplicação de buscas, stale-while-revalidate e cache negativo."""
+
+    def __init__(self, nome, maxsize, ttl, ttl_obsoleto=0, ttl_negativo=60,
+                 getsizeof=None, excecoes_negativas=()):
+        self.nome = nome
+        self.ttl = ttl
+        self.excecoes_negativas = excecoes_negativas
+        # Cada entrada é (valor, fresco_até); o TTLCache a remove ao fim do período obsoleto
+        tamanho = (lambda entrada: getsizeof(entrada[0])) if getsizeof else None
+        self.entradas = TTLCache(maxsize=maxsize, ttl=ttl + ttl_obsoleto, getsizeof=tamanho)
+        self.negativos = TTLCache(maxsize=1024, ttl=ttl_negativo)
+        self.em_andamento = {}
+        self.metricas = {
+            'hits': 0,
+            'misses': 0,
+            'coalescidos': 0,
+            'obsoletos': 0,
+            'negativos': 0,
+            'atualizacoes': 0,
+            'erros': 0,
+        }
+        _caches.add(self)
+
+    def get(self, chave, aceitar_obsoleto=False):
+        """Consulta sem buscar: o valor em cache ou None."""
+        entrada = self.entradas.get(chave)
+        if entrada is None:
+            return None
+        valor, fresco_ate = entrada
+        if aceitar_obsoleto or time.monotonic() < fresco_ate:
+            return valor
+        return None
+
+    def definir(self, chave, valor):
+        try:
+            self.entradas[chave] = (valor, time.monotonic() + self.ttl)
+        except ValueError:
+            # Valor maior que o cache inteiro: apenas não guarda
+            logging.warning(f"Valor de {chave} grande demais para o cache {self.nome}")
+
+    async def obter(self, chave, buscar):
+        if chave in self.negativos:
+            self.metricas['negativos'] += 1
+            erro = self.negativos[chave]
+            if erro is not None:
+                raise erro
+            return None
+
+        entrada = self.entradas.get(chave)
+        if entrada is not None:
+            valor, fresco_ate = entrada
+            if time.monotonic() < fresco_ate:
+                self.metricas['hits'] += 1
+            else:
+                # Obsoleto: responde já e atualiza em segundo plano
+                self.metricas['obsoletos'] += 1
+                self._iniciar(chave, buscar)
+            return valor
+
+        if chave in self.em_andamento:
+            self.metricas['coalescidos'] += 1
+        else:
+            self.metricas['misses'] += 1
+        # shield: um pedido cancelado não cancela a busca dos outros
+        return await asyncio.shield(self._iniciar(chave, buscar))
+
+    def _iniciar(self, chave, buscar):
+        tarefa = self.em_andamento.get(chave)
+        if tarefa is None:
+            tarefa = asyncio.create_task(self._buscar(chave, buscar))
+            tarefa.add_done_callback(self._concluir)
+            self.em_andamento[chave] = tarefa
+        return tarefa
+
+    async def _buscar(self, chave, buscar):
+        try:
+            valor = await buscar()
+        except self.excecoes_negativas as e:
+            self.negativos[chave] = e
+            raise
+        finally:
+            self.em_andamento.pop(chave, None)
+        if valor is None:
+            self.negativos[chave] = None
+        else:
+            self.definir(chave, valor)
+            self.metricas['atualizacoes'] += 1
+        return valor
+
+    def _concluir(self, tarefa):
+        # Marca o erro como tratado (atualizações em segundo plano não têm quem espere)
+        if not tarefa.cancelled() and tarefa.exception() is not None:
+            self.metricas['erros'] += 1
+            logging.debug(f"Erro ao atualizar o cache {self.nome}: {tarefa.exception()}")
+
+    def estatisticas(self):
+        return {'entradas': len(self.entradas), 'em_andamento': len(self.em_andamento), **self.metricas}
+
+    def taxa_acerto(self):
+        """Fração das consultas respondidas pelo cache (frescas ou obsoletas) sem esperar a exchange."""
+        servidas = self.metricas['hits'] + self.metricas['obsoletos']
+        total = servidas + self.metricas['misses'] + self.metricas['coalescidos']
+        return servidas / total if total else 0.0
+
+# ----- Métricas -----
+
+EVENTOS = ('hits', 'misses', 'coalescidos', 'obsoletos', 'negativos', 'atualizacoes', 'erros')
+
+metricas.coletada("cache_eventos_total", "Consultas e buscas dos caches assíncronos", "counter", ("cache", "evento"),
+                  lambda: [((cache.nome, evento), cache.metricas[evento]) for cache in list(_caches) for evento in EVENTOS])
+metricas.coletada("cache_taxa_acerto", "Fração das consultas respondidas pelo cache", "gauge", ("cache",),
+                  lambda: [((cache.nome,), cache.taxa_acerto()) for cache in list(_caches)])
+metricas.coletada("cache_entradas", "Entradas guardadas em cada cache", "gauge", ("cache",),
+                  lambda: [((cache.nome,), len(cache.entradas)) for cache in list(_caches)])
@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import pickle
+import random
+import subprocess
+import sys
+import time
+from os import getenv
+import ccxt.async_support as ccxt
+
+# Cache em disco dos metadados de mercado da exchange.
+#
+# load_markets baixa o exchangeInfo (alguns MB de JSON) e monta mercados e
+# moedas com milhares de deep_extend; cada processo que inicia pagava isso
+# antes da primeira chamada útil. Aqui o estado já montado do ccxt (markets,
+# markets_by_id, currencies, ...) é gravado com pickle e, no início do
+# próximo processo, copiado direto para a instância, sem rede e sem montar
+# nada de novo.
+#
+# O arquivo guarda a versão do formato, a versão do ccxt e o id da exchange;
+# se qualquer uma não bater (ex.: depois de atualizar o ccxt) ele é ignorado.
+# Depois de TTL_MERCADOS o cache continua valendo, mas a recarga em segundo
+# plano (exchange_pool) busca um novo; um processo que encontra no disco um
+# cache mais novo que o seu, salvo por outro monitor, só o lê.
+
+ARQUIVO_MERCADOS = getenv("MERCADOS_CACHE_FILE", "mercados_cache.pickle")
+TTL_MERCADOS = 3600             # Idade a partir da qual o cache é renovado em segundo plano
+IDADE_MAXIMA = 7 * 24 * 3600    # Mais velho que isso é ignorado e os mercados vêm da API
+VERSAO = 1
+
+# Atributos do ccxt preenchidos por set_markets (markets_by_id é remontado na leitura)
+ATRIBUTOS = ('markets', 'symbols', 'ids', 'currencies', 'currencies_by_id',
+             'codes', 'baseCurrencies', 'quoteCurrencies')
+
+class CacheMercados:
+    """Mercados de uma exchange persistidos em disco entre execuções."""
+
+    def __init__(self, caminho=ARQUIVO_MERCADOS, ttl=TTL_MERCADOS, idade_maxima=IDADE_MAXIMA):
+        self.caminho = caminho
+        self.ttl = ttl
+        self.idade_maxima = idade_maxima
+        self.criado_em = None  # Quando foram buscados os mercados carregados neste processo
+        self.metricas = {'acertos': 0, 'downloads': 0, 'invalidos': 0, 'tempo_carga': 0.0}
+
+    @property
+    def idade(self):
+        return time.time() - self.criado_em if self.criado_em else None
+
+    def _ler(self, exchange):
+        # Milhares de dicionários pequenos: sem o coletor de lixo a leitura cai pela metade
+        gc.disable()
+        try:
+            with open(self.caminho, 'rb') as arquivo:
+                dados = pickle.load(arquivo)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.metricas['invalidos'] += 1
+            logging.warning(f"Cache de mercados ilegível, ignorando: {e}")
+            return None
+        finally:
+            gc.enable()
+        if (dados.get('versao'), dados.get('ccxt'), dados.get('exchange')) != (VERSAO, ccxt.__version__, exchange.id):
+            self.metricas['invalidos'] += 1
+            logging.info("Cache de mercados de outra versão, ignorando")
+            return None
+        if time.time() - dados['criado_em'] > self.idade_maxima:
+            return None
+        return dados
+
+    def _aplicar(self, exchange, dados):
+        for atributo, valor in dados['estado'].items():
+            setattr(exchange, atributo, valor)
+        # Mesmo critério do set_markets: para ids repetidos, os mercados spot vêm primeiro
+        markets_by_id = {}
+        for market in sorted(exchange.markets.values(), key=lambda market: not market['spot']):
+            markets_by_id.setdefault(market['id'], []).append(market)
+        exchange.markets_by_id = markets_by_id
+        self.criado_em = dados['criado_em']
+
+    def salvar(self, exchange):
+        """Grava o estado atual dos mercados da exchange (arquivo temporário + troca)."""
+        self.criado_em = time.time()
+        dados = {
+            'versao': VERSAO,
+            'ccxt': ccxt.__version__,
+            'exchange': exchange.id,
+            'criado_em': self.criado_em,
+            'estado': {atributo: getattr(exchange, atributo) for atributo in ATRIBUTOS},
+        }
+        temporario = f"{self.caminho}.{os.getpid()}.tmp"
+        with open(temporario, 'wb') as arquivo:
+            pickle.dump(dados, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporario, self.caminho)
+
+    async def carregar(self, exchange):
+        """Carrega os mercados do disco ou, se não houver cache válido, da API (e grava o cache)."""
+        inicio = time.perf_counter()
+        dados = self._ler(exchange)
+        if dados is not None:
+            self._aplicar(exchange, dados)
+            self.metricas['acertos'] += 1
+            logging.info(f"Mercados carregados do cache: {len(exchange.markets)} símbolos, {self.idade:.0f}s de idade")
+        else:
+            await exchange.load_markets()
+            self.salvar(exchange)
+            self.metricas['downloads'] += 1
+            logging.info(f"Mercados baixados da API: {len(exchange.markets)} símbolos")
+        self.metricas['tempo_carga'] = time.perf_counter() - inicio
+
+    async def atualizar(self, exchange):
+        """Renova os mercados: lê o disco se outro processo já renovou, senão busca na API."""
+        dados = self._ler(exchange)
+        if dados is not None and dados['criado_em'] > (self.criado_em or 0) and time.time() - dados['criado_em'] < self.ttl:
+            self._aplicar(exchange, dados)
+            self.metricas['acertos'] += 1
+            return
+        await exchange.load_markets(reload=True)
+        self.salvar(exchange)
+        self.metricas['downloads'] += 1
+
+    def proxima_atualizacao(self, intervalo):
+        """Segundos até a próxima renovação; o sorteio evita todos os processos ao mesmo tempo."""
+        restante = self.ttl - (self.idade or self.ttl)
+        return max(0.0, min(intervalo, restante)) + random.uniform(0, 60)
+
+cache_mercados = CacheMercados()
+
+# ----- Benchmark de inicialização -----
+
+ENTRADAS = ('cryptobot', 'volume', 'ath', 'monitor_agression', 'monitor_agression_dynamodb')
+
+_CODIGO_MEDICAO = """
+import asyncio, time
+inicio = time.perf_counter()
+import importlib
+importlib.import_module({entrada!r})
+importado = time.perf_counter()
+from exchange_pool import get_exchange, close_exchange
+async def medir():
+    exchange = await get_exchange()
+    pronto = time.perf_counter()
+    await exchange.fetch_ticker('BTC/USDT')
+    fim = time.perf_counter()
+    await close_exchange()
+    return pronto, fim
+pronto, fim = asyncio.run(medir())
+print(f"{{importado - inicio:.3f}} {{pronto - importado:.3f}} {{fim - inicio:.3f}}")
+"""
+
+def benchmark(entradas=ENTRADAS):
+    """Tempo até a primeira requisição útil de cada monitor, com o cache frio e quente.
+
+    Cada medição roda num processo novo: importa o módulo do monitor, obtém
+    a exchange compartilhada (onde os mercados são carregados) e faz um
+    fetch_ticker. Com o cache frio o arquivo é apagado antes.
+    """
+    print(f"{'entrada':28s} {'cache':6s} {'import':>8s} {'mercados':>9s} {'1ª útil':>8s}")
+    for entrada in entradas:
+        for estado in ('frio', 'quente'):
+            if estado == 'frio' and os.path.exists(cache_mercados.caminho):
+                os.remove(cache_mercados.caminho)
+            resultado = subprocess.run(
+                [sys.executable, '-c', _CODIGO_MEDICAO.format(entrada=entrada)],
+                capture_output=True, text=True, timeout=300,
+            )
+            if resultado.returncode != 0:
+                erro = (resultado.stderr.strip().splitlines() or ['?'])[-1]
+                print(f"{entrada:28s} {estado:6s} falhou: {erro}")
+                continue
+            importado, mercados, total = resultado.stdout.split()[-3:]
+            print(f"{entrada:28s} {estado:6s} {importado:>7s}s {mercados:>8s}s {total:>7s}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cache de mercados da exchange")
+    parser.add_argument("comando", choices=("atualizar", "benchmark"))
+    parser.add_argument("--entradas", default=",".join(ENTRADAS), help="Monitores medidos pelo benchmark")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.comando == "benchmark":
+        benchmark(args.entradas.split(","))
+    else:
+        from exchange_pool import get_exchange, close_exchange
+
+        async def atualizar():
+            exchange = await get_exchange()
+            await cache_mercados.atualizar(exchange)
+            await close_exchange()
+
+        asyncio.run(atualizar())
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+import numpy as np
+
+# Colunas das linhas armazenadas (mesma ordem do fetch_ohlcv do ccxt)
+TIMESTAMP, OPEN, HIGH, LOW, CLOSE, VOLUME = range(6)
+
+class SerieCandles:
+    """Buffer circular de candles OHLCV de um (símbolo, timeframe).
+
+    Cada candle é gravado duas vezes (posições i e i + capacidade) num único
+    array (2 x capacidade, 6). Assim os últimos N candles sempre ocupam uma
+    faixa contígua e podem ser devolvidos como view, sem cópia.
+    """
+
+    def __init__(self, capacidade):
+        self.capacidade = capacidade
+        self.dados = np.zeros((2 * capacidade, 6), dtype=np.float64)
+        self.posicao = 0       # Próxima posição de escrita (0..capacidade-1)
+        self.tamanho = 0       # Quantidade de candles válidos
+        self.completo_ate = 0  # Maior `limit` já buscado por completo
+        self.atualizado_em = 0.0
+
+    @property
+    def ultimo_timestamp(self):
+        if not self.tamanho:
+            return None
+        return int(self.dados[(self.posicao - 1) % self.capacidade, TIMESTAMP])
+
+    def _gravar(self, indice, candle):
+        self.dados[indice] = candle
+        self.dados[indice + self.capacidade] = candle
+
+    def adicionar(self, candles):
+        """Acrescenta candles em ordem; um candle com o mesmo timestamp do último o substitui."""
+        for candle in candles:
+            ultimo = self.ultimo_timestamp
+            if ultimo is not None and candle[TIMESTAMP] < ultimo:
+                continue
+            if ultimo is not None and candle[TIMESTAMP] == ultimo:
+                self._gravar((self.posicao - 1) % self.capacidade, candle)
+                continue
+            self._gravar(self.posicao, candle)
+            self.posicao = (self.posicao + 1) % self.capacidade
+            self.tamanho = min(self.tamanho + 1, self.capacidade)
+
+    def ultimos(self, n):
+        """Retorna uma view somente leitura dos últimos `n` candles (do mais antigo ao mais novo).
+
+        A view aponta para o buffer: ela continua válida até que novos candles
+        sobrescrevam essas posições. Quem precisar guardar os dados deve copiá-los.
+        """
+        n = min(n, self.tamanho)
+        fim = (self.posicao - 1) % self.capacidade + self.capacidade + 1
+        view = self.dados[fim - n:fim]
+        view.flags.writeable = False
+        return view
+
+    def limpar(self):
+        self.posicao = 0
+        self.tamanho = 0
+        self.completo_ate = 0
+
+class CandleStore:
+    """Cache de candles por (símbolo, timeframe) com busca apenas do que é novo.
+
+    A primeira leitura de uma série baixa os últimos `limit` candles; as
+    seguintes pedem à exchange só os candles a partir do último timestamp
+    guardado (`since`), que também atualiza o candle ainda aberto.
+    """
+
+    def __init__(self, capacidade=1000, max_series=500, intervalo_minimo=2.0):
+        self.capacidade = capacidade
+        self.max_series = max_series
+        self.intervalo_minimo = intervalo_minimo  # Segundos sem nova consulta à exchange
+        self.series = OrderedDict()
+        self.locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.candles_baixados = 0
+
+    def estatisticas(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'candles_baixados': self.candles_baixados,
+            'series': len(self.series),
+        }
+
+    def _serie(self, chave):
+        serie = self.series.get(chave)
+        if serie is None:
+            serie = SerieCandles(self.capacidade)
+            self.series[chave] = serie
+            # Limita a memória total descartando as séries menos usadas
+            while len(self.series) > self.max_series:
+                antiga, _ = self.series.popitem(last=False)
+                self.locks.pop(antiga, None)
+        else:
+            self.series.move_to_end(chave)
+        return serie
+
+    async def obter(self, exchange, symbol, timeframe, limit):
+        """Retorna uma view (n x 6) dos últimos `limit` candles de symbol/timeframe."""
+        limit = min(limit, self.capacidade)
+        chave = (symbol, timeframe)
+        lock = self.locks.setdefault(chave, asyncio.Lock())
+        async with lock:
+            serie = self._serie(chave)
+            agora = time.monotonic()
+
+            if serie.tamanho and limit <= serie.completo_ate:
+                self.hits += 1
+                if agora - serie.atualizado_em >= self.intervalo_minimo:
+                    await self._buscar_novos(exchange, symbol, timeframe, limit, serie)
+            else:
+                self.misses += 1
+                candles = await exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
+                serie.limpar()
+                serie.adicionar(candles)
+                serie.completo_ate = limit
+                self.candles_baixados += len(candles)
+            serie.atualizado_em = agora
+            return serie.ultimos(limit)
+
+    async def _buscar_novos(self, exchange, symbol, timeframe, limit, serie):
+        duracao = exchange.parse_timeframe(timeframe) * 1000
+        ultimo = serie.ultimo_timestamp
+        faltando = (exchange.milliseconds() - ultimo) // duracao
+        if faltando >= limit:
+            # Buraco maior que o pedido: mais barato baixar só os últimos `limit`
+            candles = await exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
+            serie.limpar()
+            serie.completo_ate = limit
+        else:
+            candles = await exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=ultimo, limit=faltando + 2)
+        serie.adicionar(candles)
+        self.candles_baixados += len(candles)
+        logging.debug(f"{symbol} {timeframe}: {len(candles)} candles novos")
@@ -2,17 +2,25 @@
 
 import logging
 import numpy as np
-import matplotlib.pyplot as plt
 import io
 import asyncio
 from aiogram import Bot, Dispatcher, types
 from aiogram.utils import executor
 import ccxt
-from cachetools import TTLCache
 import requests
 import dotenv
 from os import getenv
 import ccxt.async_support as ccxt
+from exchange_pool import get_exchange, close_exchange
+from market_scan import escanear_simbolos
+import indicadores
+from indicadores_streaming import EstadoTendencia
+from candle_store import CandleStore, TIMESTAMP, CLOSE
+from grafico_service import cache_graficos, renderizar_grafico, encerrar as encerrar_graficos
+from market_snapshot import FonteSnapshot
+from cache_async import CacheAssincrono
+import metricas
+from limitador_binance import definir_prioridade_padrao, INTERATIVA
 
 # Configuração do logging
 logging.basicConfig(level=logging.INFO)
@@ -25,45 +33,43 @@ CHAVE_API = getenv("API_TOKEN")
 bot = Bot(token=CHAVE_API)
 dp = Dispatcher(bot)
 
-# Inicializa a exchange Binance
-async def get_exchange():
-    """Retorna uma instância da exchange Binance (versão assíncrona)."""
-    return ccxt.binance()
+# Configuração dos caches, com TTL e tamanho por tipo de dado.
+# Símbolos inválidos ficam no cache negativo e não voltam à exchange a cada pedido.
+cache_tendencias = CacheAssincrono(
+    "tendencias", maxsize=500, ttl=300, ttl_obsoleto=600,   # 5 minutos, obsoleto por mais 10
+    excecoes_negativas=(ccxt.BadSymbol,),
+)
+cache_tickers = CacheAssincrono(
+    "tickers", maxsize=200, ttl=10, ttl_obsoleto=20,        # /price, /high e /low
+    excecoes_negativas=(ccxt.BadSymbol,),
+)
+candle_store = CandleStore(capacidade=500)  # Candles por (símbolo, timeframe), busca só os novos
+snapshots = FonteSnapshot(get_exchange)     # Tickers de 24h compartilhados com os monitores
 
-async def close_exchange(exchange):
-    """Fecha corretamente a instância da exchange."""
-    if exchange:
-        await exchange.close()
+# Os comandos do bot têm prioridade sobre as varreduras dos monitores no limite de peso da Binance
+definir_prioridade_padrao(INTERATIVA)
 
-# Configuração do cache
-cache = TTLCache(maxsize=100, ttl=300)  # Cache com TTL de 5 minutos (300 segundos)
+# Configuração da varredura de tendência (/uptrend e /downtrend)
+SCAN_VOLUME_MINIMO = 200_000_000  # Volume mínimo de 200 milhões
+SCAN_CONCORRENCIA = 10            # Requisições de candles simultâneas
+SCAN_ORCAMENTO_PESO = 600         # Peso máximo de API por varredura
+SCAN_TIMEOUT = 20                 # Tempo máximo da varredura, em segundos
 
 # Função para calcular a SMA (Simple Moving Average)
 def calcular_sma(precos, periodo):
     """Calcula a SMA para uma lista de preços."""
-    return np.mean(precos[-periodo:])
+    return indicadores.sma(precos, periodo)[0, -1]
 
 # Função para calcular o RSI (Relative Strength Index)
 def calcular_rsi(precos, periodo=14):
-    """Calcula o RSI para uma lista de preços."""
-    deltas = np.diff(precos)
-    ganhos = np.where(deltas > 0, deltas, 0)
-    perdas = np.where(deltas < 0, -deltas, 0)
-    media_ganhos = np.mean(ganhos[-periodo:])
-    media_perdas = np.mean(perdas[-periodo:])
-    if media_perdas == 0:
-        return 100
-    rs = media_ganhos / media_perdas
-    return 100 - (100 / (1 + rs))
+    """Calcula o RSI de Wilder para uma lista de preços."""
+    return indicadores.rsi(precos, periodo)[0, -1]
 
 # Função para calcular o MACD (Moving Average Convergence Divergence)
 def calcular_macd(precos, periodo_curto=12, periodo_longo=26, periodo_sinal=9):
-    """Calcula o MACD e a linha de sinal."""
-    ema_curta = np.mean(precos[-periodo_curto:])
-    ema_longa = np.mean(precos[-periodo_longo:])
-    macd = ema_curta - ema_longa
-    sinal = np.mean(precos[-periodo_sinal:])
-    return macd, sinal
+    """Calcula o MACD (diferença entre EMAs) e a linha de sinal."""
+    macd, sinal = indicadores.macd(precos, periodo_curto, periodo_longo, periodo_sinal)
+    return macd[0, -1], sinal[0, -1]
 
 def identificar_suporte_resistencia(precos, fator=1):
     """Identifica níveis de suporte e resistência com base no desvio padrão."""
@@ -76,8 +82,8 @@ def identificar_suporte_resistencia(precos, fator=1):
 @dp.message_handler(commands=['sr'])
 async def comando_suporte_resistencia(message: types.Message):
     """Comando /sr: Calcula suporte e resistência para o símbolo escolhido."""
-    exchange = await get_exchange()
     try:
+        exchange = await get_exchange()
         args = message.text.split()
         if len(args) < 2:
             await message.reply("Usage: /sr <symbol> (e.g., /sr BTC/BRL)")
@@ -94,13 +100,13 @@ async def comando_suporte_resistencia(message: types.Message):
         moeda_cotacao = symbol.split('/')[1]
         
         # Obtém os últimos 72 candles de 1 hora
-        candles = await exchange.fetch_ohlcv(symbol, timeframe='1h', limit=72)
-        if not candles:
+        candles = await candle_store.obter(exchange, symbol, '1h', 72)
+        if not len(candles):
             await message.reply(f"No data found for {symbol}.")
             return
         
         # Extrai os preços de fechamento
-        precos = [candle[4] for candle in candles]
+        precos = candles[:, CLOSE]
         
         # Calcula suporte e resistência
         suporte, resistencia = identificar_suporte_resistencia(precos, fator=1)
@@ -115,93 +121,119 @@ async def comando_suporte_resistencia(message: types.Message):
     except Exception as e:
         logger.error(f"Error in /sr command: {e}")
         await message.reply("Error calculating support and resistance.")
-    finally:
-        await close_exchange(exchange)  # Fecha a exchange
         
+# Função para obter os preços de fechamento de um símbolo
+async def obter_fechamentos(symbol, timeframe='1h', limit=35):
+    """Retorna os preços de fechamento dos últimos `limit` candles como array NumPy."""
+    exchange = await get_exchange()
+    candles = await candle_store.obter(exchange, symbol, timeframe, limit)
+    if not len(candles):
+        return None
+    return candles[:, CLOSE]
+
+# Classifica a tendência de vários símbolos de uma só vez
+def classificar_fechamentos(fechamentos, timeframe='1h', short_period=9, long_period=21, rsi_period=14):
+    """Recebe symbol -> fechamentos e retorna symbol -> tendência, guardando no cache.
+
+    Os símbolos com a mesma quantidade de candles são empilhados numa matriz e
+    classificados numa única passada vetorizada.
+    """
+    por_tamanho = {}
+    for symbol, precos in fechamentos.items():
+        if precos is not None and len(precos):
+            por_tamanho.setdefault(len(precos), []).append(symbol)
+
+    tendencias = {}
+    for symbols in por_tamanho.values():
+        matriz = np.vstack([fechamentos[symbol] for symbol in symbols])
+        resultado = indicadores.classificar_tendencias(matriz, short_period, long_period, rsi_period)
+        for symbol, tendencia in zip(symbols, resultado):
+            tendencias[symbol] = tendencia
+            cache_tendencias.definir(f"tendencia_{symbol}_{timeframe}", tendencia)
+    return tendencias
+
+# Estado incremental dos indicadores por (símbolo, timeframe)
+estados_tendencia = {}
+
+# Atualiza o estado incremental de um símbolo apenas com os candles novos
+async def atualizar_estado_tendencia(symbol, timeframe, short_period, long_period, rsi_period):
+    """Aplica ao estado de (symbol, timeframe) os candles fechados desde a última chamada.
+
+    Na primeira chamada o estado é iniciado com o histórico necessário; nas
+    seguintes só são aplicados os candles posteriores ao último já aplicado
+    (o candle_store busca na exchange apenas os candles novos).
+    Retorna o estado e o preço de fechamento do candle ainda aberto (ou None).
+    """
+    exchange = await get_exchange()
+    duracao = exchange.parse_timeframe(timeframe) * 1000
+    chave = (symbol, timeframe)
+    registro = estados_tendencia.get(chave)
+
+    candles = await candle_store.obter(exchange, symbol, timeframe, max(long_period + rsi_period, 35))
+    if not len(candles):
+        return None, None
+
+    # Se há candles faltando entre o estado e os dados atuais, recomeça do zero
+    if registro is None or candles[0, TIMESTAMP] > registro['ultimo_ts'] + duracao:
+        registro = {'estado': EstadoTendencia(short_period, long_period, rsi_period), 'ultimo_ts': -1}
+        estados_tendencia[chave] = registro
+
+    agora = exchange.milliseconds()
+    preco_aberto = None
+    for timestamp, _, _, _, fechamento, _ in candles.tolist():
+        timestamp = int(timestamp)
+        if timestamp <= registro['ultimo_ts']:
+            continue
+        if timestamp + duracao > agora:
+            preco_aberto = fechamento
+            break
+        registro['estado'].atualizar(fechamento)
+        registro['ultimo_ts'] = timestamp
+    return registro['estado'], preco_aberto
+
 # Função para identificar tendência com SMA, RSI e MACD
 async def identificar_tendencia(symbol, timeframe='1h', short_period=9, long_period=21, rsi_period=14):
     """Identifica a tendência com base em SMA, RSI e MACD."""
-    exchange = await get_exchange()
-    try:
-        # Verifica se os dados estão no cache
-        cache_key = f"tendencia_{symbol}_{timeframe}"
-        if cache_key in cache:
-            return cache[cache_key]
-        
-        # Obtém os dados históricos (candles)
-        candles = await exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=long_period + rsi_period)
-        if not candles:
+    async def calcular():
+        # Aplica apenas os candles novos ao estado dos indicadores
+        estado, preco_aberto = await atualizar_estado_tendencia(symbol, timeframe, short_period, long_period, rsi_period)
+        if estado is None:
             return None
-        
-        # Extrai os preços de fechamento
-        precos = [candle[4] for candle in candles]
-        
-        # Calcula as SMAs
-        sma_curta = calcular_sma(precos, short_period)
-        sma_longa = calcular_sma(precos, long_period)
-        
-        # Calcula o RSI
-        rsi = calcular_rsi(precos, rsi_period)
-        
-        # Calcula o MACD
-        macd, sinal = calcular_macd(precos)
-        
-        # Determina a tendência
-        if sma_curta > sma_longa and macd > sinal and rsi > 50:
-            tendencia = "uptrend"
-        elif sma_curta < sma_longa and macd < sinal and rsi < 50:
-            tendencia = "downtrend"
-        else:
-            tendencia = "neutral"
-        
-        # Armazena no cache
-        cache[cache_key] = tendencia
-        return tendencia
+
+        # Determina a tendência, considerando também o candle em andamento
+        if preco_aberto is not None:
+            return estado.espiar(preco_aberto)
+        return estado.tendencia()
+
+    try:
+        # Pedidos simultâneos do mesmo símbolo compartilham o mesmo cálculo
+        return await cache_tendencias.obter(f"tendencia_{symbol}_{timeframe}", calcular)
     except Exception as e:
         logger.error(f"Error identifying trend for {symbol}: {e}")
         return None
-    finally:
-        await close_exchange(exchange)
 
 # Função para gerar gráfico diário
 async def gerar_grafico(symbol, timeframe='1d', limit=30):
-    """Gera um gráfico de preços diários."""
-    exchange = await get_exchange()
-    try:
-        # Verifica se o gráfico está no cache
-        cache_key = f"grafico_{symbol}_{timeframe}"
-        if cache_key in cache:
-            return cache[cache_key]
-        
-        candles = await exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
-        if not candles:
+    """Gera um gráfico de preços diários e retorna o PNG em bytes."""
+    async def gerar():
+        exchange = await get_exchange()
+        candles = await candle_store.obter(exchange, symbol, timeframe, limit)
+        if not len(candles):
             return None
-        
-        # Extrai os preços de fechamento
-        precos = [candle[4] for candle in candles]
-        
-        # Gera o gráfico
-        plt.figure(figsize=(10, 5))
-        plt.plot(precos, label='Price')
-        plt.title(f"{symbol} Price Chart ({timeframe})")
-        plt.xlabel("Time")
-        plt.ylabel("Price (USDT)")
-        plt.legend()
-        
-        # Salva o gráfico em um buffer
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        plt.close()
-        
-        # Armazena no cache
-        cache[cache_key] = buf
-        return buf
+        # Gera o gráfico fora do event loop
+        return await renderizar_grafico(symbol, timeframe, candles[:, CLOSE])
+
+    try:
+        # Vários pedidos do mesmo gráfico viram uma única renderização
+        return await cache_graficos.obter(f"grafico_{symbol}_{timeframe}", gerar)
     except Exception as e:
         logger.error(f"Error generating chart for {symbol}: {e}")
         return None
-    finally:
-        await close_exchange(exchange)
+
+# Ticker de 24h de um símbolo, compartilhado por /price, /high e /low
+async def obter_ticker(symbol):
+    exchange = await get_exchange()
+    return await cache_tickers.obter(f"ticker_{symbol}", lambda: exchange.fetch_ticker(symbol))
 
 # Comandos do bot
 @dp.message_handler(commands=['start'])
@@ -209,66 +241,80 @@ async def comando_start(message: types.Message):
     """Comando /start: Mensagem de boas-vindas."""
     await message.reply("Hello! Welcome to CryptoBot. Use the commands to get information about cryptocurrencies.")
 
+# Varre os símbolos de maior volume e retorna os que estão na tendência pedida
+async def varrer_tendencia(message, tendencia_alvo):
+    """Executa a varredura concorrente de tendência, mostrando o progresso ao usuário."""
+    # Criptomoedas com volume maior que 200 milhões, maiores volumes primeiro (snapshot compartilhado)
+    snapshot = await snapshots.obter()
+    symbols = snapshot.acima_de(SCAN_VOLUME_MINIMO)
+
+    # Tendências já em cache não precisam de novos candles
+    tendencias = {}
+    for symbol in symbols:
+        tendencia = cache_tendencias.get(f"tendencia_{symbol}_1h")
+        if tendencia is not None:
+            tendencias[symbol] = tendencia
+    a_buscar = [symbol for symbol in symbols if symbol not in tendencias]
+
+    progresso = await message.reply(f"Scanning {len(symbols)} cryptocurrencies for {tendencia_alvo}...")
+
+    async def reportar(concluidos, total, resultados):
+        parciais = {**tendencias, **classificar_fechamentos(resultados)}
+        encontrados = [symbol for symbol in symbols if parciais.get(symbol) == tendencia_alvo]
+        texto = f"Scanning... {concluidos}/{total}"
+        if encontrados:
+            texto += "\n" + "\n".join(encontrados)
+        await progresso.edit_text(texto)
+
+    # Busca os candles em paralelo e classifica todos os símbolos de uma vez
+    varredura = await escanear_simbolos(
+        a_buscar,
+        obter_fechamentos,
+        max_concorrencia=SCAN_CONCORRENCIA,
+        orcamento_peso=SCAN_ORCAMENTO_PESO,
+        timeout=SCAN_TIMEOUT,
+        on_progresso=reportar,
+    )
+    tendencias.update(classificar_fechamentos(varredura['resultados']))
+    encontrados = [symbol for symbol in symbols if tendencias.get(symbol) == tendencia_alvo]
+    return progresso, encontrados, varredura
+
+# Monta a resposta final da varredura
+def formatar_varredura(tendencia_alvo, encontrados, varredura):
+    if encontrados:
+        resposta = f"Cryptocurrencies in {tendencia_alvo}:\n" + "\n".join(encontrados)
+    else:
+        resposta = f"No cryptocurrencies in {tendencia_alvo} at the moment."
+    nao_analisados = len(varredura['pendentes']) + len(varredura['ignorados'])
+    if nao_analisados:
+        resposta += f"\n\n({nao_analisados} symbols not analyzed in time)"
+    if varredura['erros']:
+        resposta += f"\n({len(varredura['erros'])} symbols failed to load)"
+    return resposta
+
 @dp.message_handler(commands=['uptrend'])
 async def comando_tendencia_alta(message: types.Message):
     """Comando /uptrend: Mostra criptomoedas em tendência de alta."""
-    exchange = await get_exchange()
     try:
-        # Obtém todos os tickers da Binance
-        tickers = await exchange.fetch_tickers()
-        
-        # Filtra criptomoedas com volume maior que 200 milhões
-        criptos_alta = []
-        for symbol, ticker in tickers.items():
-            if ticker['quoteVolume'] > 200000000:  # Filtra por volume
-                tendencia = await identificar_tendencia(symbol)
-                if tendencia == "uptrend":
-                    criptos_alta.append(symbol)
-        
-        if criptos_alta:
-            resposta = "Cryptocurrencies in uptrend:\n" + "\n".join(criptos_alta)
-        else:
-            resposta = "No cryptocurrencies in uptrend at the moment."
-        
-        await message.reply(resposta)
+        progresso, criptos_alta, varredura = await varrer_tendencia(message, "uptrend")
+        await progresso.edit_text(formatar_varredura("uptrend", criptos_alta, varredura))
     except Exception as e:
         logger.error(f"Error in /uptrend command: {e}")
         await message.reply("Error fetching uptrend data.")
-    finally:
-        await close_exchange(exchange)
 
 @dp.message_handler(commands=['downtrend'])
 async def comando_tendencia_baixa(message: types.Message):
     """Comando /downtrend: Mostra criptomoedas em tendência de baixa."""
-    exchange = await get_exchange()
     try:
-        # Obtém todos os tickers da Binance
-        tickers = await exchange.fetch_tickers()
-        
-        # Filtra criptomoedas com volume maior que 200 milhões
-        criptos_baixa = []
-        for symbol, ticker in tickers.items():
-            if ticker['quoteVolume'] > 200000000:  # Filtra por volume
-                tendencia = await identificar_tendencia(symbol)
-                if tendencia == "downtrend":
-                    criptos_baixa.append(symbol)
-        
-        if criptos_baixa:
-            resposta = "Cryptocurrencies in downtrend:\n" + "\n".join(criptos_baixa)
-        else:
-            resposta = "No cryptocurrencies in downtrend at the moment."
-        
-        await message.reply(resposta)
+        progresso, criptos_baixa, varredura = await varrer_tendencia(message, "downtrend")
+        await progresso.edit_text(formatar_varredura("downtrend", criptos_baixa, varredura))
     except Exception as e:
         logger.error(f"Error in /downtrend command: {e}")
         await message.reply("Error fetching downtrend data.")
-    finally:
-        await close_exchange(exchange)
 
 @dp.message_handler(commands=['price'])
 async def comando_preco_atual(message: types.Message):
     """Comando /price: Mostra o preço atual de uma criptomoeda."""
-    exchange = await get_exchange()
     try:
         args = message.text.split()
         if len(args) < 2:
@@ -276,19 +322,16 @@ async def comando_preco_atual(message: types.Message):
             return
         
         symbol = args[1].upper()
-        ticker = await exchange.fetch_ticker(symbol)
+        ticker = await obter_ticker(symbol)
         preco_atual = ticker['last']
         await message.reply(f"Current price of {symbol}: {preco_atual} ")
     except Exception as e:
         logger.error(f"Error in /price command: {e}")
         await message.reply("Error fetching price data.")
-    finally:
-        await close_exchange(exchange)
 
 @dp.message_handler(commands=['chart'])
 async def comando_grafico(message: types.Message):
     """Comando /chart: Envia o gráfico diário de uma criptomoeda."""
-    exchange = await get_exchange()
     try:
         args = message.text.split()
         if len(args) < 2:
@@ -298,19 +341,17 @@ async def comando_grafico(message: types.Message):
         symbol = args[1].upper()
         grafico = await gerar_grafico(symbol)
         if grafico:
-            await message.reply_photo(grafico)
+            # Um buffer novo a cada envio; o cache guarda só os bytes
+            await message.reply_photo(types.InputFile(io.BytesIO(grafico), filename=f"{symbol.replace('/', '_')}.png"))
         else:
             await message.reply("Error generating chart.")
     except Exception as e:
         logger.error(f"Error in /chart command: {e}")
         await message.reply("Error generating chart.")
-    finally:
-        await close_exchange(exchange)
 
 @dp.message_handler(commands=['high'])
 async def comando_24h_high(message: types.Message):
     """Comando /24hhigh: Mostra a máxima das últimas 24 horas de uma criptomoeda."""
-    exchange = await get_exchange()
     try:
         args = message.text.split()
         if len(args) < 2:
@@ -318,20 +359,17 @@ async def comando_24h_high(message: types.Message):
             return
         
         symbol = args[1].upper()
-        ticker = await exchange.fetch_ticker(symbol)
+        ticker = await obter_ticker(symbol)
         high_24h = ticker['high']
         
         await message.reply(f"24h High de {symbol}: {high_24h} ")
     except Exception as e:
         logger.error(f"Erro no comando /high: {e}")
         await message.reply("Erro ao buscar 24h High.")
-    finally:
-        await close_exchange(exchange)
 
 @dp.message_handler(commands=['low'])
 async def comando_24h_low(message: types.Message):
     """Comando /24hlow: Mostra a mínima das últimas 24 horas de uma criptomoeda."""
-    exchange = await get_exchange()
     try:
         args = message.text.split()
         if len(args) < 2:
@@ -339,16 +377,25 @@ async def comando_24h_low(message: types.Message):
             return
         
         symbol = args[1].upper()
-        ticker = await exchange.fetch_ticker(symbol)
+        ticker = await obter_ticker(symbol)
         low_24h = ticker['low']
         
         await message.reply(f"24h Low de {symbol}: {low_24h} ")
     except Exception as e:
         logger.error(f"Erro no comando /low: {e}")
         await message.reply("Erro ao buscar 24h Low.")
-    finally:
-        await close_exchange(exchange)
+
+# Endpoint de métricas no mesmo event loop do bot
+async def on_startup(dp):
+    await metricas.servir()
+
+# Fecha a exchange compartilhada e os processos de gráfico ao desligar o bot
+async def on_shutdown(dp):
+    await metricas.encerrar()
+    await snapshots.encerrar()
+    await close_exchange()
+    encerrar_graficos()
 
 # Inicia o bot
 if __name__ == '__main__':
-    executor.start_polling(dp, skip_updates=True)
\ No newline at end of file
+    executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
\ No newline at end of file
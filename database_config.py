@@ -1,5 +1,24 @@
+import argparse
+import logging
+import os
+import random
 import sqlite3
+import statistics
+import time
 from sqlite3 import Error
+import metricas
+
+# Pragmas aplicados a cada conexão: WAL permite leituras durante as gravações
+# e synchronous=NORMAL só sincroniza o disco nos checkpoints do WAL
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",       # 64 MB de cache de páginas
+    "PRAGMA mmap_size=268435456",     # 256 MB lidos via mmap
+    "PRAGMA wal_autocheckpoint=10000",
+    "PRAGMA busy_timeout=5000",
+)
 
 # Função para criar conexão com o banco de dados SQLite
 def create_connection(db_file):
@@ -7,46 +26,175 @@ def create_connection(db_file):
     conn = None
     try:
         conn = sqlite3.connect(db_file)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
         return conn
     except Error as e:
         print(e)
     return conn
 
-# Função para criar a tabela de trades
-def create_table(conn):
-    """ cria a tabela de trades no banco de dados """
+# Converte a tabela antiga (time TEXT, sem symbol) para o formato atual
+def migrar_tabela_antiga(conn, symbol_padrao="BTCUSDT"):
+    """ migra a tabela de trades antiga, se existir, preservando os dados
+
+    Tudo roda numa única transação explícita: no modo padrão do sqlite3 o
+    ALTER TABLE e o CREATE TABLE fazem commit na hora, e uma falha no INSERT
+    deixava a tabela nova vazia e os dados presos em trades_antiga. Linhas
+    com time nulo ou que não é uma data válida (ou sem preço, quantidade ou
+    lado) não têm como ir para a tabela nova e são descartadas, com aviso.
+    """
+    colunas = [linha[1] for linha in conn.execute("PRAGMA table_info(trades)")]
+    if not colunas or 'symbol' in colunas:
+        return
+    isolamento = conn.isolation_level
+    conn.isolation_level = None  # BEGIN e COMMIT manuais
     try:
-        sql_create_trades_table = """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("ALTER TABLE trades RENAME TO trades_antiga")
+            criar_tabela_trades(conn)
+            conn.execute("""
+                INSERT INTO trades(id, symbol, time, price, qty, is_buyer_maker)
+                SELECT id, ?, CAST(ROUND((julianday(time) - 2440587.5) * 86400000) AS INTEGER), price, qty, is_buyer_maker
+                FROM trades_antiga
+                WHERE julianday(time) IS NOT NULL
+                  AND price IS NOT NULL AND qty IS NOT NULL AND is_buyer_maker IS NOT NULL
+            """, (symbol_padrao,))
+            migradas = conn.execute("SELECT changes()").fetchone()[0]
+            total = conn.execute("SELECT COUNT(*) FROM trades_antiga").fetchone()[0]
+            conn.execute("DROP TABLE trades_antiga")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.isolation_level = isolamento
+    if migradas < total:
+        logging.warning(f"Migração de trades: {total - migradas} de {total} linhas inválidas descartadas")
+
+def criar_tabela_trades(conn):
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS trades (
             id INTEGER PRIMARY KEY,
-            time TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            trade_id INTEGER,
+            time INTEGER NOT NULL,
             price REAL NOT NULL,
             qty REAL NOT NULL,
-            is_buyer_maker BOOLEAN NOT NULL
-        );"""
-        cursor = conn.cursor()
-        cursor.execute(sql_create_trades_table)
+            is_buyer_maker INTEGER NOT NULL
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trades_symbol_time ON trades(symbol, time)")
+
+# Função para criar a tabela de trades
+def create_table(conn):
+    """ cria a tabela de trades no banco de dados (time em epoch-ms) """
+    try:
+        migrar_tabela_antiga(conn)
+        with conn:
+            criar_tabela_trades(conn)
     except Error as e:
         print(e)
 
+SQL_INSERT = ''' INSERT INTO trades(symbol, time, price, qty, is_buyer_maker, trade_id)
+                 VALUES(?,?,?,?,?,?) '''
+
 # Função para inserir um trade no banco de dados
-def insert_trade(conn, trade):
-    """ insere um novo trade no banco de dados """
-    sql = ''' INSERT INTO trades(time, price, qty, is_buyer_maker)
-              VALUES(?,?,?,?) '''
+def insert_trade(conn, trade, commit=True):
+    """ insere um novo trade: (symbol, time_ms, price, qty, is_buyer_maker[, trade_id]) """
+    if len(trade) == 5:
+        trade = (*trade, None)
     cursor = conn.cursor()
-    cursor.execute(sql, trade)
-    conn.commit()
+    cursor.execute(SQL_INSERT, trade)
+    if commit:
+        conn.commit()
     return cursor.lastrowid
 
-# Função para buscar trades dos últimos 15 minutos
-def fetch_recent_trades(conn, minutes=15):
-    """ busca os trades dos últimos X minutos """
-    cursor = conn.cursor()
-    cursor.execute("""
+# Função para inserir vários trades numa única transação
+def insert_trades(conn, trades):
+    """ insere um lote de trades com executemany, num único commit """
+    trades = [trade if len(trade) == 6 else (*trade, None) for trade in trades]
+    with metricas.duracao_gravacao.cronometrar(destino="sqlite"):
+        with conn:
+            conn.executemany(SQL_INSERT, trades)
+    metricas.itens_gravados.inc(len(trades), destino="sqlite")
+    return len(trades)
+
+# Função para buscar trades de um símbolo num intervalo de tempo
+def fetch_trades_range(conn, symbol, inicio_ms, fim_ms=None):
+    """ busca os trades de um símbolo entre inicio_ms e fim_ms (usa o índice symbol, time) """
+    if fim_ms is None:
+        fim_ms = int(time.time() * 1000)
+    cursor = conn.execute("""
         SELECT * FROM trades
-        WHERE time >= datetime('now', '-{} minutes')
+        WHERE symbol = ? AND time >= ? AND time <= ?
         ORDER BY time
-    """.format(minutes))
-    rows = cursor.fetchall()
-    return rows
+    """, (symbol, inicio_ms, fim_ms))
+    return cursor.fetchall()
+
+# Função para buscar trades dos últimos 15 minutos
+def fetch_recent_trades(conn, minutes=15, symbol="BTCUSDT"):
+    """ busca os trades dos últimos X minutos """
+    agora_ms = int(time.time() * 1000)
+    return fetch_trades_range(conn, symbol, agora_ms - minutes * 60 * 1000, agora_ms)
+
+# ----- Benchmark -----
+
+SIMBOLOS_BENCHMARK = 50
+
+def benchmark(caminho, linhas=100_000_000, lote=100_000, consultas=200, janela_min=15):
+    """Inserções por segundo e latência da consulta da janela recente com `linhas` trades.
+
+    Os trades são gerados em ordem de tempo, um por milissegundo distribuído
+    entre SIMBOLOS_BENCHMARK símbolos, terminando agora; a consulta é a de
+    fetch_recent_trades (últimos `janela_min` minutos de um símbolo
+    sorteado). Com 100M linhas o arquivo passa de 5 GB.
+    """
+    if os.path.exists(caminho):
+        raise SystemExit(f"{caminho} já existe; use um arquivo novo")
+    conn = create_connection(caminho)
+    create_table(conn)
+    simbolos = [f"S{i:03d}USDT" for i in range(SIMBOLOS_BENCHMARK)]
+    fim_ms = int(time.time() * 1000)
+    inicio_ms = fim_ms - linhas
+    gerador = random.Random(1)
+
+    inicio = time.perf_counter()
+    proximo_relatorio = inicio + 10
+    for base in range(0, linhas, lote):
+        trades = [
+            (simbolos[i % SIMBOLOS_BENCHMARK], inicio_ms + i, 100 + gerador.random(), gerador.random(), i & 1, i)
+            for i in range(base, min(base + lote, linhas))
+        ]
+        insert_trades(conn, trades)
+        if time.perf_counter() > proximo_relatorio:
+            proximo_relatorio += 10
+            feitas = base + len(trades)
+            print(f"  {feitas:,} linhas, {feitas / (time.perf_counter() - inicio):,.0f} linhas/s")
+    duracao = time.perf_counter() - inicio
+    print(f"Inserção: {linhas:,} linhas em {duracao:.1f}s ({linhas / duracao:,.0f} linhas/s, lotes de {lote:,})")
+
+    latencias = []
+    devolvidas = 0
+    for _ in range(consultas):
+        symbol = gerador.choice(simbolos)
+        comeco = time.perf_counter()
+        devolvidas += len(fetch_trades_range(conn, symbol, fim_ms - janela_min * 60_000, fim_ms))
+        latencias.append(time.perf_counter() - comeco)
+    latencias.sort()
+    print(f"Janela de {janela_min} min: p50 {statistics.median(latencias) * 1000:.2f} ms, "
+          f"p99 {latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))] * 1000:.2f} ms, "
+          f"{devolvidas / consultas:,.0f} trades por consulta")
+    plano = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM trades WHERE symbol = ? AND time >= ? AND time <= ? ORDER BY time",
+        ("S000USDT", 0, 1)).fetchall()
+    print(f"Plano: {plano[-1][-1]}")
+    conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do armazenamento de trades em SQLite")
+    parser.add_argument("arquivo", help="Banco novo que será criado (ex.: /tmp/trades_benchmark.db)")
+    parser.add_argument("--linhas", type=int, default=100_000_000)
+    parser.add_argument("--lote", type=int, default=100_000)
+    parser.add_argument("--consultas", type=int, default=200)
+    args = parser.parse_args()
+    benchmark(args.arquivo, args.linhas, args.lote, args.consultas)
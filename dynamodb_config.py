@@ -1,5 +1,13 @@
-import boto3
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+import weakref
 from decimal import Decimal
+import boto3
+import metricas
 
 # Inicialize o cliente do DynamoDB
 aws_access_key = "YOUR_AWS_ACCESS_KEY"
@@ -13,19 +21,154 @@ dynamodb = boto3.resource(
     aws_secret_access_key=aws_secret_key
 )
 
-# Nome da tabela no DynamoDB
-table_name = "TradeData"
+# Cliente de baixo nível para as gravações em lote (o cliente do resource
+# reconverte os tipos e não aceita itens já serializados)
+dynamodb_client = boto3.client(
+    'dynamodb',
+    region_name=region_name,
+    aws_access_key_id=aws_access_key,
+    aws_secret_access_key=aws_secret_key
+)
+
+# Nome da tabela no DynamoDB (formato compacto por bucket de tempo, ver trade_schema.py)
+# Chave: pk (S) = "<SYMBOL>#<início do bucket>", sk (N) = epoch-ms do primeiro trade do bloco
+table_name = "Trades"
 table = dynamodb.Table(table_name)
 
-def save_trade_data(trade_data):
-    # Salve os dados no DynamoDB
-    try:
-        # Converter Decimal, se necessário
-        for key, value in trade_data.items():
-            if isinstance(value, float):
-                trade_data[key] = Decimal(str(value))
-        
-        table.put_item(Item=trade_data)
-        print(f"Dados inseridos: {trade_data}")
-    except Exception as e:
-        print(f"Erro ao inserir dados: {e}")
+TAMANHO_LOTE = 25  # Máximo de itens por BatchWriteItem
+
+# Converte um valor Python para o formato de atributo da API de baixo nível
+def serializar_valor(valor):
+    if isinstance(valor, bool):
+        return {'BOOL': valor}
+    if isinstance(valor, (int, float, Decimal)):
+        return {'N': str(valor)}
+    if isinstance(valor, (bytes, bytearray)):
+        return {'B': bytes(valor)}
+    if valor is None:
+        return {'NULL': True}
+    return {'S': str(valor)}
+
+def serializar_item(item):
+    return {chave: serializar_valor(valor) for chave, valor in item.items()}
+
+_escritores = weakref.WeakSet()  # Instâncias vivas, lidas na coleta das métricas
+
+class EscritorDynamoDB:
+    """Grava itens no DynamoDB em lotes, em threads de fundo.
+
+    `adicionar` só coloca o item numa fila limitada e retorna. As threads
+    gravadoras juntam até 25 itens (ou o que chegar em `max_espera` segundos)
+    num BatchWriteItem e reenviam os UnprocessedItems com backoff exponencial
+    e aleatório. Os números são enviados como texto no formato da API de
+    baixo nível, sem conversão para Decimal.
+    """
+
+    def __init__(self, table_name, client=None, workers=4, max_espera=1.0,
+                 tamanho_fila=100_000, max_tentativas=8):
+        self.table_name = table_name
+        self.client = client or dynamodb_client
+        self.max_espera = max_espera
+        self.max_tentativas = max_tentativas
+        self.fila = queue.Queue(maxsize=tamanho_fila)
+        self.parar = threading.Event()
+        self.lock = threading.Lock()
+        self.metricas = {
+            'gravados': 0,
+            'lotes': 0,
+            'reenviados': 0,
+            'falhas': 0,
+            'ultima_latencia_lote': 0.0,
+        }
+        _escritores.add(self)
+        self.threads = [
+            threading.Thread(target=self._gravador, name=f"dynamodb-{table_name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def adicionar(self, item, bloquear=True):
+        """Enfileira um item. Com bloquear=False levanta queue.Full se a fila estiver cheia."""
+        self.fila.put(item, block=bloquear)
+
+    def flush(self):
+        """Espera até que todos os itens enfileirados tenham sido gravados."""
+        self.fila.join()
+
+    def fechar(self):
+        self.flush()
+        self.parar.set()
+        for thread in self.threads:
+            thread.join(timeout=self.max_espera + 1)
+
+    def _proximo_lote(self):
+        try:
+            lote = [self.fila.get(timeout=self.max_espera)]
+        except queue.Empty:
+            return []
+        limite = time.monotonic() + self.max_espera
+        while len(lote) < TAMANHO_LOTE:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self.fila.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _gravador(self):
+        while not self.parar.is_set():
+            lote = self._proximo_lote()
+            if not lote:
+                continue
+            try:
+                self._gravar_lote(lote)
+            except Exception as e:
+                logging.error(f"Erro ao gravar lote no DynamoDB ({len(lote)} itens): {e}")
+                with self.lock:
+                    self.metricas['falhas'] += len(lote)
+                metricas.falhas_gravacao.inc(len(lote), destino="dynamodb")
+            finally:
+                for _ in lote:
+                    self.fila.task_done()
+
+    def _gravar_lote(self, lote):
+        inicio = time.monotonic()
+        pedidos = {self.table_name: [{'PutRequest': {'Item': serializar_item(item)}} for item in lote]}
+        total = len(lote)
+        for tentativa in range(self.max_tentativas):
+            resposta = self.client.batch_write_item(RequestItems=pedidos)
+            pedidos = resposta.get('UnprocessedItems') or {}
+            if not pedidos:
+                break
+            pendentes = len(pedidos.get(self.table_name, []))
+            with self.lock:
+                self.metricas['reenviados'] += pendentes
+            # Backoff exponencial com jitter ("full jitter")
+            time.sleep(random.uniform(0, min(0.05 * 2 ** tentativa, 5)))
+        pendentes = len(pedidos.get(self.table_name, [])) if pedidos else 0
+        with self.lock:
+            self.metricas['gravados'] += total - pendentes
+            self.metricas['falhas'] += pendentes
+            self.metricas['lotes'] += 1
+            self.metricas['ultima_latencia_lote'] = time.monotonic() - inicio
+        metricas.itens_gravados.inc(total - pendentes, destino="dynamodb")
+        metricas.duracao_gravacao.observar(self.metricas['ultima_latencia_lote'], destino="dynamodb")
+        if pendentes:
+            metricas.falhas_gravacao.inc(pendentes, destino="dynamodb")
+            logging.error(f"{pendentes} itens não gravados no DynamoDB após {self.max_tentativas} tentativas")
+
+_escritor = None
+
+def save_trade_data(trade_data, bloquear=True):
+    # Enfileira o item (um bloco de trades) para gravação em lote
+    global _escritor
+    if _escritor is None:
+        _escritor = EscritorDynamoDB(table_name)
+        atexit.register(_escritor.fechar)
+    _escritor.adicionar(trade_data, bloquear=bloquear)
+
+metricas.coletada("dynamodb_fila", "Itens aguardando gravação no DynamoDB", "gauge", ("tabela",),
+                  lambda: [((escritor.table_name,), escritor.fila.qsize()) for escritor in list(_escritores)])
@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import logging
+import os
+import re
+import statistics
+import tempfile
+import time
+from os import getenv
+import aiohttp
+import ccxt.async_support as ccxt
+from limitador_binance import BinanceLimitada
+from cache_mercados import cache_mercados
+
+# Configurações do pool de conexões com a Binance
+POOL_CONEXOES = 32          # Conexões HTTP simultâneas por processo
+KEEPALIVE_SEGUNDOS = 60     # Tempo que uma conexão ociosa fica aberta
+INTERVALO_MERCADOS = 3600   # Recarrega os metadados de mercado a cada 1 hora
+# Endereço da API (o mesmo do binance_rest); em testes aponta para um servidor local
+URL_API = getenv("BINANCE_REST_URL")
+
+_exchange = None
+_session = None
+_tarefa_mercados = None
+_lock = None
+
+def _criar_session():
+    """Cria a sessão aiohttp compartilhada, com pool de conexões keep-alive."""
+    connector = aiohttp.TCPConnector(
+        limit=POOL_CONEXOES,
+        ttl_dns_cache=300,
+        keepalive_timeout=KEEPALIVE_SEGUNDOS,
+        enable_cleanup_closed=True,
+    )
+    return aiohttp.ClientSession(connector=connector, trust_env=True)
+
+def apontar_urls(exchange, base_url):
+    """Troca o host de todos os endpoints do ccxt (api., fapi., dapi., ...) por `base_url`."""
+    exchange.urls['api'] = {
+        nome: re.sub(r'^https://[a-z]+\.binance\.com', base_url.rstrip('/'), url) if isinstance(url, str) else url
+        for nome, url in exchange.urls['api'].items()
+    }
+
+# Recarrega os mercados periodicamente sem bloquear os comandos
+async def _atualizar_mercados(exchange, intervalo):
+    while True:
+        # Um cache antigo lido do disco é renovado logo; depois, a cada `intervalo`
+        await asyncio.sleep(cache_mercados.proxima_atualizacao(intervalo))
+        try:
+            await cache_mercados.atualizar(exchange)
+            logging.info(f"Mercados recarregados: {len(exchange.markets)} símbolos")
+        except Exception as e:
+            logging.error(f"Erro ao recarregar mercados: {e}")
+
+# Retorna a instância única da exchange para o processo
+async def get_exchange():
+    """Retorna a instância compartilhada da exchange Binance (versão assíncrona).
+
+    A primeira chamada cria a sessão HTTP, carrega os mercados uma única vez
+    (do cache em disco quando possível, ver cache_mercados.py) e inicia a
+    recarga periódica em segundo plano. As chamadas seguintes apenas
+    devolvem a mesma instância; quem chama não deve fechá-la.
+    """
+    global _exchange, _session, _tarefa_mercados, _lock
+    if _exchange is not None:
+        return _exchange
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        if _exchange is None:
+            session = _criar_session()
+            # O peso das chamadas é controlado pelo limitador global (entre processos), não pelo do ccxt
+            exchange = BinanceLimitada({'enableRateLimit': False, 'session': session})
+            if URL_API:
+                apontar_urls(exchange, URL_API)
+            try:
+                await cache_mercados.carregar(exchange)
+            except Exception:
+                await exchange.close()
+                await session.close()
+                raise
+            _session = session
+            _exchange = exchange
+            _tarefa_mercados = asyncio.create_task(_atualizar_mercados(exchange, INTERVALO_MERCADOS))
+    return _exchange
+
+async def close_exchange():
+    """Encerra a exchange compartilhada. Deve ser chamado no desligamento do processo."""
+    global _exchange, _session, _tarefa_mercados
+    if _tarefa_mercados is not None:
+        _tarefa_mercados.cancel()
+        try:
+            await _tarefa_mercados
+        except asyncio.CancelledError:
+            pass
+        _tarefa_mercados = None
+    if _exchange is not None:
+        await _exchange.close()
+        _exchange = None
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+# ----- Benchmark -----
+
+LATENCIA_FALSA = 0.005   # Ida e volta de cada requisição na exchange falsa
+HANDSHAKE_FALSO = 0.030  # Custo extra da primeira requisição de cada conexão (TCP + TLS)
+
+def _exchange_info(quantidade):
+    filtros = [
+        {'filterType': 'PRICE_FILTER', 'minPrice': '0.00000100', 'maxPrice': '1000000.00', 'tickSize': '0.00000100'},
+        {'filterType': 'LOT_SIZE', 'minQty': '0.00100000', 'maxQty': '900000.00', 'stepSize': '0.00100000'},
+    ]
+    simbolos = [{
+        'symbol': f"C{i:04d}USDT", 'status': 'TRADING', 'baseAsset': f"C{i:04d}", 'quoteAsset': 'USDT',
+        'baseAssetPrecision': 8, 'quotePrecision': 8, 'quoteAssetPrecision': 8,
+        'orderTypes': ['LIMIT', 'MARKET'], 'isSpotTradingAllowed': True, 'isMarginTradingAllowed': False,
+        'filters': filtros, 'permissions': ['SPOT'],
+    } for i in range(quantidade)]
+    return {'timezone': 'UTC', 'serverTime': int(time.time() * 1000), 'rateLimits': [], 'symbols': simbolos}
+
+async def servidor_falso(porta=0, quantidade=2000, latencia=LATENCIA_FALSA, handshake=HANDSHAKE_FALSO):
+    """Exchange falsa local: exchangeInfo com `quantidade` pares e ticker/24hr.
+
+    Cada resposta espera `latencia`; a primeira de cada conexão espera também
+    `handshake`, o que uma conexão nova paga de TCP e TLS na Binance.
+    Retorna (runner, url).
+    """
+    from aiohttp import web
+
+    info = _exchange_info(quantidade)
+    conexoes = set()
+
+    async def esperar(request):
+        transporte = id(request.transport)
+        espera = latencia
+        if transporte not in conexoes:
+            conexoes.add(transporte)
+            espera += handshake
+        await asyncio.sleep(espera)
+
+    async def exchange_info(request):
+        await esperar(request)
+        # Só o spot tem pares; os endpoints de futuros respondem vazios
+        return web.json_response(info if request.path.startswith('/api/') else {'symbols': []})
+
+    async def ticker(request):
+        await esperar(request)
+        agora = int(time.time() * 1000)
+        return web.json_response({
+            'symbol': request.query.get('symbol', 'C0000USDT'), 'lastPrice': '1.2345', 'highPrice': '1.3',
+            'lowPrice': '1.1', 'openPrice': '1.2', 'volume': '1000', 'quoteVolume': '1234.5',
+            'bidPrice': '1.2344', 'askPrice': '1.2346', 'openTime': agora - 86_400_000, 'closeTime': agora,
+        })
+
+    app = web.Application()
+    app.router.add_get('/{prefixo}/{versao}/exchangeInfo', exchange_info)
+    app.router.add_get('/api/v3/ticker/24hr', ticker)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', porta)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+def _percentis(amostras):
+    ordenadas = sorted(amostras)
+    p99 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.99))]
+    return statistics.median(ordenadas) * 1000, p99 * 1000
+
+async def benchmark(comandos=200, quantidade=2000):
+    """Latência de um comando /price antes (exchange nova por comando) e depois (exchange compartilhada)."""
+    global URL_API
+    runner, url = await servidor_falso(quantidade=quantidade)
+    # Sem o cache de mercados do disco: o "depois" também paga o primeiro load_markets
+    caminho_original = cache_mercados.caminho
+    cache_mercados.caminho = os.path.join(tempfile.mkdtemp(), "mercados.pickle")
+    URL_API = url
+    try:
+        antes = []
+        for i in range(comandos):
+            inicio = time.perf_counter()
+            exchange = ccxt.binance({'enableRateLimit': False})
+            apontar_urls(exchange, url)
+            await exchange.load_markets()
+            await exchange.fetch_ticker(f"C{i % quantidade:04d}/USDT")
+            await exchange.close()
+            antes.append(time.perf_counter() - inicio)
+
+        depois = []
+        for i in range(comandos):
+            inicio = time.perf_counter()
+            exchange = await get_exchange()
+            await exchange.fetch_ticker(f"C{i % quantidade:04d}/USDT")
+            depois.append(time.perf_counter() - inicio)
+        await close_exchange()
+    finally:
+        URL_API = getenv("BINANCE_REST_URL")
+        cache_mercados.caminho = caminho_original
+        await runner.cleanup()
+
+    print(f"{comandos} comandos, {quantidade} mercados, {LATENCIA_FALSA * 1000:.0f} ms por requisição "
+          f"+ {HANDSHAKE_FALSO * 1000:.0f} ms por conexão nova")
+    for nome, amostras in (("exchange por comando", antes), ("exchange compartilhada", depois)):
+        p50, p99 = _percentis(amostras)
+        print(f"{nome:24s} p50 {p50:8.1f} ms   p99 {p99:8.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da exchange compartilhada contra uma exchange falsa local")
+    parser.add_argument("--comandos", type=int, default=200)
+    parser.add_argument("--mercados", type=int, default=2000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(benchmark(args.comandos, args.mercados))
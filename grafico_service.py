@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor
+from cache_async import CacheAssincrono
+
+# Configurações do serviço de gráficos
+WORKERS_GRAFICO = 2                  # Processos que renderizam gráficos
+CACHE_GRAFICOS_BYTES = 20 * 1024**2  # Tamanho máximo do cache de PNGs (20 MB)
+TTL_GRAFICOS = 300                   # Tempo de vida de um PNG no cache (5 minutos)
+TTL_GRAFICOS_OBSOLETOS = 900         # Depois disso ainda é servido enquanto um novo é gerado
+
+# Cache de PNGs prontos; o tamanho de cada entrada é o tamanho do PNG em bytes
+cache_graficos = CacheAssincrono(
+    "graficos", maxsize=CACHE_GRAFICOS_BYTES, ttl=TTL_GRAFICOS,
+    ttl_obsoleto=TTL_GRAFICOS_OBSOLETOS, getsizeof=len,
+)
+
+_pool = None
+
+# ----- Código executado dentro dos processos de renderização -----
+
+_figura = None
+
+def _iniciar_worker():
+    """Cria uma figura Agg por processo, reaproveitada em todos os gráficos."""
+    global _figura
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    _figura = Figure(figsize=(10, 5))
+    FigureCanvasAgg(_figura)
+
+def _renderizar(symbol, timeframe, precos):
+    """Desenha o gráfico de preços e devolve o PNG em bytes."""
+    _figura.clear()
+    ax = _figura.add_subplot()
+    ax.plot(precos, label='Price')
+    ax.set_title(f"{symbol} Price Chart ({timeframe})")
+    ax.set_xlabel("Time")
+    ax.set_ylabel("Price (USDT)")
+    ax.legend()
+    buf = io.BytesIO()
+    _figura.savefig(buf, format='png')
+    return buf.getvalue()
+
+# ----- API usada pelo bot -----
+
+def _obter_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=WORKERS_GRAFICO, initializer=_iniciar_worker)
+    return _pool
+
+async def renderizar_grafico(symbol, timeframe, precos):
+    """Renderiza o gráfico fora do event loop e devolve o PNG (bytes).
+
+    O cache fica com quem chama (cache_graficos.obter), que também junta
+    pedidos simultâneos do mesmo gráfico numa única renderização.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_obter_pool(), _renderizar, symbol, timeframe, list(precos))
+
+def encerrar():
+    """Encerra os processos de renderização."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+# ----- Benchmark -----
+
+def _renderizar_no_loop(symbol, timeframe, precos):
+    """Como o bot fazia antes: pyplot global, dentro do event loop."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(10, 5))
+    plt.plot(precos, label='Price')
+    plt.title(f"{symbol} Price Chart ({timeframe})")
+    plt.xlabel("Time")
+    plt.ylabel("Price (USDT)")
+    plt.legend()
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png')
+    plt.close()
+    return buf.getvalue()
+
+async def _medir_travamento(parar, intervalo=0.01):
+    """Maior atraso de um sleep(intervalo): quanto tempo um /price teria esperado o event loop."""
+    pior = 0.0
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(intervalo)
+        pior = max(pior, time.perf_counter() - inicio - intervalo)
+    return pior
+
+async def benchmark(graficos=40, candles=100):
+    """Renderizações por segundo e pior travamento do event loop, no loop x no pool de processos."""
+    precos = [[100 + (i * 7 + j) % 13 for j in range(candles)] for i in range(graficos)]
+
+    async def no_loop():
+        for i, serie in enumerate(precos):
+            _renderizar_no_loop(f"S{i}/USDT", "1h", serie)
+            await asyncio.sleep(0)  # Os handlers cediam o loop entre um comando e outro
+
+    async def no_pool():
+        await asyncio.gather(*(renderizar_grafico(f"S{i}/USDT", "1h", serie) for i, serie in enumerate(precos)))
+
+    # Aquece o pool (início dos processos e import do matplotlib) fora da medição
+    await renderizar_grafico("AQUECIMENTO", "1h", precos[0])
+    print(f"{graficos} gráficos de {candles} candles, {WORKERS_GRAFICO} processos de renderização")
+    for nome, executar in (("no event loop", no_loop), ("pool de processos", no_pool)):
+        parar = asyncio.Event()
+        medicao = asyncio.create_task(_medir_travamento(parar))
+        inicio = time.perf_counter()
+        await executar()
+        duracao = time.perf_counter() - inicio
+        parar.set()
+        travamento = await medicao
+        print(f"{nome:18s} {graficos / duracao:7.1f} gráficos/s   pior travamento do loop {travamento * 1000:7.1f} ms")
+    encerrar()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do serviço de gráficos")
+    parser.add_argument("--graficos", type=int, default=40)
+    parser.add_argument("--candles", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.graficos, args.candles))
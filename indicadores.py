@@ -0,0 +1,201 @@
+import argparse
+import time
+import numpy as np
+
+# Indicadores técnicos vetorizados.
+#
+# Todas as funções recebem uma matriz de preços de fechamento com formato
+# (símbolos x candles), do candle mais antigo para o mais recente, e calculam
+# o indicador para todos os símbolos de uma vez. Um vetor 1-D é tratado como
+# uma matriz de uma linha. As posições sem dados suficientes ficam com NaN.
+
+def _matriz(precos):
+    return np.atleast_2d(np.asarray(precos, dtype=np.float64))
+
+# Média móvel simples
+def sma(precos, periodo):
+    """Calcula a SMA de cada linha usando soma acumulada."""
+    m = _matriz(precos)
+    saida = np.full(m.shape, np.nan)
+    if m.shape[1] < periodo:
+        return saida
+    acumulado = np.zeros((m.shape[0], m.shape[1] + 1))
+    np.cumsum(m, axis=1, out=acumulado[:, 1:])
+    saida[:, periodo - 1:] = (acumulado[:, periodo:] - acumulado[:, :-periodo]) / periodo
+    return saida
+
+# Média móvel exponencial
+def ema(precos, periodo, inicio=0):
+    """Calcula a EMA de cada linha a partir da coluna `inicio`.
+
+    A EMA é iniciada com a SMA dos primeiros `periodo` valores, como é usual
+    nas plataformas de gráficos. O laço percorre apenas os candles; cada passo
+    atualiza todos os símbolos de uma vez.
+    """
+    m = _matriz(precos)
+    saida = np.full(m.shape, np.nan)
+    if m.shape[1] - inicio < periodo:
+        return saida
+    alfa = 2.0 / (periodo + 1)
+    valor = m[:, inicio:inicio + periodo].mean(axis=1)
+    saida[:, inicio + periodo - 1] = valor
+    for i in range(inicio + periodo, m.shape[1]):
+        valor = valor + alfa * (m[:, i] - valor)
+        saida[:, i] = valor
+    return saida
+
+def _rsi(media_ganhos, media_perdas):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = media_ganhos / media_perdas
+        rsi = 100 - (100 / (1 + rs))
+    return np.where(media_perdas == 0, 100.0, rsi)
+
+# Índice de força relativa com a suavização de Wilder
+def rsi(precos, periodo=14):
+    """Calcula o RSI de Wilder de cada linha."""
+    m = _matriz(precos)
+    saida = np.full(m.shape, np.nan)
+    deltas = np.diff(m, axis=1)
+    if deltas.shape[1] < periodo:
+        return saida
+    ganhos = np.clip(deltas, 0, None)
+    perdas = np.clip(-deltas, 0, None)
+    media_ganhos = ganhos[:, :periodo].mean(axis=1)
+    media_perdas = perdas[:, :periodo].mean(axis=1)
+    saida[:, periodo] = _rsi(media_ganhos, media_perdas)
+    for i in range(periodo, deltas.shape[1]):
+        media_ganhos = (media_ganhos * (periodo - 1) + ganhos[:, i]) / periodo
+        media_perdas = (media_perdas * (periodo - 1) + perdas[:, i]) / periodo
+        saida[:, i + 1] = _rsi(media_ganhos, media_perdas)
+    return saida
+
+# MACD com linha de sinal
+def macd(precos, periodo_curto=12, periodo_longo=26, periodo_sinal=9):
+    """Calcula a linha MACD (EMA curta - EMA longa) e a linha de sinal (EMA do MACD)."""
+    m = _matriz(precos)
+    linha_macd = ema(m, periodo_curto) - ema(m, periodo_longo)
+    sinal = ema(np.nan_to_num(linha_macd), periodo_sinal, inicio=periodo_longo - 1)
+    return linha_macd, sinal
+
+# Classifica a tendência de todos os símbolos de uma vez
+def classificar_tendencias(precos, short_period=9, long_period=21, rsi_period=14):
+    """Retorna um array com "uptrend", "downtrend" ou "neutral" para cada linha.
+
+    Usa o último valor de cada indicador: SMA curta x SMA longa, MACD x sinal
+    e RSI acima ou abaixo de 50. Linhas sem candles suficientes ficam "neutral".
+    """
+    m = _matriz(precos)
+    sma_curta = sma(m, short_period)[:, -1]
+    sma_longa = sma(m, long_period)[:, -1]
+    rsi_atual = rsi(m, rsi_period)[:, -1]
+    linha_macd, sinal = macd(m)
+    macd_atual = linha_macd[:, -1]
+    sinal_atual = sinal[:, -1]
+
+    alta = (sma_curta > sma_longa) & (macd_atual > sinal_atual) & (rsi_atual > 50)
+    baixa = (sma_curta < sma_longa) & (macd_atual < sinal_atual) & (rsi_atual < 50)
+    return np.where(alta, "uptrend", np.where(baixa, "downtrend", "neutral")).astype(object)
+
+# ----- Referência, paridade e benchmark -----
+
+# Implementações diretas, candle a candle e símbolo a símbolo, com listas do
+# Python: a definição de cada indicador sem nenhuma vetorização. `verificar`
+# compara o motor com elas; `benchmark` mede as duas.
+
+def _sma_referencia(serie, periodo):
+    return [float('nan')] * (periodo - 1) + [
+        sum(serie[i - periodo + 1:i + 1]) / periodo for i in range(periodo - 1, len(serie))
+    ]
+
+def _ema_referencia(serie, periodo, inicio=0):
+    saida = [float('nan')] * len(serie)
+    if len(serie) - inicio < periodo:
+        return saida
+    alfa = 2.0 / (periodo + 1)
+    valor = sum(serie[inicio:inicio + periodo]) / periodo
+    saida[inicio + periodo - 1] = valor
+    for i in range(inicio + periodo, len(serie)):
+        valor = alfa * serie[i] + (1 - alfa) * valor
+        saida[i] = valor
+    return saida
+
+def _rsi_referencia(serie, periodo=14):
+    saida = [float('nan')] * len(serie)
+    deltas = [serie[i] - serie[i - 1] for i in range(1, len(serie))]
+    if len(deltas) < periodo:
+        return saida
+    ganho = sum(max(d, 0) for d in deltas[:periodo]) / periodo
+    perda = sum(max(-d, 0) for d in deltas[:periodo]) / periodo
+
+    def valor(ganho, perda):
+        return 100.0 if perda == 0 else 100 - 100 / (1 + ganho / perda)
+
+    saida[periodo] = valor(ganho, perda)
+    for i in range(periodo, len(deltas)):
+        ganho = (ganho * (periodo - 1) + max(deltas[i], 0)) / periodo
+        perda = (perda * (periodo - 1) + max(-deltas[i], 0)) / periodo
+        saida[i + 1] = valor(ganho, perda)
+    return saida
+
+def _macd_referencia(serie, periodo_curto=12, periodo_longo=26, periodo_sinal=9):
+    curta = _ema_referencia(serie, periodo_curto)
+    longa = _ema_referencia(serie, periodo_longo)
+    linha = [c - l for c, l in zip(curta, longa)]
+    # O sinal começa no primeiro valor definido do MACD
+    sinal = _ema_referencia([0.0 if v != v else v for v in linha], periodo_sinal, inicio=periodo_longo - 1)
+    return linha, sinal
+
+def _precos_aleatorios(simbolos, candles, semente=7):
+    gerador = np.random.default_rng(semente)
+    retornos = gerador.normal(0, 0.01, (simbolos, candles))
+    precos = 100 * np.exp(np.cumsum(retornos, axis=1))
+    # Alguns trechos sem variação: RSI com perda média zero
+    precos[0, -20:] = precos[0, -21]
+    return precos
+
+def verificar(simbolos=50, candles=120):
+    """Compara o motor vetorizado com as referências; levanta AssertionError na primeira diferença."""
+    precos = _precos_aleatorios(simbolos, candles)
+    linha_macd, sinal = macd(precos)
+    casos = (
+        ("sma 9", sma(precos, 9), lambda serie: _sma_referencia(serie, 9)),
+        ("sma 21", sma(precos, 21), lambda serie: _sma_referencia(serie, 21)),
+        ("ema 12", ema(precos, 12), lambda serie: _ema_referencia(serie, 12)),
+        ("rsi 14", rsi(precos, 14), lambda serie: _rsi_referencia(serie, 14)),
+        ("macd", linha_macd, lambda serie: _macd_referencia(serie)[0]),
+        ("sinal", sinal, lambda serie: _macd_referencia(serie)[1]),
+    )
+    for nome, obtido, referencia in casos:
+        esperado = np.array([referencia(list(linha)) for linha in precos])
+        assert np.allclose(obtido, esperado, rtol=1e-9, atol=1e-9, equal_nan=True), f"{nome} diverge da referência"
+    # Séries curtas demais: tudo NaN, sem erro
+    assert np.isnan(rsi(precos[:, :10])).all() and np.isnan(sma(precos[:, :5], 9)).all()
+    print(f"Paridade ok: {simbolos} símbolos x {candles} candles, {len(casos)} indicadores")
+
+def benchmark(simbolos=500, candles=100, repeticoes=5):
+    """Classificações por segundo: motor vetorizado x referência símbolo a símbolo."""
+    precos = _precos_aleatorios(simbolos, candles)
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        classificar_tendencias(precos)
+    vetorizado = (time.perf_counter() - inicio) / repeticoes
+
+    inicio = time.perf_counter()
+    for linha in precos.tolist():
+        _sma_referencia(linha, 9), _sma_referencia(linha, 21), _rsi_referencia(linha), _macd_referencia(linha)
+    referencia = time.perf_counter() - inicio
+
+    print(f"{simbolos} símbolos x {candles} candles")
+    print(f"vetorizado  {vetorizado * 1000:8.2f} ms  ({simbolos / vetorizado:,.0f} símbolos/s)")
+    print(f"referência  {referencia * 1000:8.2f} ms  ({simbolos / referencia:,.0f} símbolos/s)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Paridade e desempenho dos indicadores")
+    parser.add_argument("comando", choices=("verificar", "benchmark"))
+    parser.add_argument("--simbolos", type=int, default=500)
+    parser.add_argument("--candles", type=int, default=100)
+    args = parser.parse_args()
+    if args.comando == "verificar":
+        verificar()
+    else:
+        benchmark(args.simbolos, args.candles)
@@ -0,0 +1,205 @@
+from collections import deque
+
+# Indicadores técnicos incrementais.
+#
+# Cada objeto recebe um preço de fechamento por vez em `atualizar` e ajusta o
+# valor do indicador em tempo constante, sem recalcular o histórico. Os
+# valores coincidem com os de indicadores.py para a mesma sequência de preços.
+# `snapshot` devolve um dicionário simples (serializável em JSON) e
+# `restaurar` volta o objeto exatamente para aquele estado.
+
+class SMAIncremental:
+    """Média móvel simples com janela deslizante e soma acumulada."""
+
+    def __init__(self, periodo):
+        self.periodo = periodo
+        self.janela = deque(maxlen=periodo)
+        self.soma = 0.0
+
+    def atualizar(self, preco):
+        if len(self.janela) == self.periodo:
+            self.soma -= self.janela[0]
+        self.janela.append(preco)
+        self.soma += preco
+        return self.valor
+
+    @property
+    def valor(self):
+        if len(self.janela) < self.periodo:
+            return None
+        return self.soma / self.periodo
+
+    def snapshot(self):
+        return {'periodo': self.periodo, 'janela': list(self.janela)}
+
+    def restaurar(self, estado):
+        self.periodo = estado['periodo']
+        self.janela = deque(estado['janela'], maxlen=self.periodo)
+        self.soma = sum(self.janela)
+        return self
+
+class EMAIncremental:
+    """Média móvel exponencial iniciada pela SMA dos primeiros `periodo` preços."""
+
+    def __init__(self, periodo):
+        self.periodo = periodo
+        self.alfa = 2.0 / (periodo + 1)
+        self.contagem = 0
+        self.soma_inicial = 0.0
+        self.ema = None
+
+    def atualizar(self, preco):
+        self.contagem += 1
+        if self.ema is None:
+            self.soma_inicial += preco
+            if self.contagem == self.periodo:
+                self.ema = self.soma_inicial / self.periodo
+        else:
+            self.ema += self.alfa * (preco - self.ema)
+        return self.ema
+
+    @property
+    def valor(self):
+        return self.ema
+
+    def snapshot(self):
+        return {'periodo': self.periodo, 'contagem': self.contagem,
+                'soma_inicial': self.soma_inicial, 'ema': self.ema}
+
+    def restaurar(self, estado):
+        self.__init__(estado['periodo'])
+        self.contagem = estado['contagem']
+        self.soma_inicial = estado['soma_inicial']
+        self.ema = estado['ema']
+        return self
+
+class RSIIncremental:
+    """RSI com a suavização de Wilder."""
+
+    def __init__(self, periodo=14):
+        self.periodo = periodo
+        self.ultimo_preco = None
+        self.contagem = 0
+        self.media_ganhos = 0.0
+        self.media_perdas = 0.0
+
+    def atualizar(self, preco):
+        if self.ultimo_preco is not None:
+            delta = preco - self.ultimo_preco
+            ganho = delta if delta > 0 else 0.0
+            perda = -delta if delta < 0 else 0.0
+            self.contagem += 1
+            if self.contagem <= self.periodo:
+                # Fase inicial: média simples dos primeiros `periodo` deltas
+                self.media_ganhos += ganho / self.periodo
+                self.media_perdas += perda / self.periodo
+            else:
+                self.media_ganhos = (self.media_ganhos * (self.periodo - 1) + ganho) / self.periodo
+                self.media_perdas = (self.media_perdas * (self.periodo - 1) + perda) / self.periodo
+        self.ultimo_preco = preco
+        return self.valor
+
+    @property
+    def valor(self):
+        if self.contagem < self.periodo:
+            return None
+        if self.media_perdas == 0:
+            return 100.0
+        rs = self.media_ganhos / self.media_perdas
+        return 100 - (100 / (1 + rs))
+
+    def snapshot(self):
+        return {'periodo': self.periodo, 'ultimo_preco': self.ultimo_preco, 'contagem': self.contagem,
+                'media_ganhos': self.media_ganhos, 'media_perdas': self.media_perdas}
+
+    def restaurar(self, estado):
+        self.periodo = estado['periodo']
+        self.ultimo_preco = estado['ultimo_preco']
+        self.contagem = estado['contagem']
+        self.media_ganhos = estado['media_ganhos']
+        self.media_perdas = estado['media_perdas']
+        return self
+
+class MACDIncremental:
+    """MACD (EMA curta - EMA longa) com linha de sinal (EMA do MACD)."""
+
+    def __init__(self, periodo_curto=12, periodo_longo=26, periodo_sinal=9):
+        self.ema_curta = EMAIncremental(periodo_curto)
+        self.ema_longa = EMAIncremental(periodo_longo)
+        self.ema_sinal = EMAIncremental(periodo_sinal)
+
+    def atualizar(self, preco):
+        self.ema_curta.atualizar(preco)
+        self.ema_longa.atualizar(preco)
+        macd = self.macd
+        if macd is not None:
+            self.ema_sinal.atualizar(macd)
+        return self.valor
+
+    @property
+    def macd(self):
+        if self.ema_curta.valor is None or self.ema_longa.valor is None:
+            return None
+        return self.ema_curta.valor - self.ema_longa.valor
+
+    @property
+    def valor(self):
+        """Retorna (macd, sinal); cada um é None enquanto não houver dados suficientes."""
+        return self.macd, self.ema_sinal.valor
+
+    def snapshot(self):
+        return {'curta': self.ema_curta.snapshot(), 'longa': self.ema_longa.snapshot(),
+                'sinal': self.ema_sinal.snapshot()}
+
+    def restaurar(self, estado):
+        self.ema_curta.restaurar(estado['curta'])
+        self.ema_longa.restaurar(estado['longa'])
+        self.ema_sinal.restaurar(estado['sinal'])
+        return self
+
+class EstadoTendencia:
+    """Agrupa SMA curta/longa, RSI e MACD de uma série (símbolo, timeframe)."""
+
+    def __init__(self, short_period=9, long_period=21, rsi_period=14):
+        self.sma_curta = SMAIncremental(short_period)
+        self.sma_longa = SMAIncremental(long_period)
+        self.rsi = RSIIncremental(rsi_period)
+        self.macd = MACDIncremental()
+
+    def atualizar(self, preco):
+        """Aplica um candle fechado."""
+        self.sma_curta.atualizar(preco)
+        self.sma_longa.atualizar(preco)
+        self.rsi.atualizar(preco)
+        self.macd.atualizar(preco)
+
+    def tendencia(self):
+        """Retorna "uptrend", "downtrend" ou "neutral" com os valores atuais."""
+        sma_curta, sma_longa, rsi = self.sma_curta.valor, self.sma_longa.valor, self.rsi.valor
+        macd, sinal = self.macd.valor
+        if None in (sma_curta, sma_longa, rsi, macd, sinal):
+            return "neutral"
+        if sma_curta > sma_longa and macd > sinal and rsi > 50:
+            return "uptrend"
+        if sma_curta < sma_longa and macd < sinal and rsi < 50:
+            return "downtrend"
+        return "neutral"
+
+    def espiar(self, preco):
+        """Retorna a tendência incluindo um candle ainda aberto, sem alterar o estado."""
+        estado = self.snapshot()
+        self.atualizar(preco)
+        tendencia = self.tendencia()
+        self.restaurar(estado)
+        return tendencia
+
+    def snapshot(self):
+        return {'sma_curta': self.sma_curta.snapshot(), 'sma_longa': self.sma_longa.snapshot(),
+                'rsi': self.rsi.snapshot(), 'macd': self.macd.snapshot()}
+
+    def restaurar(self, estado):
+        self.sma_curta.restaurar(estado['sma_curta'])
+        self.sma_longa.restaurar(estado['sma_longa'])
+        self.rsi.restaurar(estado['rsi'])
+        self.macd.restaurar(estado['macd'])
+        return self
@@ -0,0 +1,275 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import weakref
+from os import getenv
+import aiohttp
+import numpy as np
+from candle_store import SerieCandles
+import metricas
+
+# Candles em tempo real pelos streams de kline da Binance.
+#
+# Em vez de perguntar à API REST a cada minuto, os símbolos monitorados são
+# assinados em streams combinados (<símbolo>@kline_1m, <símbolo>@kline_15m).
+# Cada mensagem atualiza o candle aberto da série em memória (SerieCandles),
+# e quando um candle fecha o callback `ao_fechar(symbol, timeframe)` é chamado
+# na hora. A API REST só é usada para preencher as séries ao assinar um
+# símbolo novo ou depois de uma reconexão.
+#
+# Para testes, `gravar` salva as mensagens recebidas num arquivo JSONL e
+# `replay` serve esse arquivo num WebSocket local com o mesmo formato da
+# Binance (BINANCE_WS_URL=ws://127.0.0.1:8765).
+
+WS_URL = getenv("BINANCE_WS_URL", "wss://stream.binance.com:9443")
+TIMEFRAMES = ('1m', '15m')
+STREAMS_POR_CONEXAO = 200  # A Binance aceita até 1024 streams por conexão
+CAPACIDADE = 16            # Candles guardados por série
+CONCORRENCIA_SEMENTE = 8   # Séries preenchidas pela API REST ao mesmo tempo
+
+_streams = weakref.WeakSet()  # Instâncias vivas, lidas na coleta das métricas
+
+def nome_stream(symbol, timeframe):
+    """'BTC/USDT', '1m' -> 'btcusdt@kline_1m'."""
+    return f"{symbol.replace('/', '').lower()}@kline_{timeframe}"
+
+def candle_kline(k):
+    """Converte o campo 'k' de uma mensagem de kline para [timestamp, open, high, low, close, volume]."""
+    return [k['t'], float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v'])]
+
+class StreamKlines:
+    """Séries de candles de vários símbolos mantidas pelos streams de kline.
+
+    `ao_fechar(symbol, timeframe)` é chamado (dentro do event loop) a cada
+    candle fechado, com a série já atualizada; deve ser rápido.
+    """
+
+    def __init__(self, timeframes=TIMEFRAMES, ao_fechar=None, ws_url=WS_URL,
+                 capacidade=CAPACIDADE, gravacao=None):
+        self.timeframes = timeframes
+        self.ao_fechar = ao_fechar
+        self.ws_url = ws_url
+        self.capacidade = capacidade
+        self.gravacao = open(gravacao, "a") if gravacao else None
+        self.series = {}   # (symbol, timeframe) -> SerieCandles
+        self.nomes = {}    # 'BTCUSDT' -> 'BTC/USDT'
+        self.fechados = {}  # (symbol, timeframe) -> abertura do último candle fechado já avisado
+        self.symbols = []
+        self.exchange = None
+        self.conexoes = []
+        self.session = None
+        self.metricas = {
+            'mensagens': 0,
+            'fechamentos': 0,
+            'reconexoes': 0,
+            'sementes': 0,
+            'atraso_ms': 0,
+            'atraso_max_ms': 0,
+        }
+        _streams.add(self)
+
+    def ultimos(self, symbol, timeframe, n):
+        """View (n x 6) dos últimos `n` candles, como CandleStore.obter."""
+        serie = self.series.get((symbol, timeframe))
+        if serie is None:
+            return np.zeros((0, 6))
+        return serie.ultimos(n)
+
+    async def atualizar_simbolos(self, symbols, exchange=None):
+        """Passa a acompanhar `symbols`; as conexões só são refeitas se a lista mudou.
+
+        Com `exchange`, as séries dos símbolos novos são preenchidas pela API
+        REST antes da assinatura; sem ela, começam vazias e se formam pelo stream.
+        """
+        if set(symbols) == set(self.symbols) and self.conexoes:
+            return
+        self.exchange = exchange
+        anteriores = set(self.symbols)
+        self.symbols = list(symbols)
+        self.nomes = {symbol.replace('/', ''): symbol for symbol in self.symbols}
+        self.series = {chave: serie for chave, serie in self.series.items() if chave[0] in self.nomes.values()}
+        for symbol in self.symbols:
+            for timeframe in self.timeframes:
+                self.series.setdefault((symbol, timeframe), SerieCandles(self.capacidade))
+        await self._semear([symbol for symbol in self.symbols if symbol not in anteriores])
+
+        await self._parar_conexoes()
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        streams = [nome_stream(symbol, timeframe) for symbol in self.symbols for timeframe in self.timeframes]
+        grupos = [streams[i:i + STREAMS_POR_CONEXAO] for i in range(0, len(streams), STREAMS_POR_CONEXAO)]
+        self.conexoes = [asyncio.create_task(self._conexao(grupo)) for grupo in grupos]
+        logging.info(f"Streams de kline: {len(self.symbols)} símbolos em {len(grupos)} conexões")
+
+    async def _semear(self, symbols):
+        """Preenche as séries pela API REST (assinatura nova ou reconexão)."""
+        if self.exchange is None or not symbols:
+            return
+        semaforo = asyncio.Semaphore(CONCORRENCIA_SEMENTE)
+
+        async def semear(symbol, timeframe):
+            async with semaforo:
+                try:
+                    candles = await self.exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=self.capacidade)
+                except Exception as e:
+                    logging.error(f"Erro ao preencher {symbol} {timeframe}: {e}")
+                    return
+                serie = self.series.get((symbol, timeframe))
+                if serie is not None:
+                    serie.adicionar(candles)
+                    self.metricas['sementes'] += 1
+
+        await asyncio.gather(*(semear(symbol, timeframe) for symbol in symbols for timeframe in self.timeframes))
+
+    async def _parar_conexoes(self):
+        for tarefa in self.conexoes:
+            tarefa.cancel()
+        await asyncio.gather(*self.conexoes, return_exceptions=True)
+        self.conexoes = []
+
+    # ----- Recepção -----
+
+    async def _conexao(self, streams):
+        url = f"{self.ws_url}/stream?streams={'/'.join(streams)}"
+        symbols = sorted({self.nomes[stream.split('@')[0].upper()] for stream in streams})
+        tentativa = 0
+        while True:
+            try:
+                async with self.session.ws_connect(url, heartbeat=60) as ws:
+                    if tentativa:
+                        # Candles que fecharam enquanto a conexão estava caída
+                        await self._semear(symbols)
+                    tentativa = 0
+                    async for mensagem in ws:
+                        if mensagem.type != aiohttp.WSMsgType.TEXT:
+                            break
+                        self._processar(json.loads(mensagem.data))
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+                logging.error(f"Erro na conexão WebSocket de klines: {e}")
+            # Reconecta com espera exponencial e um pouco de aleatoriedade
+            tentativa += 1
+            self.metricas['reconexoes'] += 1
+            espera = min(2 ** tentativa, 60) * (0.5 + random.random() / 2)
+            logging.warning(f"Conexão WebSocket de klines encerrada, reconectando em {espera:.1f}s")
+            await asyncio.sleep(espera)
+
+    def _processar(self, mensagem):
+        if self.gravacao:
+            self.gravacao.write(json.dumps(mensagem) + "\n")
+        msg = mensagem['data']
+        self.metricas['mensagens'] += 1
+        atraso = int(time.time() * 1000) - msg['E']
+        self.metricas['atraso_ms'] = atraso
+        self.metricas['atraso_max_ms'] = max(self.metricas['atraso_max_ms'], atraso)
+
+        k = msg['k']
+        symbol = self.nomes.get(msg['s'])
+        serie = self.series.get((symbol, k['i']))
+        if serie is None:
+            return  # Símbolo que acabou de sair da lista
+        serie.adicionar([candle_kline(k)])
+        # Fechamentos repetidos (reconexão, replay) ou atrasados não são avisados de novo
+        if k['x'] and k['t'] == serie.ultimo_timestamp and k['t'] > self.fechados.get((symbol, k['i']), -1):
+            self.fechados[(symbol, k['i'])] = k['t']
+            self.metricas['fechamentos'] += 1
+            if self.ao_fechar:
+                try:
+                    self.ao_fechar(symbol, k['i'])
+                except Exception as e:
+                    logging.error(f"Erro ao processar fechamento de {symbol} {k['i']}: {e}")
+
+    async def encerrar(self):
+        await self._parar_conexoes()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.gravacao:
+            self.gravacao.close()
+            self.gravacao = None
+
+# ----- Métricas -----
+
+metricas.coletada("kline_eventos_total", "Mensagens, fechamentos, reconexões e séries preenchidas", "counter", ("evento",),
+                  lambda: [((evento,), sum(stream.metricas[evento] for stream in list(_streams)))
+                           for evento in ('mensagens', 'fechamentos', 'reconexoes', 'sementes')])
+metricas.coletada("kline_atraso_segundos", "Atraso da última mensagem de kline em relação ao evento", "gauge", (),
+                  lambda: [((), max(stream.metricas['atraso_ms'] for stream in list(_streams)) / 1000)] if _streams else [])
+metricas.coletada("kline_simbolos", "Símbolos acompanhados pelos streams de kline", "gauge", (),
+                  lambda: [((), sum(len(stream.symbols) for stream in list(_streams)))])
+
+# ----- Gravação e replay -----
+
+async def gravar(symbols, arquivo, minutos, timeframes=TIMEFRAMES):
+    """Grava `minutos` de mensagens de kline dos símbolos num arquivo JSONL."""
+    stream = StreamKlines(timeframes, gravacao=arquivo)
+    await stream.atualizar_simbolos(symbols)
+    try:
+        await asyncio.sleep(minutos * 60)
+    finally:
+        await stream.encerrar()
+    logging.info(f"Gravadas {stream.metricas['mensagens']} mensagens em {arquivo}")
+
+async def servidor_replay(arquivo, host="127.0.0.1", porta=8765, velocidade=1.0):
+    """Serve um arquivo gravado em /stream?streams=..., como a Binance.
+
+    Cada conexão recebe as mensagens dos streams pedidos, com os intervalos
+    originais divididos por `velocidade` (0 envia tudo de uma vez). O tempo
+    do evento ('E') é trocado pelo instante do envio, para que o atraso
+    medido pelo cliente seja o do próprio replay. Retorna o AppRunner.
+    """
+    from aiohttp import web
+
+    with open(arquivo) as entrada:
+        mensagens = [json.loads(linha) for linha in entrada if linha.strip()]
+
+    async def stream(request):
+        pedidos = set(request.query.get('streams', '').split('/'))
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        anterior = None
+        for mensagem in mensagens:
+            if mensagem['stream'] not in pedidos:
+                continue
+            evento = mensagem['data']['E']
+            if anterior is not None and velocidade:
+                await asyncio.sleep(max(0.0, (evento - anterior) / 1000 / velocidade))
+            anterior = evento
+            await ws.send_str(json.dumps({**mensagem, 'data': {**mensagem['data'], 'E': int(time.time() * 1000)}}))
+        await ws.close()
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/stream', stream)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, porta).start()
+    logging.info(f"Replay de {len(mensagens)} mensagens em ws://{host}:{porta}")
+    return runner
+
+async def _replay_ate_interromper(arquivo, porta, velocidade):
+    runner = await servidor_replay(arquivo, porta=porta, velocidade=velocidade)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Gravação e replay dos streams de kline")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    p_gravar = comandos.add_parser("gravar", help="Grava mensagens da Binance num arquivo JSONL")
+    p_gravar.add_argument("arquivo")
+    p_gravar.add_argument("--simbolos", required=True, help="Ex.: BTC/USDT,ETH/USDT")
+    p_gravar.add_argument("--minutos", type=float, default=20)
+    p_replay = comandos.add_parser("replay", help="Serve um arquivo gravado num WebSocket local")
+    p_replay.add_argument("arquivo")
+    p_replay.add_argument("--porta", type=int, default=8765)
+    p_replay.add_argument("--velocidade", type=float, default=1.0)
+    args = parser.parse_args()
+    if args.comando == "gravar":
+        asyncio.run(gravar(args.simbolos.split(","), args.arquivo, args.minutos))
+    else:
+        asyncio.run(_replay_ate_interromper(args.arquivo, args.porta, args.velocidade))
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+from os import getenv
+import ccxt.async_support as ccxt
+import metricas
+
+try:
+    import fcntl
+except ImportError:  # Windows: o limite vale só dentro do processo
+    fcntl = None
+
+# Limitador global de peso das chamadas REST à Binance.
+#
+# A Binance limita o peso das requisições por IP e por minuto (6000 no spot)
+# e devolve o peso já usado em X-MBX-USED-WEIGHT-1M. Todos os processos do
+# host dividem um único balde de fichas guardado num arquivo pequeno protegido
+# por fcntl.flock: cada chamada retira o peso do seu endpoint, o balde se
+# recarrega continuamente e é corrigido para baixo pelo peso informado nas
+# respostas. Um 429/418 bloqueia todos os processos até o Retry-After.
+#
+# Chamadas em segundo plano (varreduras dos monitores) não usam a reserva do
+# balde, que fica para os comandos interativos do bot.
+
+PESO_MINUTO = int(getenv("BINANCE_PESO_MINUTO", 6000))  # Limite de peso por minuto da Binance
+MARGEM = 0.8             # Usa no máximo 80% do limite
+RESERVA_INTERATIVA = 0.25  # Fração do balde que só as chamadas interativas podem usar
+ESPERA_TRAVA = 0.002     # Pausa entre tentativas quando outro processo está com o arquivo travado
+ARQUIVO_ESTADO = getenv("BINANCE_LIMITE_ARQUIVO", os.path.join(tempfile.gettempdir(), "cryptobot_binance_peso.bin"))
+
+INTERATIVA = "interativa"
+FUNDO = "fundo"
+
+# Pesos dos endpoints usados pelo projeto (API spot v3)
+PESOS_ENDPOINT = {
+    'klines': 2,
+    'uiKlines': 2,
+    'aggTrades': 2,
+    'trades': 25,
+    'historicalTrades': 25,
+    'exchangeInfo': 20,
+    'ticker/price': 2,
+    'ticker/bookTicker': 2,
+    'avgPrice': 2,
+    'time': 1,
+    'ping': 1,
+}
+
+def peso_endpoint(caminho, params=None):
+    """Peso de uma chamada, pelo caminho (com ou sem /api/v3/) e pelos parâmetros."""
+    params = params or {}
+    caminho = caminho.split('/api/v3/', 1)[-1].strip('/')
+    if caminho == 'ticker/24hr':
+        return 2 if 'symbol' in params else 80
+    if caminho == 'depth':
+        limite = int(params.get('limit', 100))
+        return 5 if limite <= 100 else 25 if limite <= 500 else 50 if limite <= 1000 else 250
+    return PESOS_ENDPOINT.get(caminho, 1)
+
+_prioridade = ContextVar('prioridade_binance', default=None)
+_prioridade_padrao = FUNDO
+
+def definir_prioridade_padrao(prioridade):
+    """Prioridade das chamadas do processo (o bot usa INTERATIVA, os monitores FUNDO)."""
+    global _prioridade_padrao
+    _prioridade_padrao = prioridade
+
+def prioridade_atual():
+    return _prioridade.get() or _prioridade_padrao
+
+class com_prioridade:
+    """Define a prioridade das chamadas dentro de um bloco `with`."""
+
+    def __init__(self, valor):
+        self.valor = valor
+
+    def __enter__(self):
+        self.token = _prioridade.set(self.valor)
+
+    def __exit__(self, *_):
+        _prioridade.reset(self.token)
+
+class LimitadorPeso:
+    """Balde de fichas de peso compartilhado entre processos."""
+
+    _ESTADO = struct.Struct('<ddd')  # fichas, último abastecimento, bloqueado até
+
+    def __init__(self, peso_minuto=PESO_MINUTO, margem=MARGEM, caminho=ARQUIVO_ESTADO):
+        self.peso_minuto = peso_minuto
+        self.margem = margem
+        self.capacidade = peso_minuto * margem
+        self.taxa = self.capacidade / 60  # fichas por segundo
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.fd = None
+        self.local = [self.capacidade, time.time(), 0.0]  # Usado quando não há fcntl
+        # Correções recebidas com o arquivo ocupado, aplicadas na próxima transação
+        self.pendente_usado = None
+        self.pendente_bloqueio = 0.0
+        self.metricas = {'chamadas': 0, 'peso': 0, 'esperas': 0, 'tempo_espera': 0.0, 'bloqueios': 0}
+
+    # ----- Estado compartilhado -----
+
+    def _abrir(self):
+        if self.fd is None and fcntl is not None:
+            self.fd = os.open(self.caminho, os.O_RDWR | os.O_CREAT, 0o600)
+        return self.fd
+
+    def _transacao(self, alterar, esperar=True):
+        """Lê o estado, aplica `alterar(estado)` e grava, com o arquivo travado.
+
+        Com esperar=False (chamadas de dentro do event loop) nunca bloqueia:
+        se a trava estiver com outra thread ou processo, levanta BlockingIOError
+        e quem chamou tenta de novo depois de um asyncio.sleep.
+        """
+        if not self.lock.acquire(blocking=esperar):
+            raise BlockingIOError("limitador ocupado")
+        try:
+            fd = self._abrir()
+            if fd is None:
+                self._aplicar_pendentes(self.local)
+                return alterar(self.local)
+            fcntl.flock(fd, fcntl.LOCK_EX if esperar else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            try:
+                dados = os.pread(fd, self._ESTADO.size, 0)
+                estado = list(self._ESTADO.unpack(dados)) if len(dados) == self._ESTADO.size \
+                    else [self.capacidade, time.time(), 0.0]
+                self._aplicar_pendentes(estado)
+                resultado = alterar(estado)
+                os.pwrite(fd, self._ESTADO.pack(*estado), 0)
+                return resultado
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            self.lock.release()
+
+    def _aplicar_pendentes(self, estado):
+        if self.pendente_usado is not None:
+            estado[0] = min(estado[0], self._fichas_restantes(self.pendente_usado))
+            self.pendente_usado = None
+        if self.pendente_bloqueio:
+            estado[2] = max(estado[2], self.pendente_bloqueio)
+            estado[0] = 0.0
+            self.pendente_bloqueio = 0.0
+
+    def _fichas_restantes(self, usado):
+        # X-MBX-USED-WEIGHT-1M é peso bruto da Binance, o balde já desconta a margem:
+        # o que sobra no minuto (peso_minuto - usado) vale `margem` dele em fichas
+        return (self.peso_minuto - usado) * self.margem
+
+    def _reservar(self, peso, prioridade, esperar=True):
+        minimo = 0 if prioridade == INTERATIVA else self.capacidade * RESERVA_INTERATIVA
+
+        def alterar(estado):
+            agora = time.time()
+            fichas, ultimo, bloqueado_ate = estado
+            fichas = min(self.capacidade, fichas + (agora - ultimo) * self.taxa)
+            estado[0], estado[1] = fichas, agora
+            if bloqueado_ate > agora:
+                return bloqueado_ate - agora
+            if fichas - peso >= minimo:
+                estado[0] = fichas - peso
+                return 0.0
+            return (peso + minimo - fichas) / self.taxa
+
+        return self._transacao(alterar, esperar)
+
+    # ----- API -----
+
+    def adquirir(self, peso=1, prioridade=None):
+        """Espera (bloqueando a thread) até haver peso disponível."""
+        prioridade = prioridade or prioridade_atual()
+        esperado = 0.0
+        while True:
+            espera = self._reservar(peso, prioridade)
+            if espera <= 0:
+                break
+            esperado += espera
+            time.sleep(espera)
+        self._contar(peso, esperado)
+
+    async def adquirir_async(self, peso=1, prioridade=None):
+        """Espera (sem bloquear o event loop) até haver peso disponível."""
+        prioridade = prioridade or prioridade_atual()
+        esperado = 0.0
+        while True:
+            try:
+                espera = self._reservar(peso, prioridade, esperar=False)
+            except BlockingIOError:
+                # Arquivo travado por outro processo: cede o event loop em vez de esperar o flock
+                await asyncio.sleep(ESPERA_TRAVA)
+                continue
+            if espera <= 0:
+                break
+            esperado += espera
+            await asyncio.sleep(espera)
+        self._contar(peso, esperado)
+
+    def _contar(self, peso, esperado):
+        self.metricas['chamadas'] += 1
+        self.metricas['peso'] += peso
+        if esperado:
+            self.metricas['esperas'] += 1
+            self.metricas['tempo_espera'] += esperado
+
+    def registrar_resposta(self, status, headers):
+        """Ajusta o balde pelo peso informado pela Binance e trata 429/418.
+
+        Roda dentro do event loop (após cada resposta), então nunca espera a
+        trava: com o arquivo ocupado, a correção fica guardada e é aplicada na
+        próxima transação deste processo.
+        """
+        usado = headers.get('X-MBX-USED-WEIGHT-1M') or headers.get('x-mbx-used-weight-1m')
+        retry_after = headers.get('Retry-After') or headers.get('retry-after')
+        if status in (418, 429):
+            espera = float(retry_after) if retry_after else 60.0
+            self.bloquear(espera)
+            logging.warning(f"Binance respondeu {status}: chamadas REST suspensas por {espera:.0f}s")
+        if usado is None:
+            return
+
+        usado = float(usado)
+
+        def alterar(estado):
+            # Nunca mais fichas do que o que sobra no minuto segundo a própria Binance
+            estado[0] = min(estado[0], self._fichas_restantes(usado))
+
+        try:
+            self._transacao(alterar, esperar=False)
+        except BlockingIOError:
+            self.pendente_usado = usado if self.pendente_usado is None else max(self.pendente_usado, usado)
+
+    def bloquear(self, segundos):
+        ate = time.time() + segundos
+
+        def alterar(estado):
+            estado[2] = max(estado[2], ate)
+            estado[0] = 0.0
+
+        self.metricas['bloqueios'] += 1
+        try:
+            self._transacao(alterar, esperar=False)
+        except BlockingIOError:
+            self.pendente_bloqueio = max(self.pendente_bloqueio, ate)
+
+limitador = LimitadorPeso()
+
+# ----- Métricas -----
+
+# Latência por endpoint das duas portas de saída REST: o ccxt e o binance_rest
+latencia_rest = metricas.histograma("binance_rest_latencia_segundos", "Latência das chamadas REST à Binance", ("endpoint",))
+
+def nome_endpoint(caminho):
+    """'/api/v3/aggTrades' e 'aggTrades' -> 'aggTrades' (rótulo das métricas)."""
+    return caminho.split('/api/v3/', 1)[-1].strip('/')
+
+metricas.coletada("binance_limitador_total", "Contadores do limitador de peso do processo", "counter", ("evento",),
+                  lambda: [((evento,), valor) for evento, valor in limitador.metricas.items()])
+
+class BinanceLimitada(ccxt.binance):
+    """ccxt.binance que passa todas as chamadas REST pelo limitador global."""
+
+    async def fetch2(self, path, api='public', method='GET', params={}, headers=None, body=None, config={}):
+        peso = PESOS_ENDPOINT.get(path)
+        if peso is None:
+            if path in ('ticker/24hr', 'depth'):
+                peso = peso_endpoint(path, params)
+            else:
+                # Custo do ccxt: 1 unidade = 1/5 do peso da Binance (rateLimit de 50 ms)
+                peso = max(1, round(self.calculate_rate_limiter_cost(api, method, path, params, config) * 5))
+        await limitador.adquirir_async(peso)
+        with latencia_rest.cronometrar(endpoint=path):
+            return await super().fetch2(path, api, method, params, headers, body, config)
+
+    def on_rest_response(self, code, reason, url, method, response_headers, response_body, request_headers, request_body):
+        limitador.registrar_resposta(code, response_headers)
+        return super().on_rest_response(code, reason, url, method, response_headers, response_body,
+                                        request_headers, request_body)
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+
+# Peso de uma chamada /api/v3/klines na Binance (limit <= 100)
+PESO_OHLCV = 2
+
+# Executa a análise de vários símbolos em paralelo, com limites
+async def escanear_simbolos(symbols, analisar, max_concorrencia=10, orcamento_peso=600,
+                            peso_por_simbolo=PESO_OHLCV, timeout=20, on_progresso=None,
+                            intervalo_progresso=1.5):
+    """Executa `analisar(symbol)` para vários símbolos de forma concorrente.
+
+    - `max_concorrencia` limita quantas análises rodam ao mesmo tempo.
+    - `orcamento_peso` limita o peso total de requisições da varredura; os
+      símbolos que não cabem no orçamento são devolvidos em `ignorados`.
+    - `timeout` é o tempo máximo da varredura; o que não terminou a tempo é
+      cancelado e devolvido em `pendentes`.
+    - Os símbolos cuja análise levantou exceção vão para `erros`
+      (symbol -> exceção) e não contam como pendentes.
+    - `on_progresso(concluidos, total, resultados)` é chamado no máximo a cada
+      `intervalo_progresso` segundos com os resultados parciais.
+
+    Os símbolos devem vir em ordem de prioridade (ex.: maior volume primeiro).
+    Retorna um dicionário com `resultados` (symbol -> valor), `pendentes`,
+    `erros`, `ignorados` e `duracao`.
+    """
+    inicio = time.monotonic()
+    max_simbolos = max(0, orcamento_peso // peso_por_simbolo) if peso_por_simbolo else len(symbols)
+    selecionados = list(symbols[:max_simbolos])
+    ignorados = list(symbols[max_simbolos:])
+    if ignorados:
+        logging.warning(f"Orçamento de peso {orcamento_peso} esgotado: {len(ignorados)} símbolos ignorados")
+
+    semaforo = asyncio.Semaphore(max_concorrencia)
+    resultados = {}
+    erros = {}
+
+    async def executar(symbol):
+        # A exceção volta junto com o símbolo, para o log e para `erros`
+        async with semaforo:
+            try:
+                return symbol, await analisar(symbol), None
+            except Exception as e:
+                return symbol, None, e
+
+    tarefas = [asyncio.create_task(executar(symbol)) for symbol in selecionados]
+    pendentes = set(tarefas)
+    prazo = inicio + timeout
+    ultimo_progresso = inicio
+
+    try:
+        while pendentes:
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            concluidas, pendentes = await asyncio.wait(
+                pendentes, timeout=min(restante, intervalo_progresso),
+                return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in concluidas:
+                symbol, valor, erro = tarefa.result()
+                if erro is None:
+                    resultados[symbol] = valor
+                else:
+                    erros[symbol] = erro
+                    logging.error(f"Erro na varredura de {symbol}: {erro}")
+
+            agora = time.monotonic()
+            if on_progresso and pendentes and agora - ultimo_progresso >= intervalo_progresso:
+                ultimo_progresso = agora
+                try:
+                    await on_progresso(len(tarefas) - len(pendentes), len(tarefas), dict(resultados))
+                except Exception as e:
+                    logging.error(f"Erro ao reportar progresso da varredura: {e}")
+    finally:
+        for tarefa in pendentes:
+            tarefa.cancel()
+        # Espera os cancelamentos: nenhuma tarefa sobrevive à varredura
+        await asyncio.gather(*pendentes, return_exceptions=True)
+
+    # Só o que foi cancelado no prazo; a ordem de prioridade é mantida
+    nao_concluidos = [symbol for symbol, tarefa in zip(selecionados, tarefas) if tarefa in pendentes]
+    if pendentes:
+        logging.warning(f"Varredura excedeu {timeout}s: {len(pendentes)} símbolos não concluídos")
+
+    return {
+        'resultados': resultados,
+        'pendentes': nao_concluidos,
+        'erros': erros,
+        'ignorados': ignorados,
+        'duracao': time.monotonic() - inicio,
+    }
@@ -0,0 +1,270 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+import struct
+import time
+from os import getenv
+from types import MappingProxyType
+import metricas
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem eleição entre processos
+    fcntl = None
+
+# Snapshot de mercado compartilhado: os tickers de 24h de todos os símbolos.
+#
+# fetch_tickers baixa e interpreta mais de 2000 mercados a cada chamada. O
+# ServicoSnapshot busca os tickers no máximo uma vez por intervalo, e chamadas
+# simultâneas esperam a mesma requisição em andamento. O resultado é um
+# Snapshot imutável, já ordenado por volume, usado por todos os consumidores.
+#
+# Entre processos, o primeiro monitor que não encontra um servidor passa a
+# servir os snapshots num socket Unix local; os outros leem dele em vez de
+# chamar a Binance. Se o servidor cair, o próximo pedido assume o papel.
+# Quem serve é decidido por uma trava (flock) no arquivo <socket>.lock, que o
+# servidor segura enquanto vive: um cliente só assume quando ninguém escuta
+# no socket e a trava está livre. Uma conexão fechada por um servidor vivo
+# (ex.: o fetch_tickers dele falhou) não troca o servidor.
+
+INTERVALO_SNAPSHOT = 60  # Idade máxima padrão de um snapshot, em segundos
+SOCKET_SNAPSHOT = getenv("MARKET_SNAPSHOT_SOCKET", "/tmp/cryptobot_snapshot.sock")
+STABLECOINS = ("USDT", "BUSD", "USDC", "FDUSD", "TUSD", "DAI")
+CAMPOS_TICKER = ('symbol', 'timestamp', 'high', 'low', 'open', 'close', 'last', 'bid', 'ask',
+                 'baseVolume', 'quoteVolume', 'percentage', 'change', 'vwap')
+
+_TAMANHO = struct.Struct('>I')
+
+def _travar(caminho):
+    """Trava exclusiva, sem esperar; devolve o descritor ou None se outro processo já a tem."""
+    fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o600)
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+    return fd
+
+def _e_stablecoin(symbol):
+    base, _, quote = symbol.partition('/')
+    return quote == 'USDT' and base in STABLECOINS
+
+class Snapshot:
+    """Tickers de um instante, com índices por volume. Não deve ser alterado."""
+
+    __slots__ = ('timestamp', 'tickers', 'por_volume', '_volumes', '_usdt', '_volumes_usdt', '_bytes')
+
+    def __init__(self, tickers, timestamp=None):
+        # Só os campos usados pelos monitores (o 'info' bruto da API fica de fora)
+        limpos = {
+            symbol: MappingProxyType({campo: ticker.get(campo) for campo in CAMPOS_TICKER})
+            for symbol, ticker in tickers.items()
+        }
+        self.timestamp = timestamp or time.time()
+        self.tickers = MappingProxyType(limpos)
+        self.por_volume = tuple(sorted(limpos, key=lambda s: limpos[s]['quoteVolume'] or 0, reverse=True))
+        # Volumes negativos em ordem crescente, para busca binária
+        self._volumes = [-(limpos[s]['quoteVolume'] or 0) for s in self.por_volume]
+        self._usdt = tuple(s for s in self.por_volume if s.endswith('/USDT') and not _e_stablecoin(s))
+        self._volumes_usdt = [-(limpos[s]['quoteVolume'] or 0) for s in self._usdt]
+        self._bytes = None
+
+    @property
+    def idade(self):
+        return time.time() - self.timestamp
+
+    def __getitem__(self, symbol):
+        return self.tickers[symbol]
+
+    def __contains__(self, symbol):
+        return symbol in self.tickers
+
+    def acima_de(self, volume_minimo, usdt=False):
+        """Símbolos com volume em quote acima de `volume_minimo`, do maior para o menor.
+
+        Com usdt=True, só pares /USDT e sem stablecoins contra USDT.
+        """
+        symbols, volumes = (self._usdt, self._volumes_usdt) if usdt else (self.por_volume, self._volumes)
+        return list(symbols[:bisect.bisect_left(volumes, -volume_minimo)])
+
+    def serializar(self):
+        # Serializado uma única vez por snapshot, não a cada cliente
+        if self._bytes is None:
+            dados = json.dumps({
+                'timestamp': self.timestamp,
+                'tickers': {symbol: dict(ticker) for symbol, ticker in self.tickers.items()},
+            }, separators=(',', ':')).encode()
+            self._bytes = _TAMANHO.pack(len(dados)) + dados
+        return self._bytes
+
+    @classmethod
+    def desserializar(cls, dados):
+        conteudo = json.loads(dados)
+        return cls(conteudo['tickers'], conteudo['timestamp'])
+
+duracao_busca = metricas.histograma("snapshot_busca_segundos", "Duração de cada fetch_tickers do snapshot de mercado")
+
+class ServicoSnapshot:
+    """Busca os tickers com uma única requisição em andamento por vez."""
+
+    def __init__(self, obter_exchange, intervalo=INTERVALO_SNAPSHOT):
+        self.obter_exchange = obter_exchange
+        self.intervalo = intervalo
+        self.snapshot = None
+        self.em_andamento = None
+        self.servidor = None
+        self.caminho = None
+        self.trava = None  # Descritor do arquivo de eleição, enquanto este processo serve
+        self.conexoes = set()
+        self.buscas = 0
+
+    async def obter(self, max_idade=None):
+        max_idade = self.intervalo if max_idade is None else max_idade
+        if self.snapshot is not None and self.snapshot.idade <= max_idade:
+            return self.snapshot
+        if self.em_andamento is None:
+            self.em_andamento = asyncio.create_task(self._buscar())
+            self.em_andamento.add_done_callback(self._liberar)
+        # shield: um consumidor cancelado não cancela a busca dos outros
+        return await asyncio.shield(self.em_andamento)
+
+    def _liberar(self, _):
+        self.em_andamento = None
+
+    async def _buscar(self):
+        exchange = await self.obter_exchange()
+        inicio = time.monotonic()
+        tickers = await exchange.fetch_tickers()
+        self.snapshot = Snapshot(tickers)
+        self.buscas += 1
+        duracao_busca.observar(time.monotonic() - inicio)
+        logging.debug(f"Snapshot de mercado: {len(tickers)} tickers em {time.monotonic() - inicio:.2f}s")
+        return self.snapshot
+
+    # ----- Servidor local -----
+
+    async def servir(self, caminho=SOCKET_SNAPSHOT):
+        """Passa a servir no socket, se nenhum outro processo o faz; devolve False caso contrário."""
+        trava = _travar(f"{caminho}.lock")
+        if trava is None:
+            return False
+        try:
+            if os.path.exists(caminho):
+                os.unlink(caminho)  # Com a trava em mãos, o socket só pode ser de um servidor morto
+            self.servidor = await asyncio.start_unix_server(self._atender, path=caminho)
+            os.chmod(caminho, 0o600)
+        except BaseException:
+            os.close(trava)
+            raise
+        self.caminho = caminho
+        self.trava = trava
+        logging.info(f"Servindo snapshots de mercado em {caminho}")
+        return True
+
+    async def _atender(self, reader, writer):
+        self.conexoes.add(writer)
+        try:
+            while True:
+                linha = await reader.readline()
+                if not linha:
+                    break
+                snapshot = await self.obter(float(linha))
+                writer.write(snapshot.serializar())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # Cliente desconectou ou o processo está encerrando
+        except Exception as e:
+            logging.error(f"Erro ao servir snapshot: {e}")
+        finally:
+            self.conexoes.discard(writer)
+            writer.close()
+
+    async def encerrar(self):
+        if self.servidor is not None:
+            self.servidor.close()
+            # Fecha também as conexões abertas, para os clientes assumirem o servidor
+            for writer in list(self.conexoes):
+                writer.close()
+            await self.servidor.wait_closed()
+            self.servidor = None
+            # Remove o socket antes de soltar a trava: depois dela, ele pode ser de outro servidor
+            try:
+                os.unlink(self.caminho)
+            except OSError:
+                pass
+        if self.trava is not None:
+            os.close(self.trava)
+            self.trava = None
+
+class ClienteSnapshot:
+    """Lê snapshots de um ServicoSnapshot de outro processo, pelo socket local."""
+
+    def __init__(self, caminho=SOCKET_SNAPSHOT, intervalo=INTERVALO_SNAPSHOT):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.snapshot = None
+        self.conexao = None
+        self.lock = asyncio.Lock()
+
+    async def obter(self, max_idade=None):
+        max_idade = self.intervalo if max_idade is None else max_idade
+        async with self.lock:
+            if self.snapshot is not None and self.snapshot.idade <= max_idade:
+                return self.snapshot
+            try:
+                if self.conexao is None:
+                    self.conexao = await asyncio.open_unix_connection(self.caminho)
+                reader, writer = self.conexao
+                writer.write(f"{max_idade}\n".encode())
+                await writer.drain()
+                tamanho, = _TAMANHO.unpack(await reader.readexactly(_TAMANHO.size))
+                self.snapshot = Snapshot.desserializar(await reader.readexactly(tamanho))
+            except (OSError, asyncio.IncompleteReadError):
+                await self.fechar()
+                raise
+            return self.snapshot
+
+    async def fechar(self):
+        if self.conexao is not None:
+            self.conexao[1].close()
+            self.conexao = None
+
+class FonteSnapshot:
+    """Ponto de acesso dos consumidores: usa o servidor local ou assume o papel dele."""
+
+    def __init__(self, obter_exchange, caminho=SOCKET_SNAPSHOT, intervalo=INTERVALO_SNAPSHOT):
+        self.caminho = caminho
+        self.servico = ServicoSnapshot(obter_exchange, intervalo)
+        self.cliente = ClienteSnapshot(caminho, intervalo)
+
+    async def obter(self, max_idade=None):
+        if self.servico.servidor is None:
+            try:
+                return await self.cliente.obter(max_idade)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Ninguém escuta no socket: tenta assumir (só quem pega a trava consegue)
+                try:
+                    if not await self.servico.servir(self.caminho):
+                        logging.info("Outro processo está assumindo o snapshot local; buscando direto desta vez")
+                except OSError as e:
+                    logging.warning(f"Snapshot local indisponível ({e}); buscando direto na exchange")
+            except (OSError, asyncio.IncompleteReadError) as e:
+                # Servidor vivo que fechou a conexão ou falha passageira: ele continua sendo o servidor
+                logging.warning(f"Erro ao ler o snapshot local ({e!r}); buscando direto desta vez")
+        return await self.servico.obter(max_idade)
+
+    async def encerrar(self):
+        await self.cliente.fechar()
+        await self.servico.encerrar()
+
+_fonte_compartilhada = None
+
+def fonte_compartilhada(obter_exchange):
+    """FonteSnapshot única do processo, para monitores hospedados juntos (monitores.py)."""
+    global _fonte_compartilhada
+    if _fonte_compartilhada is None:
+        _fonte_compartilhada = FonteSnapshot(obter_exchange)
+    return _fonte_compartilhada
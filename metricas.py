@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from os import getenv
+
+# Métricas dos bots e monitores no formato texto do Prometheus.
+#
+# Cada processo guarda contadores, medidores e histogramas em memória e os
+# serve em http://METRICAS_HOST:METRICAS_PORTA/metrics. Registrar um valor
+# custa uma soma sob um lock, bem menos que uma linha de log por símbolo;
+# os números que os módulos já guardam em dicionários `metricas` (caches,
+# limitador, escritor do DynamoDB...) são lidos só na hora da coleta.
+#
+# Vários processos no mesmo host (shards da agressão, bot e monitores) tentam
+# portas seguidas a partir de METRICAS_PORTA; a escolhida aparece no log.
+# METRICAS_PORTA=0 desliga o endpoint.
+
+PORTA = int(getenv("METRICAS_PORTA", 9108))
+HOST = getenv("METRICAS_HOST", "127.0.0.1")
+TENTATIVAS_PORTA = 16  # Portas tentadas a partir de PORTA quando a anterior já está em uso
+
+# Limites dos histogramas, em segundos: de uma requisição REST a um ciclo inteiro
+LIMITES_TEMPO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _formatar_rotulos(nomes, valores, extra=None):
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+def _formatar_valor(valor):
+    if valor == float('inf'):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+class Metrica:
+    """Base: nome, ajuda, tipo e os rótulos aceitos (sempre passados por nome)."""
+
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.lock = threading.Lock()  # O escritor do DynamoDB registra de outras threads
+        self.valores = {}
+
+    def _chave(self, rotulos):
+        return tuple(str(rotulos[nome]) for nome in self.rotulos)
+
+    def amostras(self):
+        """Linhas (sufixo, rótulos formatados, valor) da exportação."""
+        with self.lock:
+            return [("", _formatar_rotulos(self.rotulos, chave), valor) for chave, valor in self.valores.items()]
+
+class Contador(Metrica):
+    """Total que só cresce (requisições, itens gravados, pulos...)."""
+
+    tipo = "counter"
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self.lock:
+            self.valores[chave] = self.valores.get(chave, 0) + valor
+
+class Medidor(Metrica):
+    """Valor atual (tamanho de fila, símbolos do último ciclo...)."""
+
+    tipo = "gauge"
+
+    def definir(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with self.lock:
+            self.valores[chave] = valor
+
+class Histograma(Metrica):
+    """Distribuição de valores em faixas acumuladas, com soma e contagem."""
+
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), limites=LIMITES_TEMPO):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(sorted(limites))
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        indice = bisect.bisect_left(self.limites, valor)
+        with self.lock:
+            serie = self.valores.get(chave)
+            if serie is None:
+                # Contagem por faixa (a última é +Inf), soma e total
+                serie = self.valores[chave] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def cronometrar(self, **rotulos):
+        """`with histograma.cronometrar(endpoint=...):` observa a duração do bloco."""
+        return _Cronometro(self, rotulos)
+
+    def amostras(self):
+        linhas = []
+        with self.lock:
+            series = [(chave, list(faixas), soma, total) for chave, (faixas, soma, total) in self.valores.items()]
+        for chave, faixas, soma, total in series:
+            acumulado = 0
+            for limite, quantidade in zip(self.limites + (float('inf'),), faixas):
+                acumulado += quantidade
+                linhas.append(("_bucket", _formatar_rotulos(self.rotulos, chave, f'le="{_formatar_valor(limite)}"'), acumulado))
+            rotulos = _formatar_rotulos(self.rotulos, chave)
+            linhas.append(("_sum", rotulos, soma))
+            linhas.append(("_count", rotulos, total))
+        return linhas
+
+class _Cronometro:
+    def __init__(self, histograma, rotulos):
+        self.histograma = histograma
+        self.rotulos = rotulos
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.histograma.observar(time.perf_counter() - self.inicio, **self.rotulos)
+
+class Coletada(Metrica):
+    """Métrica lida na hora da coleta: `funcao()` devolve pares (valores dos rótulos, valor).
+
+    Serve para expor os dicionários `metricas` que os módulos já mantêm, sem
+    mexer no caminho quente deles.
+    """
+
+    def __init__(self, nome, ajuda, tipo, rotulos, funcao):
+        super().__init__(nome, ajuda, rotulos)
+        self.tipo = tipo
+        self.funcao = funcao
+
+    def amostras(self):
+        try:
+            return [("", _formatar_rotulos(self.rotulos, chave), valor) for chave, valor in self.funcao()]
+        except Exception as e:
+            logging.debug(f"Erro ao coletar {self.nome}: {e}")
+            return []
+
+class Registro:
+    """Métricas do processo, indexadas pelo nome."""
+
+    def __init__(self):
+        self.metricas = {}
+        self.lock = threading.Lock()
+
+    def registrar(self, metrica):
+        # Módulos importados por mais de um monitor pedem a mesma métrica: vale a primeira
+        with self.lock:
+            return self.metricas.setdefault(metrica.nome, metrica)
+
+    def exportar(self):
+        """Todas as métricas no formato texto do Prometheus (versão 0.0.4)."""
+        linhas = []
+        for metrica in list(self.metricas.values()):
+            amostras = metrica.amostras()
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            for sufixo, rotulos, valor in amostras:
+                linhas.append(f"{metrica.nome}{sufixo}{rotulos} {_formatar_valor(valor)}")
+        return "\n".join(linhas) + "\n"
+
+registro = Registro()
+
+def contador(nome, ajuda, rotulos=()):
+    return registro.registrar(Contador(nome, ajuda, rotulos))
+
+def medidor(nome, ajuda, rotulos=()):
+    return registro.registrar(Medidor(nome, ajuda, rotulos))
+
+def histograma(nome, ajuda, rotulos=(), limites=LIMITES_TEMPO):
+    return registro.registrar(Histograma(nome, ajuda, rotulos, limites))
+
+def coletada(nome, ajuda, tipo, rotulos, funcao):
+    return registro.registrar(Coletada(nome, ajuda, tipo, rotulos, funcao))
+
+# ----- Ciclos dos monitores -----
+
+duracao_ciclo = histograma("monitor_ciclo_duracao_segundos", "Duração de cada ciclo de varredura", ("monitor",))
+simbolos_ciclo = medidor("monitor_simbolos_ciclo", "Símbolos processados no último ciclo", ("monitor",))
+simbolos_processados = contador("monitor_simbolos_processados_total", "Símbolos processados desde o início", ("monitor",))
+alertas_enviados = contador("monitor_alertas_total", "Alertas gerados pelos monitores", ("monitor",))
+
+def registrar_ciclo(monitor, simbolos, duracao, alertas=0):
+    """Um ciclo concluído: substitui as linhas de log por símbolo."""
+    duracao_ciclo.observar(duracao, monitor=monitor)
+    simbolos_ciclo.definir(simbolos, monitor=monitor)
+    simbolos_processados.inc(simbolos, monitor=monitor)
+    if alertas:
+        alertas_enviados.inc(alertas, monitor=monitor)
+
+# ----- Gravações -----
+
+# Vazão de escrita (DynamoDB, SQLite): rate(gravacao_itens_total[1m]) dá itens por segundo
+itens_gravados = contador("gravacao_itens_total", "Itens gravados por destino", ("destino",))
+falhas_gravacao = contador("gravacao_falhas_total", "Itens que não puderam ser gravados", ("destino",))
+duracao_gravacao = histograma("gravacao_lote_segundos", "Duração de cada lote gravado", ("destino",))
+
+# ----- Endpoint HTTP -----
+
+_servidor = None
+
+async def servir(porta=PORTA, host=HOST):
+    """Sobe o endpoint /metrics no event loop atual; devolve a porta usada ou None.
+
+    Pode ser chamada por mais de um módulo do mesmo processo: só a primeira
+    chamada abre a porta. Falhar aqui nunca derruba o monitor.
+    """
+    global _servidor
+    if _servidor is not None:
+        return _servidor[1]
+    if not porta:
+        return None
+    from aiohttp import web
+
+    async def exportar(request):
+        return web.Response(text=registro.exportar(), content_type="text/plain", charset="utf-8",
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    app = web.Application()
+    app.router.add_get('/metrics', exportar)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    for tentativa in range(TENTATIVAS_PORTA):
+        try:
+            await web.TCPSite(runner, host, porta + tentativa).start()
+        except OSError:
+            continue
+        _servidor = (runner, porta + tentativa)
+        logging.info(f"Métricas em http://{host}:{porta + tentativa}/metrics")
+        return porta + tentativa
+    await runner.cleanup()
+    logging.warning(f"Nenhuma porta livre para as métricas entre {porta} e {porta + TENTATIVAS_PORTA - 1}")
+    return None
+
+async def encerrar():
+    global _servidor
+    if _servidor is not None:
+        await _servidor[0].cleanup()
+        _servidor = None
+
+if __name__ == "__main__":
+    # Consulta rápida de um processo em execução: python metricas.py --porta 9108
+    parser = argparse.ArgumentParser(description="Mostra as métricas de um processo em execução")
+    parser.add_argument("--porta", type=int, default=PORTA)
+    parser.add_argument("--filtro", default="", help="Só as linhas que contêm este texto")
+    args = parser.parse_args()
+
+    async def mostrar():
+        import aiohttp
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://{HOST}:{args.porta}/metrics") as resposta:
+                texto = await resposta.text()
+        for linha in texto.splitlines():
+            if args.filtro in linha and not linha.startswith("#"):
+                print(linha)
+
+    asyncio.run(mostrar())
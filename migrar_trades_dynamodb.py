@@ -0,0 +1,111 @@
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from dynamodb_config import dynamodb, EscritorDynamoDB, table_name
+from trade_schema import montar_itens, MINUTO_MS
+
+# Migra as tabelas antigas (um item por trade) para a tabela compacta de trades.
+#
+#   TradeData   - gravada pelo binance_collector.py antigo
+#                 (pair, trade_id, timestamp = str(datetime local), buyer_is_maker, quantity, price)
+#   TradesTable - gravada pelo monitor_agression_dynamodb.py antigo
+#                 (trade_id, symbol, price, qty, time = epoch-ms em texto, isBuyerMaker)
+#
+# A leitura usa Scan paralelo por segmentos. Como o Scan não vem ordenado, os
+# trades são acumulados e gravados a cada `--lote` trades; um mesmo bucket pode
+# então gerar mais de um item, o que o formato compacto permite. Os sks já
+# usados em cada pk são registrados para que dois itens do mesmo bucket nunca
+# tenham a mesma chave (o sk é ajustado em 1 ms, como no AgrupadorTrades).
+
+logging.basicConfig(level=logging.INFO)
+
+def converter_trade_data(item):
+    tempo = int(datetime.fromisoformat(item['timestamp']).timestamp() * 1000)
+    return item['pair'], {
+        'id': int(item['trade_id']),
+        'time': tempo,
+        'price': item['price'],
+        'qty': item['quantity'],
+        'isBuyerMaker': item['buyer_is_maker'],
+    }
+
+def converter_trades_table(item):
+    return item['symbol'], {
+        'id': int(item['trade_id']),
+        'time': int(item['time']),
+        'price': item['price'],
+        'qty': item['qty'],
+        'isBuyerMaker': item['isBuyerMaker'],
+    }
+
+CONVERSORES = {
+    'TradeData': converter_trade_data,
+    'TradesTable': converter_trades_table,
+}
+
+_sks_usados = {}
+_lock_sks = threading.Lock()
+
+def reservar_sk(item):
+    with _lock_sks:
+        usados = _sks_usados.setdefault(item['pk'], set())
+        while item['sk'] in usados:
+            item['sk'] += 1
+        usados.add(item['sk'])
+
+def escanear_segmento(tabela_origem, segmento, total_segmentos, converter, escritor, lote, granularidade_ms):
+    tabela = dynamodb.Table(tabela_origem)
+    params = {'Segment': segmento, 'TotalSegments': total_segmentos}
+    por_symbol = {}
+    acumulados = 0
+    migrados = 0
+
+    def gravar():
+        nonlocal acumulados, migrados
+        for symbol, trades in por_symbol.items():
+            for item in montar_itens(symbol, trades, granularidade_ms):
+                reservar_sk(item)
+                escritor.adicionar(item)
+        migrados += acumulados
+        por_symbol.clear()
+        acumulados = 0
+
+    while True:
+        resposta = tabela.scan(**params)
+        for item in resposta['Items']:
+            symbol, trade = converter(item)
+            por_symbol.setdefault(symbol, []).append(trade)
+            acumulados += 1
+        if acumulados >= lote:
+            gravar()
+        if 'LastEvaluatedKey' not in resposta:
+            break
+        params['ExclusiveStartKey'] = resposta['LastEvaluatedKey']
+    gravar()
+    return migrados
+
+def migrar(tabela_origem, segmentos=8, lote=200_000, granularidade_ms=MINUTO_MS):
+    """Copia todos os trades de `tabela_origem` para a tabela compacta."""
+    converter = CONVERSORES[tabela_origem]
+    escritor = EscritorDynamoDB(table_name)
+    with ThreadPoolExecutor(max_workers=segmentos) as executor:
+        totais = executor.map(
+            lambda segmento: escanear_segmento(tabela_origem, segmento, segmentos, converter, escritor, lote, granularidade_ms),
+            range(segmentos),
+        )
+        total = sum(totais)
+    escritor.fechar()
+    logging.info(f"{tabela_origem}: {total} trades migrados para {table_name} ({escritor.metricas})")
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra as tabelas antigas de trades para o formato compacto.")
+    parser.add_argument("tabelas", nargs="*", default=list(CONVERSORES), choices=list(CONVERSORES))
+    parser.add_argument("--segmentos", type=int, default=8, help="segmentos do Scan paralelo")
+    parser.add_argument("--lote", type=int, default=200_000, help="trades acumulados antes de gravar")
+    parser.add_argument("--bucket-ms", type=int, default=MINUTO_MS, help="tamanho do bucket de tempo em ms")
+    args = parser.parse_args()
+    for tabela in args.tabelas:
+        migrar(tabela, args.segmentos, args.lote, args.bucket_ms)
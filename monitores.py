@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import importlib
+import logging
+from os import getenv
+import dotenv
+import metricas
+from agendador import Agendador
+from binance_rest import cliente
+from exchange_pool import get_exchange, close_exchange
+from market_snapshot import fonte_compartilhada
+
+# Hospeda os monitores num único processo.
+#
+# Volume, ATH e agressão rodam como tarefas do mesmo agendador, disparadas
+# logo após o fechamento dos seus candles, no mesmo event loop. Assim eles
+# dividem a sessão HTTP da exchange, o cliente REST, o snapshot de mercado e
+# o notificador do Telegram, em vez de cada processo abrir os seus. O volume
+# no modo stream não precisa de agendamento: roda ao lado, disparado pelos
+# próprios fechamentos de candle.
+
+dotenv.load_dotenv()
+MONITORES = getenv("MONITORES", "volume,ath,agressao")
+
+async def hospedar(monitores):
+    """Roda os monitores escolhidos ('volume', 'ath', 'agressao' ou 'agressao_dynamodb')."""
+    agendador = Agendador()
+    await agendador.sincronizar_relogio(cliente.tempo_servidor)
+    await metricas.servir()
+    servicos = []
+    modulos = []
+    indice = None
+
+    if 'volume' in monitores:
+        volume = importlib.import_module('volume')
+        modulos.append(volume)
+        if volume.MODO == "stream":
+            servicos.append(volume.monitor_volume_stream())
+        else:
+            agendador.adicionar("volume", volume.rodada_volume, "1m")
+
+    if 'ath' in monitores:
+        ath = importlib.import_module('ath')
+        from ath_index import IndiceATH
+        modulos.append(ath)
+        indice = IndiceATH.carregar()
+        agendador.adicionar("ath", lambda: ath.rodada_ath(indice), "5m")
+
+    # As duas variantes da agressão usam os mesmos cursores: só uma delas por processo
+    if 'agressao' in monitores or 'agressao_dynamodb' in monitores:
+        from motor_agressao import MotorAgressao
+        monitor = importlib.import_module(
+            'monitor_agression_dynamodb' if 'agressao_dynamodb' in monitores else 'monitor_agression')
+        modulos.append(monitor)
+        motor = MotorAgressao(
+            monitor.snapshots, monitor.send_telegram_message,
+            ao_coletar=getattr(monitor, 'save_trades_to_dynamodb', None),
+        )
+        motor.agendar(agendador)
+
+    servicos.append(agendador.executar())
+    try:
+        await asyncio.gather(*servicos)
+    finally:
+        logging.info(f"Agendador: {agendador.estatisticas()}")
+        await metricas.encerrar()
+        if indice is not None:
+            indice.salvar()
+        await fonte_compartilhada(get_exchange).encerrar()
+        await close_exchange()
+        await cliente.fechar()
+        # Os monitores usam o mesmo notificador compartilhado; encerrar de novo não faz nada
+        for modulo in modulos:
+            await modulo.notificador.encerrar()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Roda os monitores num único processo")
+    parser.add_argument("--monitores", default=MONITORES,
+                        help="Lista separada por vírgulas: volume, ath, agressao, agressao_dynamodb")
+    args = parser.parse_args()
+    asyncio.run(hospedar([nome.strip() for nome in args.monitores.split(",") if nome.strip()]))
@@ -0,0 +1,259 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import zlib
+from os import getenv
+import pandas as pd
+from agressao import avaliar_agressao
+from agendador import Agendador
+import metricas
+from market_scan import escanear_simbolos
+from trade_cursor import CursorTrades, coletar_agg_trades, DIRETORIO_CURSORES, MINUTO_MS
+
+# Motor de agressão multi-símbolo.
+#
+# Acompanha todos os pares /USDT acima de um volume diário mínimo num único
+# event loop: a cada ciclo, os símbolos do snapshot de mercado são varridos
+# em paralelo (escanear_simbolos), cada um com seu cursor de trades em
+# memória, e a regra de agressao.py decide os sinais. Só os trades novos de
+# cada par são buscados, via /aggTrades.
+#
+# Para dividir centenas de pares entre processos, cada processo fica com os
+# símbolos cujo crc32 cai no seu shard; o limite de peso e o snapshot de
+# mercado continuam compartilhados entre todos eles.
+
+VOLUME_MINIMO = float(getenv("AGRESSAO_VOLUME_MINIMO", 10_000_000))  # Volume diário mínimo em USDT
+SHARDS = int(getenv("AGRESSAO_SHARDS", 1))  # Processos entre os quais os símbolos são divididos
+MAX_CONCORRENCIA = 32    # Símbolos processados ao mesmo tempo em cada processo
+TIMEOUT_CICLO = 50       # Tempo máximo de um ciclo; o que não terminar fica para o próximo
+
+def shard_de(symbol, shards):
+    """Shard de um símbolo; estável entre processos e execuções (ao contrário de hash())."""
+    return zlib.crc32(symbol.encode()) % shards
+
+def moedas(symbol):
+    """('BTC', 'USDT') para 'BTC/USDT'."""
+    base, _, quote = symbol.partition('/')
+    return base, quote
+
+def simbolo_rest(symbol):
+    """Formato da API REST: 'BTC/USDT' -> 'BTCUSDT'."""
+    return symbol.replace('/', '')
+
+def formatar_alerta(symbol, resultado, preco):
+    """Mensagem de sinal com as unidades do próprio par."""
+    base, quote = moedas(symbol)
+    lado = "compradora" if resultado['sinal'] == "compra" else "vendedora"
+    return (
+        f"Sinal de {resultado['sinal'].capitalize()}: {symbol}\n"
+        f"Saldo da agressão {lado}: {resultado['ultimo']:,.2f} {base}\n"
+        f"Preço atual: {preco:,.8g} {quote}\n"
+    )
+
+class MotorAgressao:
+    """Avalia a agressão de vários símbolos por ciclo.
+
+    `snapshots` fornece os tickers de 24h (FonteSnapshot), `notificar(texto)`
+    recebe cada alerta, `buscar(cursor, lookback_ms)` atualiza um cursor com os
+    trades novos e `ao_coletar(symbol, trades)` recebe os trades de cada
+    símbolo (ex.: para gravar no DynamoDB).
+    """
+
+    def __init__(self, snapshots, notificar, volume_minimo=VOLUME_MINIMO, shard=0, shards=1,
+                 interval_minutes=1, lookback_minutes=15, multiplicador=1.0,
+                 max_concorrencia=MAX_CONCORRENCIA, buscar=coletar_agg_trades, ao_coletar=None,
+                 diretorio_cursores=DIRETORIO_CURSORES):
+        self.snapshots = snapshots
+        self.notificar = notificar
+        self.volume_minimo = volume_minimo
+        self.shard = shard
+        self.shards = shards
+        self.interval_minutes = interval_minutes
+        self.lookback_minutes = lookback_minutes
+        self.multiplicador = multiplicador
+        self.max_concorrencia = max_concorrencia
+        self.buscar = buscar
+        self.ao_coletar = ao_coletar
+        self.diretorio_cursores = diretorio_cursores
+        self.cursores = {}  # symbol -> CursorTrades mantido entre os ciclos
+        self.ultimo_ciclo = {}
+
+    async def simbolos(self):
+        """Símbolos acima do volume mínimo que pertencem a este shard, do maior volume para o menor."""
+        snapshot = await self.snapshots.obter()
+        symbols = snapshot.acima_de(self.volume_minimo, usdt=True)
+        if self.shards > 1:
+            symbols = [symbol for symbol in symbols if shard_de(symbol, self.shards) == self.shard]
+        return symbols
+
+    def _cursor(self, symbol):
+        cursor = self.cursores.get(symbol)
+        if cursor is None:
+            rest = simbolo_rest(symbol)
+            cursor = CursorTrades.carregar(rest, os.path.join(self.diretorio_cursores, f"{rest}.json"))
+            self.cursores[symbol] = cursor
+        return cursor
+
+    async def avaliar(self, symbol):
+        """Atualiza o cursor do símbolo e devolve a mensagem de alerta, ou None."""
+        interval_ms = self.interval_minutes * MINUTO_MS
+        lookback_ms = self.lookback_minutes * MINUTO_MS
+        cursor = self._cursor(symbol)
+        novos = await self.buscar(cursor, lookback_ms)
+        if self.ao_coletar and novos:
+            self.ao_coletar(cursor.symbol, novos)
+
+        # Só intervalos fechados: o ciclo roda logo depois do fechamento do candle
+        agora_ms = int(time.time() * 1000)
+        atual_ms = agora_ms - agora_ms % interval_ms
+        # A janela vem inteira, com zeros nos minutos sem trades; só falta dado se nada foi coletado ainda
+        if cursor.ultimo_tempo is None:
+            logging.debug(f"{symbol}: aguardando os primeiros trades")
+            return None
+        intervalos = cursor.saldos(atual_ms - lookback_ms, atual_ms - 1, interval_ms)
+        # Uma linha por intervalo e símbolo: só monta as strings com o log de debug ligado
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            for minuto, compra, venda in intervalos:
+                logging.debug(f"{symbol} {pd.to_datetime(minuto, unit='ms')}: compra {compra:.2f}, venda {venda:.2f}")
+
+        resultado = avaliar_agressao([compra - venda for _, compra, venda in intervalos], self.multiplicador)
+        if resultado['sinal'] is None:
+            return None
+        logging.info(f"Sinal de {resultado['sinal']} para {symbol}: saldo {resultado['ultimo']:.2f}")
+        return formatar_alerta(symbol, resultado, cursor.ultimo_preco)
+
+    async def ciclo(self):
+        """Varre todos os símbolos do shard uma vez e envia os alertas."""
+        symbols = await self.simbolos()
+        varredura = await escanear_simbolos(
+            symbols, self.avaliar, max_concorrencia=self.max_concorrencia,
+            peso_por_simbolo=0, timeout=TIMEOUT_CICLO,
+        )
+        # Símbolos que saíram da lista não precisam mais do cursor em memória
+        self.cursores = {symbol: cursor for symbol, cursor in self.cursores.items() if symbol in symbols}
+
+        alertas = [mensagem for mensagem in varredura['resultados'].values() if mensagem]
+        for mensagem in alertas:
+            self.notificar(mensagem)
+        metricas.registrar_ciclo("agressao", len(symbols), varredura['duracao'], len(alertas))
+        self.ultimo_ciclo = {
+            'simbolos': len(symbols),
+            'concluidos': len(varredura['resultados']),
+            'alertas': len(alertas),
+            'duracao': varredura['duracao'],
+        }
+        logging.info(
+            f"Ciclo de agressão (shard {self.shard}/{self.shards}): {len(symbols)} símbolos em "
+            f"{varredura['duracao']:.2f}s, {len(alertas)} alertas, {len(varredura['pendentes'])} não concluídos, "
+            f"{len(varredura['erros'])} com erro"
+        )
+        return varredura
+
+    def agendar(self, agendador):
+        """Registra o ciclo no agendador: logo após o fechamento de cada intervalo."""
+        return agendador.adicionar(f"agressao-{self.shard}", self.ciclo, f"{self.interval_minutes}m")
+
+    async def executar(self):
+        agendador = Agendador()
+        self.agendar(agendador)
+        await agendador.executar()
+
+# ----- Processos -----
+
+def _rodar_shard(alvo, shard, shards):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(alvo(shard, shards))
+
+def executar_shards(alvo, shards=SHARDS):
+    """Roda a corrotina `alvo(shard, shards)` num processo por shard e espera todos.
+
+    Usa 'spawn': cada processo importa o monitor do zero e cria seus próprios
+    singletons (sessões HTTP, threads do escritor do DynamoDB, notificador).
+    """
+    if shards <= 1:
+        return asyncio.run(alvo(0, 1))
+    contexto = multiprocessing.get_context('spawn')
+    processos = [
+        contexto.Process(target=_rodar_shard, args=(alvo, shard, shards), name=f"agressao-{shard}")
+        for shard in range(shards)
+    ]
+    for processo in processos:
+        processo.start()
+    try:
+        for processo in processos:
+            processo.join()
+    except KeyboardInterrupt:
+        for processo in processos:
+            processo.terminate()
+
+def main(alvo, argv=None):
+    """Linha de comando dos monitores: `--shards N` ou um único `--shard I --shards N`."""
+    parser = argparse.ArgumentParser(description="Monitor de agressão multi-símbolo")
+    parser.add_argument("--shards", type=int, default=SHARDS, help="Total de shards (processos)")
+    parser.add_argument("--shard", type=int, help="Roda só este shard (ex.: um por serviço do sistema)")
+    args = parser.parse_args(argv)
+    if args.shard is not None:
+        asyncio.run(alvo(args.shard, args.shards))
+    else:
+        executar_shards(alvo, args.shards)
+
+# ----- Benchmark -----
+
+class _SnapshotsSimulados:
+    def __init__(self, quantidade):
+        from market_snapshot import Snapshot
+        tickers = {f"S{i:04d}/USDT": {'symbol': f"S{i:04d}/USDT", 'quoteVolume': 1e9 - i} for i in range(quantidade)}
+        self.snapshot = Snapshot(tickers)
+
+    async def obter(self, max_idade=None):
+        return self.snapshot
+
+def _buscar_simulado(latencia, trades_por_minuto):
+    """Substitui a rede: espera `latencia` e gera trades desde o último do cursor."""
+    async def buscar(cursor, lookback_ms):
+        await asyncio.sleep(latencia)
+        agora_ms = int(time.time() * 1000)
+        inicio = agora_ms - lookback_ms if cursor.ultimo_tempo is None else cursor.ultimo_tempo + 1
+        passo = max(1, MINUTO_MS // trades_por_minuto)
+        proximo_id = (cursor.ultimo_id or 0) + 1
+        novos = [
+            {'id': proximo_id + i, 'time': tempo, 'price': '1.5', 'qty': str(1 + i % 7), 'isBuyerMaker': i % 3 == 0}
+            for i, tempo in enumerate(range(inicio, agora_ms, passo))
+        ]
+        cursor.aplicar(novos)
+        cursor.podar(agora_ms - lookback_ms)
+        cursor.salvar()
+        return novos
+    return buscar
+
+async def benchmark(quantidades=(50, 100, 300, 600), latencia=0.05, trades_por_minuto=200):
+    """Tempo de ciclo por número de símbolos, com a rede simulada.
+
+    O primeiro ciclo inclui a janela inteira de cada símbolo; os seguintes só
+    os trades novos, como em produção.
+    """
+    with tempfile.TemporaryDirectory() as diretorio:
+        for quantidade in quantidades:
+            alertas = []
+            motor = MotorAgressao(
+                _SnapshotsSimulados(quantidade), alertas.append, volume_minimo=0,
+                buscar=_buscar_simulado(latencia, trades_por_minuto),
+                diretorio_cursores=os.path.join(diretorio, str(quantidade)),
+            )
+            inicial = (await motor.ciclo())['duracao']
+            await asyncio.sleep(1)
+            incremental = (await motor.ciclo())['duracao']
+            print(f"{quantidade:5d} símbolos: primeiro ciclo {inicial:6.2f}s, ciclo incremental {incremental:6.2f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do motor de agressão (rede simulada)")
+    parser.add_argument("--simbolos", default="50,100,300,600", help="Quantidades de símbolos, separadas por vírgula")
+    parser.add_argument("--latencia", type=float, default=0.05, help="Latência simulada por requisição (s)")
+    parser.add_argument("--trades", type=int, default=200, help="Trades por minuto em cada símbolo")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(benchmark(tuple(int(q) for q in args.simbolos.split(",")), args.latencia, args.trades))
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+import weakref
+from collections import deque
+from os import getenv
+import aiohttp
+import metricas
+
+# Endereço da Bot API (pode apontar para um servidor local em testes)
+TELEGRAM_API_URL = getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+LIMITE_MENSAGEM = 4096  # Tamanho máximo de uma mensagem no Telegram
+# Intervalo mínimo entre mensagens para o mesmo chat: o Telegram aceita cerca de
+# 1 por segundo num chat privado e 20 por minuto num grupo ou canal
+INTERVALO_PRIVADO = float(getenv("TELEGRAM_INTERVALO_PRIVADO", 1.0))
+INTERVALO_GRUPO = float(getenv("TELEGRAM_INTERVALO_GRUPO", 3.0))
+
+# Divide um texto grande em partes de até `limite` caracteres
+def dividir_mensagem(texto, limite=LIMITE_MENSAGEM):
+    """Divide o texto preferindo quebras de linha; linhas enormes são cortadas."""
+    partes = []
+    atual = ""
+    for linha in texto.split("\n"):
+        while len(linha) > limite:
+            if atual:
+                partes.append(atual)
+                atual = ""
+            partes.append(linha[:limite])
+            linha = linha[limite:]
+        candidato = f"{atual}\n{linha}" if atual else linha
+        if len(candidato) > limite:
+            partes.append(atual)
+            atual = linha
+        else:
+            atual = candidato
+    if atual:
+        partes.append(atual)
+    return partes or [texto]
+
+latencia_envio = metricas.histograma("telegram_envio_latencia_segundos", "Latência de cada sendMessage bem-sucedido")
+resultados_envio = metricas.contador("telegram_envios_total", "Mensagens enviadas ao Telegram por resultado", ("resultado",))
+_notificadores = weakref.WeakSet()
+
+class NotificadorTelegram:
+    """Fila de notificações do Telegram com envio em segundo plano.
+
+    `enviar` apenas enfileira e retorna na hora. Cada chat tem sua própria
+    tarefa de envio, então vários chats recebem em paralelo, respeitando o
+    intervalo mínimo por chat (maior em grupos e canais) e o limite global
+    de mensagens por segundo.
+    Mensagens que chegam em rajada para o mesmo chat são agrupadas numa só
+    (até 4096 caracteres); textos maiores são divididos.
+    """
+
+    def __init__(self, token, base_url=TELEGRAM_API_URL, intervalo_privado=INTERVALO_PRIVADO,
+                 intervalo_grupo=INTERVALO_GRUPO, mensagens_por_segundo=30, janela_agrupamento=0.5,
+                 max_tentativas=5):
+        self.url = f"{base_url}/bot{token}/sendMessage"
+        self.intervalo_privado = intervalo_privado
+        self.intervalo_grupo = intervalo_grupo
+        self.intervalo_global = 1.0 / mensagens_por_segundo
+        self.janela_agrupamento = janela_agrupamento
+        self.max_tentativas = max_tentativas
+        self.pendentes = {}      # chat_id -> deque de textos
+        self.tarefas = {}        # chat_id -> tarefa de envio
+        self.ultimo_envio = {}   # chat_id -> instante do último envio
+        self.proximo_global = 0.0
+        self.session = None
+        self.enviadas = 0
+        self.falhas = 0
+        _notificadores.add(self)
+
+    @property
+    def tamanho_fila(self):
+        return sum(len(fila) for fila in self.pendentes.values())
+
+    def enviar(self, texto, chat_ids):
+        """Enfileira o texto para cada chat e retorna imediatamente."""
+        for chat_id in chat_ids:
+            if not chat_id:
+                continue
+            self.pendentes.setdefault(chat_id, deque()).append(texto)
+            tarefa = self.tarefas.get(chat_id)
+            if tarefa is None or tarefa.done():
+                self.tarefas[chat_id] = asyncio.create_task(self._enviar_chat(chat_id))
+
+    async def aguardar(self):
+        """Espera até que todas as mensagens enfileiradas tenham sido enviadas."""
+        while self.tarefas:
+            await asyncio.gather(*self.tarefas.values(), return_exceptions=True)
+            self.tarefas = {chat_id: t for chat_id, t in self.tarefas.items() if not t.done()}
+
+    async def encerrar(self):
+        """Envia o que estiver pendente e fecha a sessão HTTP."""
+        await self.aguardar()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def intervalo_chat(self, chat_id):
+        """Grupos e canais têm id negativo (canais: -100...) ou são passados como '@nome'."""
+        texto = str(chat_id)
+        return self.intervalo_grupo if texto.startswith(('-', '@')) else self.intervalo_privado
+
+    def _proximo_lote(self, chat_id):
+        # Junta as mensagens pendentes do chat enquanto couberem numa só
+        fila = self.pendentes[chat_id]
+        partes = dividir_mensagem(fila.popleft())
+        lote = partes.pop(0)
+        for parte in reversed(partes):
+            fila.appendleft(parte)
+        while fila and len(lote) + 2 + len(fila[0]) <= LIMITE_MENSAGEM:
+            lote += "\n\n" + fila.popleft()
+        return lote
+
+    async def _aguardar_limites(self, chat_id):
+        agora = time.monotonic()
+        espera_chat = self.ultimo_envio.get(chat_id, 0.0) + self.intervalo_chat(chat_id) - agora
+        # Reserva a próxima vaga global antes de dormir, para não haver disputa
+        inicio = max(agora + max(espera_chat, 0.0), self.proximo_global)
+        self.proximo_global = inicio + self.intervalo_global
+        if inicio > agora:
+            await asyncio.sleep(inicio - agora)
+        self.ultimo_envio[chat_id] = time.monotonic()
+
+    async def _enviar_chat(self, chat_id):
+        # Espera um pouco para agrupar rajadas de mensagens
+        await asyncio.sleep(self.janela_agrupamento)
+        fila = self.pendentes[chat_id]
+        while fila:
+            texto = self._proximo_lote(chat_id)
+            await self._aguardar_limites(chat_id)
+            try:
+                await self._post(chat_id, texto)
+            except Exception as e:
+                # Um erro inesperado perde só este lote, não a fila do chat
+                self.falhas += 1
+                resultados_envio.inc(resultado="falha")
+                logging.error(f"Erro inesperado ao enviar mensagem para o chat {chat_id}: {e}")
+
+    async def _post(self, chat_id, texto):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15))
+        for tentativa in range(1, self.max_tentativas + 1):
+            inicio = time.monotonic()
+            try:
+                async with self.session.post(self.url, json={'chat_id': chat_id, 'text': texto}) as resposta:
+                    status = resposta.status
+                    try:
+                        dados = await resposta.json(content_type=None)
+                    except ValueError:
+                        # Um 502/504 do proxy do Telegram vem em HTML
+                        raise ValueError(f"HTTP {status} sem JSON na resposta")
+                if not isinstance(dados, dict):
+                    raise ValueError(f"resposta inesperada (HTTP {status})")
+                if dados.get('ok'):
+                    self.enviadas += 1
+                    latencia_envio.observar(time.monotonic() - inicio)
+                    resultados_envio.inc(resultado="enviada")
+                    logging.debug(f"Mensagem enviada para o chat {chat_id} em {time.monotonic() - inicio:.2f}s")
+                    return True
+                # 429: o Telegram informa quanto tempo esperar
+                espera = dados.get('parameters', {}).get('retry_after')
+                if espera is None and status >= 500:
+                    raise ValueError(f"HTTP {status}: {dados.get('description')}")
+                if espera is None:
+                    logging.error(f"Erro ao enviar mensagem para o chat {chat_id}: {dados.get('description')}")
+                    break
+                logging.warning(f"Limite do Telegram atingido, aguardando {espera}s")
+                await asyncio.sleep(espera)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logging.error(f"Erro ao enviar mensagem (tentativa {tentativa}): {e}")
+                await asyncio.sleep(min(2 ** tentativa, 30))
+        self.falhas += 1
+        resultados_envio.inc(resultado="falha")
+        return False
+
+metricas.coletada("telegram_fila", "Mensagens aguardando envio ao Telegram", "gauge", (),
+                  lambda: [((), sum(notificador.tamanho_fila for notificador in list(_notificadores)))])
+
+_compartilhados = {}
+
+def notificador_compartilhado(token):
+    """NotificadorTelegram único por token no processo: uma sessão e os mesmos limites por chat."""
+    if token not in _compartilhados:
+        _compartilhados[token] = NotificadorTelegram(token)
+    return _compartilhados[token]
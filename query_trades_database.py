@@ -1,36 +1,200 @@
-import sqlite3
+import argparse
+import csv
+import sys
+from datetime import datetime, timezone
 from sqlite3 import Error
+from database_config import create_connection
 
-# Função para criar conexão com o banco de dados SQLite
-def create_connection(db_file):
-    """ cria uma conexão com o banco de dados SQLite """
-    conn = None
+# Consulta o banco de trades em SQLite sem carregar a tabela inteira na memória:
+# as linhas são lidas em blocos (fetchmany) e escritas direto no destino.
+#
+#   python query_trades_database.py --symbol BTCUSDT --start 2024-05-01 --end "2024-05-01 12:00"
+#   python query_trades_database.py --symbol BTCUSDT --start 2024-05-01 --agressao --intervalo 5 -o agressao.parquet
+
+TAMANHO_BLOCO = 10_000  # Linhas por fetchmany
+
+COLUNAS_TRADES = ('id', 'symbol', 'trade_id', 'time', 'price', 'qty', 'is_buyer_maker')
+COLUNAS_AGRESSAO = ('symbol', 'intervalo', 'compra', 'venda', 'saldo', 'trades')
+
+# Converte "--start/--end" (epoch-ms ou data ISO em UTC) para epoch-ms
+def converter_tempo(valor):
+    if valor is None:
+        return None
+    if valor.isdigit():
+        return int(valor)
+    data = datetime.fromisoformat(valor)
+    if data.tzinfo is None:
+        data = data.replace(tzinfo=timezone.utc)
+    return int(data.timestamp() * 1000)
+
+def _filtros(symbol, inicio_ms, fim_ms):
+    condicoes, params = [], []
+    if symbol is not None:
+        condicoes.append("symbol = ?")
+        params.append(symbol)
+    if inicio_ms is not None:
+        condicoes.append("time >= ?")
+        params.append(inicio_ms)
+    if fim_ms is not None:
+        condicoes.append("time <= ?")
+        params.append(fim_ms)
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    return where, params
+
+def ler_blocos(cursor, tamanho=TAMANHO_BLOCO):
+    """ lê o resultado do cursor em blocos de `tamanho` linhas """
+    while True:
+        linhas = cursor.fetchmany(tamanho)
+        if not linhas:
+            break
+        yield linhas
+
+# Função para consultar os trades com filtro de símbolo e período
+def consultar_trades(conn, symbol=None, inicio_ms=None, fim_ms=None, tamanho=TAMANHO_BLOCO):
+    """ retorna um gerador de blocos de trades, em ordem de símbolo e tempo """
+    where, params = _filtros(symbol, inicio_ms, fim_ms)
+    cursor = conn.execute(f"""
+        SELECT {', '.join(COLUNAS_TRADES)} FROM trades
+        {where}
+        ORDER BY symbol, time
+    """, params)
+    return ler_blocos(cursor, tamanho)
+
+# Função para agregar a agressão por intervalo dentro do SQLite
+def consultar_agressao(conn, symbol=None, inicio_ms=None, fim_ms=None, intervalo_ms=60 * 1000,
+                       tamanho=TAMANHO_BLOCO):
+    """ soma compra/venda agressora por intervalo no próprio SQL (mesma conta do calculate_aggression)
+
+    Compra agressora é o trade em que o comprador não é o maker (is_buyer_maker = 0).
+    Intervalos sem trades saem com zero, como em CursorTrades.saldos: entre o
+    primeiro e o último trade de cada símbolo e, quando `inicio_ms`/`fim_ms`
+    são dados, também do início alinhado da janela até o primeiro trade e do
+    último até o fim. Com `symbol` e a janela inteira sem trades, a série sai
+    toda zerada.
+    """
+    where, params = _filtros(symbol, inicio_ms, fim_ms)
+    cursor = conn.execute(f"""
+        SELECT symbol,
+               (time / ?) * ? AS intervalo,
+               SUM(CASE WHEN is_buyer_maker = 0 THEN qty ELSE 0.0 END) AS compra,
+               SUM(CASE WHEN is_buyer_maker = 1 THEN qty ELSE 0.0 END) AS venda,
+               COUNT(*) AS trades
+        FROM trades
+        {where}
+        GROUP BY symbol, intervalo
+        ORDER BY symbol, intervalo
+    """, [intervalo_ms, intervalo_ms, *params])
+
+    primeiro = None if inicio_ms is None else inicio_ms - inicio_ms % intervalo_ms
+
+    def vazios(sym, de, ate):
+        return [(sym, vazio, 0.0, 0.0, 0.0, 0) for vazio in range(de, ate, intervalo_ms)]
+
+    def final(sym, ultimo):
+        # Intervalos vazios depois do último trade do símbolo, até o fim da janela
+        return [] if fim_ms is None else vazios(sym, ultimo + intervalo_ms, fim_ms + 1)
+
+    anterior = None  # (symbol, intervalo) da última linha escrita
+    for linhas in ler_blocos(cursor, tamanho):
+        bloco = []
+        for sym, intervalo, compra, venda, trades in linhas:
+            if anterior is not None and anterior[0] == sym:
+                bloco.extend(vazios(sym, anterior[1] + intervalo_ms, intervalo))
+            else:
+                if anterior is not None:
+                    bloco.extend(final(*anterior))
+                if primeiro is not None:
+                    bloco.extend(vazios(sym, primeiro, intervalo))
+            bloco.append((sym, intervalo, compra, venda, compra - venda, trades))
+            anterior = (sym, intervalo)
+        yield bloco
+
+    if anterior is not None:
+        resto = final(*anterior)
+    elif symbol is not None and primeiro is not None and fim_ms is not None:
+        resto = vazios(symbol, primeiro, fim_ms + 1)
+    else:
+        resto = []
+    if resto:
+        yield resto
+
+# Exportação em CSV, bloco a bloco
+def exportar_csv(colunas, blocos, destino):
+    saida = sys.stdout if destino == "-" else open(destino, "w", newline="")
+    total = 0
     try:
-        conn = sqlite3.connect(db_file)
-        return conn
-    except Error as e:
-        print(e)
-    return conn
+        writer = csv.writer(saida)
+        writer.writerow(colunas)
+        for bloco in blocos:
+            writer.writerows(bloco)
+            total += len(bloco)
+    finally:
+        if saida is not sys.stdout:
+            saida.close()
+    return total
+
+def _schema_parquet(pa, colunas):
+    tipos = {
+        'id': pa.int64(), 'symbol': pa.string(), 'trade_id': pa.int64(), 'time': pa.int64(),
+        'price': pa.float64(), 'qty': pa.float64(), 'is_buyer_maker': pa.int8(),
+        'intervalo': pa.int64(), 'compra': pa.float64(), 'venda': pa.float64(),
+        'saldo': pa.float64(), 'trades': pa.int64(),
+    }
+    return pa.schema([(coluna, tipos[coluna]) for coluna in colunas])
+
+# Exportação em Parquet, um row group por bloco (requer pyarrow)
+def exportar_parquet(colunas, blocos, destino):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("A exportação em Parquet requer o pacote pyarrow (pip install pyarrow)")
+    schema = _schema_parquet(pa, colunas)
+    total = 0
+    with pq.ParquetWriter(destino, schema, compression="zstd") as writer:
+        for bloco in blocos:
+            arrays = [pa.array(valores, type=campo.type) for valores, campo in zip(zip(*bloco), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            total += len(bloco)
+    return total
 
 # Função para consultar todos os trades no banco de dados
 def select_all_trades(conn):
-    """ consulta todos os trades no banco de dados """
+    """ consulta todos os trades no banco de dados, em blocos """
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM trades")
-
-        rows = cursor.fetchall()
-
-        for row in rows:
-            print(row)
+        for bloco in consultar_trades(conn):
+            for row in bloco:
+                print(row)
     except Error as e:
         print(e)
 
-if __name__ == '__main__':
-    database = "trades.db"
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta e exporta os trades gravados em SQLite.")
+    parser.add_argument("--db", default="trades.db", help="arquivo do banco de dados")
+    parser.add_argument("--symbol", help="símbolo, ex.: BTCUSDT (todos se omitido)")
+    parser.add_argument("--start", help="início (epoch-ms ou data ISO em UTC)")
+    parser.add_argument("--end", help="fim (epoch-ms ou data ISO em UTC)")
+    parser.add_argument("--agressao", action="store_true", help="agrega compra/venda agressora por intervalo")
+    parser.add_argument("--intervalo", type=int, default=1, help="intervalo da agregação em minutos")
+    parser.add_argument("-o", "--output", default="-", help="arquivo de saída (.csv ou .parquet); padrão: stdout em CSV")
+    parser.add_argument("--bloco", type=int, default=TAMANHO_BLOCO, help="linhas lidas por vez")
+    args = parser.parse_args(argv)
+
+    conn = create_connection(args.db)
+    inicio_ms, fim_ms = converter_tempo(args.start), converter_tempo(args.end)
+    if args.agressao:
+        colunas = COLUNAS_AGRESSAO
+        blocos = consultar_agressao(conn, args.symbol, inicio_ms, fim_ms, args.intervalo * 60 * 1000, args.bloco)
+    else:
+        colunas = COLUNAS_TRADES
+        blocos = consultar_trades(conn, args.symbol, inicio_ms, fim_ms, args.bloco)
 
-    # cria uma conexão com o banco de dados
-    conn = create_connection(database)
-    with conn:
-        print("Consultando todos os trades armazenados no banco de dados:")
-        select_all_trades(conn)
+    exportar = exportar_parquet if args.output.endswith(".parquet") else exportar_csv
+    try:
+        total = exportar(colunas, blocos, args.output)
+    finally:
+        conn.close()
+    print(f"{total} linhas exportadas", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
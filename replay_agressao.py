@@ -0,0 +1,235 @@
+import argparse
+import base64
+import csv
+import gzip
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Replay/backtest do sinal de agressão sobre trades gravados.
+#
+# Os trades (colunas NumPy no formato de trade_schema.decodificar_trades) são
+# agrupados em buckets com np.bincount e a regra de agressao.avaliar_agressao é
+# aplicada em janela deslizante ao fim de cada bucket: o saldo do bucket é
+# comparado com média ± multiplicador * desvio (ddof=1) dos últimos
+# lookback/bucket saldos, incluindo ele mesmo. É a mesma conta do monitor, só
+# que avaliada em todos os buckets de uma vez.
+#
+#   python replay_agressao.py parquet --symbol BTCUSDT --start 2024-05-01 --end 2024-05-08
+#   python replay_agressao.py sqlite --symbol BTCUSDT --lookback 15 30 60 --bucket 1 5 --mult 1 1.5 2
+#   python replay_agressao.py dynamodb --symbol AGG#BTCUSDT --start 2024-05-01  (aggTrades do motor)
+
+logging.basicConfig(level=logging.INFO)
+
+MINUTO_MS = 60 * 1000
+
+def agrupar_buckets(colunas, bucket_ms):
+    """Soma compra/venda agressora por bucket. Buckets sem trades valem zero.
+
+    Retorna (inícios dos buckets, compra, venda, último preço de cada bucket).
+    """
+    tempos = np.asarray(colunas['time'], dtype=np.int64)
+    if len(tempos) == 0:
+        vazio = np.array([], dtype=np.float64)
+        return np.array([], dtype=np.int64), vazio, vazio, vazio
+    ordem = np.argsort(tempos, kind='stable')
+    tempos = tempos[ordem]
+    qty = np.asarray(colunas['qty'], dtype=np.float64)[ordem]
+    venda = np.asarray(colunas['is_buyer_maker'], dtype=bool)[ordem]
+    precos = np.asarray(colunas['price'], dtype=np.float64)[ordem]
+
+    primeiro = tempos[0] - tempos[0] % bucket_ms
+    indices = (tempos - primeiro) // bucket_ms
+    total = int(indices[-1]) + 1
+    soma_venda = np.bincount(indices, weights=np.where(venda, qty, 0.0), minlength=total)
+    soma_compra = np.bincount(indices, weights=np.where(venda, 0.0, qty), minlength=total)
+
+    # Último preço de cada bucket; buckets vazios repetem o preço anterior
+    ultimos = np.flatnonzero(np.diff(indices, append=total))
+    preco_bucket = np.full(total, np.nan)
+    preco_bucket[indices[ultimos]] = precos[ultimos]
+    preenchido = np.where(np.isnan(preco_bucket), 0, np.arange(total))
+    np.maximum.accumulate(preenchido, out=preenchido)
+    preco_bucket = preco_bucket[preenchido]
+
+    inicios = primeiro + np.arange(total, dtype=np.int64) * bucket_ms
+    return inicios, soma_compra, soma_venda, preco_bucket
+
+def avaliar_serie(saldos, janela, multiplicador=1.0):
+    """Aplica avaliar_agressao em cada janela de `janela` saldos.
+
+    Retorna (média, limite superior, limite inferior, sinal) para os buckets a
+    partir do índice janela - 1; sinal é 1 (compra), -1 (venda) ou 0.
+    """
+    janelas = sliding_window_view(saldos, janela)
+    media = janelas.mean(axis=1)
+    desvio = janelas.std(axis=1, ddof=1) if janela > 1 else np.zeros(len(janelas))
+    superior = media + multiplicador * desvio
+    inferior = media - multiplicador * desvio
+    ultimo = saldos[janela - 1:]
+    sinal = np.where(ultimo > superior, 1, np.where(ultimo < inferior, -1, 0))
+    return media, superior, inferior, sinal
+
+def backtest(colunas, lookback_minutes=15, bucket_minutes=1, multiplicador=1.0, horizonte=5):
+    """Roda o sinal sobre os trades e retorna os sinais emitidos e um resumo.
+
+    `horizonte` é o número de buckets usados para medir o retorno depois de
+    cada sinal (no sentido do sinal: positivo é acerto).
+    """
+    bucket_ms = bucket_minutes * MINUTO_MS
+    janela = max(lookback_minutes // bucket_minutes, 1)
+    inicios, compra, venda, precos = agrupar_buckets(colunas, bucket_ms)
+    parametros = {'lookback': lookback_minutes, 'bucket': bucket_minutes, 'multiplicador': multiplicador}
+    if len(inicios) < janela:
+        return {'parametros': parametros, 'sinais': [], 'resumo': {'buckets': len(inicios), 'sinais': 0}}
+
+    saldos = compra - venda
+    media, superior, inferior, sinal = avaliar_serie(saldos, janela, multiplicador)
+    posicoes = np.flatnonzero(sinal) + janela - 1
+
+    futuros = np.minimum(posicoes + horizonte, len(precos) - 1)
+    retornos = (precos[futuros] / precos[posicoes] - 1) * sinal[posicoes - janela + 1]
+    validos = posicoes + horizonte < len(precos)
+
+    sinais = [
+        {
+            'inicio': int(inicios[i]),
+            'sinal': "compra" if sinal[i - janela + 1] > 0 else "venda",
+            'saldo': float(saldos[i]),
+            'media': float(media[i - janela + 1]),
+            'limite_superior': float(superior[i - janela + 1]),
+            'limite_inferior': float(inferior[i - janela + 1]),
+            'preco': float(precos[i]),
+            'retorno': float(retornos[k]) if validos[k] else None,
+        }
+        for k, i in enumerate(posicoes)
+    ]
+    resumo = {
+        'buckets': len(inicios),
+        'sinais': len(sinais),
+        'compras': int((sinal > 0).sum()),
+        'vendas': int((sinal < 0).sum()),
+        'acerto': float((retornos[validos] > 0).mean()) if validos.any() else None,
+        'retorno_medio': float(retornos[validos].mean()) if validos.any() else None,
+    }
+    return {'parametros': parametros, 'sinais': sinais, 'resumo': resumo}
+
+# ----- Varredura de parâmetros em vários processos -----
+
+_colunas_worker = None
+
+def _iniciar_worker(colunas):
+    # Os trades são enviados uma vez para cada processo, não a cada combinação
+    global _colunas_worker
+    _colunas_worker = colunas
+
+def _rodar_combinacao(argumentos):
+    lookback, bucket, multiplicador, horizonte = argumentos
+    resultado = backtest(_colunas_worker, lookback, bucket, multiplicador, horizonte)
+    return resultado['parametros'], resultado['resumo']
+
+def varrer_parametros(colunas, lookbacks=(15,), buckets=(1,), multiplicadores=(1.0,), horizonte=5, workers=None):
+    """Roda o backtest para todas as combinações de parâmetros em paralelo.
+
+    Retorna uma lista de (parâmetros, resumo), na ordem da grade.
+    """
+    grade = [(l, b, m, horizonte) for l, b, m in itertools.product(lookbacks, buckets, multiplicadores) if l >= b]
+    workers = min(workers or os.cpu_count() or 1, len(grade))
+    if workers <= 1:
+        _iniciar_worker(colunas)
+        return [_rodar_combinacao(argumentos) for argumentos in grade]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_worker, initargs=(colunas,)) as executor:
+        return list(executor.map(_rodar_combinacao, grade))
+
+# ----- Origens dos trades -----
+
+def _concatenar(blocos):
+    chaves = ('id', 'time', 'price', 'qty', 'is_buyer_maker')
+    if not blocos:
+        return {chave: np.array([]) for chave in chaves}
+    return {chave: np.concatenate([bloco[chave] for bloco in blocos]) for chave in chaves}
+
+def carregar_export_dynamodb(caminhos, symbol, inicio_ms, fim_ms):
+    """Lê um export do DynamoDB para o S3 (DYNAMODB_JSON, .json ou .json.gz) da tabela compacta."""
+    from trade_schema import decodificar_trades
+    prefixo = f"{symbol}#"
+    blocos = []
+    for caminho in caminhos:
+        abrir = gzip.open if caminho.endswith(".gz") else open
+        with abrir(caminho, "rt") as arquivo:
+            for linha in arquivo:
+                item = json.loads(linha)["Item"]
+                if not item["pk"]["S"].startswith(prefixo):
+                    continue
+                bloco = decodificar_trades(base64.b64decode(item["dados"]["B"]))
+                filtro = (bloco['time'] >= inicio_ms) & (bloco['time'] <= fim_ms)
+                blocos.append({chave: valores[filtro] for chave, valores in bloco.items()})
+    return _concatenar(blocos)
+
+def carregar_trades(origem, symbol, inicio_ms, fim_ms, db="trades.db", raiz=None, caminhos=()):
+    if origem == "sqlite":
+        from arquivo_trades import colunas_sqlite
+        from database_config import create_connection
+        conn = create_connection(db)
+        try:
+            return colunas_sqlite(conn, symbol, inicio_ms, fim_ms)
+        finally:
+            conn.close()
+    if origem == "parquet":
+        from arquivo_trades import ler_intervalo, DIRETORIO_ARQUIVO
+        return ler_intervalo(symbol, inicio_ms, fim_ms, raiz or DIRETORIO_ARQUIVO)
+    if origem == "dynamodb":
+        from dynamodb_config import dynamodb_client, table_name
+        from trade_schema import ler_intervalo
+        return ler_intervalo(dynamodb_client, table_name, symbol, inicio_ms, fim_ms)
+    return carregar_export_dynamodb(caminhos, symbol, inicio_ms, fim_ms)
+
+def main(argv=None):
+    from query_trades_database import converter_tempo
+    parser = argparse.ArgumentParser(description="Replay do sinal de agressão sobre trades gravados.")
+    parser.add_argument("origem", choices=["sqlite", "parquet", "dynamodb", "export"])
+    parser.add_argument("--symbol", required=True)
+    parser.add_argument("--start", required=True, help="início (epoch-ms ou data ISO em UTC)")
+    parser.add_argument("--end", help="fim (epoch-ms ou data ISO em UTC); padrão: agora")
+    parser.add_argument("--db", default="trades.db", help="banco SQLite (origem sqlite)")
+    parser.add_argument("--raiz", help="diretório do arquivo Parquet (origem parquet)")
+    parser.add_argument("--export", nargs="*", default=[], help="arquivos do export do DynamoDB (origem export)")
+    parser.add_argument("--lookback", type=int, nargs="+", default=[15], help="janela em minutos")
+    parser.add_argument("--bucket", type=int, nargs="+", default=[1], help="tamanho do bucket em minutos")
+    parser.add_argument("--mult", type=float, nargs="+", default=[1.0], help="multiplicador do desvio padrão")
+    parser.add_argument("--horizonte", type=int, default=5, help="buckets para medir o retorno após o sinal")
+    parser.add_argument("--workers", type=int, help="processos da varredura (padrão: núcleos da CPU)")
+    args = parser.parse_args(argv)
+
+    inicio_ms = converter_tempo(args.start)
+    fim_ms = converter_tempo(args.end) if args.end else int(time.time() * 1000)
+    colunas = carregar_trades(args.origem, args.symbol, inicio_ms, fim_ms, args.db, args.raiz, args.export)
+    logging.info(f"{len(colunas['id'])} trades carregados de {args.origem}")
+
+    inicio = time.perf_counter()
+    if len(args.lookback) == len(args.bucket) == len(args.mult) == 1:
+        # Uma combinação: lista todos os sinais em CSV
+        resultado = backtest(colunas, args.lookback[0], args.bucket[0], args.mult[0], args.horizonte)
+        if resultado['sinais']:
+            writer = csv.DictWriter(sys.stdout, fieldnames=list(resultado['sinais'][0]))
+            writer.writeheader()
+            writer.writerows(resultado['sinais'])
+        logging.info(f"Resumo: {resultado['resumo']}")
+        combinacoes = 1
+    else:
+        resultados = varrer_parametros(colunas, args.lookback, args.bucket, args.mult, args.horizonte, args.workers)
+        for parametros, resumo in resultados:
+            print(json.dumps({**parametros, **resumo}))
+        combinacoes = len(resultados)
+    duracao = time.perf_counter() - inicio
+    logging.info(f"{combinacoes} combinações em {duracao:.2f}s "
+                 f"({len(colunas['id']) * combinacoes / max(duracao, 1e-9):,.0f} trades/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from os import getenv
+from binance_rest import cliente
+
+# Cursor persistente de trades por símbolo.
+#
+# Guarda em disco o último trade visto e os volumes de agressão por minuto da
+# janela de análise. Assim cada ciclo só busca os trades depois do último id,
+# e um reinício não precisa baixar a janela inteira de novo. Quando o buraco é
+# grande (primeira execução ou processo parado por muito tempo), a janela é
+# preenchida com /api/v3/aggTrades em fatias de tempo buscadas em paralelo.
+# As requisições usam o cliente REST assíncrono (binance_rest.py).
+
+DIRETORIO_CURSORES = getenv("TRADE_CURSOR_DIR", "cursores")
+BURACO_BACKFILL_MS = 5 * 60 * 1000  # Acima disso usa aggTrades em paralelo
+FATIA_BACKFILL_MS = 60 * 1000       # Cada requisição paralela cobre 1 minuto
+WORKERS_BACKFILL = 8
+MINUTO_MS = 60 * 1000
+
+class CursorTrades:
+    """Último trade processado e volumes de agressão por minuto de um símbolo."""
+
+    def __init__(self, symbol, caminho=None):
+        self.symbol = symbol
+        self.caminho = caminho or os.path.join(DIRETORIO_CURSORES, f"{symbol}.json")
+        self.ultimo_id = None
+        self.ultimo_tempo = None
+        self.ultimo_preco = None
+        self.buckets = {}  # início do minuto (ms) -> [agressão compradora, agressão vendedora]
+
+    @classmethod
+    def carregar(cls, symbol, caminho=None):
+        cursor = cls(symbol, caminho)
+        try:
+            with open(cursor.caminho) as arquivo:
+                dados = json.load(arquivo)
+            cursor.ultimo_id = dados['ultimo_id']
+            cursor.ultimo_tempo = dados['ultimo_tempo']
+            cursor.ultimo_preco = dados['ultimo_preco']
+            cursor.buckets = {int(minuto): valores for minuto, valores in dados['buckets'].items()}
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as e:
+            logging.error(f"Cursor de {symbol} inválido, recomeçando: {e}")
+        return cursor
+
+    def salvar(self):
+        # Grava num arquivo temporário e troca, para nunca deixar o cursor pela metade
+        os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+        temporario = self.caminho + ".tmp"
+        with open(temporario, "w") as arquivo:
+            json.dump({
+                'ultimo_id': self.ultimo_id,
+                'ultimo_tempo': self.ultimo_tempo,
+                'ultimo_preco': self.ultimo_preco,
+                'buckets': self.buckets,
+            }, arquivo)
+        os.replace(temporario, self.caminho)
+
+    def aplicar(self, trades, intervalo_ms=MINUTO_MS):
+        """Soma os trades novos (id maior que o do cursor) nos buckets de agressão."""
+        aplicados = 0
+        for trade in trades:
+            if self.ultimo_id is not None and trade['id'] <= self.ultimo_id:
+                continue
+            minuto = trade['time'] - trade['time'] % intervalo_ms
+            bucket = self.buckets.setdefault(minuto, [0.0, 0.0])
+            # isBuyerMaker falso: o comprador foi o agressor
+            bucket[1 if trade['isBuyerMaker'] else 0] += float(trade['qty'])
+            self.ultimo_id = trade['id']
+            self.ultimo_tempo = trade['time']
+            self.ultimo_preco = float(trade['price'])
+            aplicados += 1
+        return aplicados
+
+    def podar(self, inicio_ms):
+        """Descarta os buckets anteriores ao início da janela."""
+        self.buckets = {minuto: valores for minuto, valores in self.buckets.items() if minuto >= inicio_ms}
+
+    def saldos(self, inicio_ms, fim_ms, intervalo_ms=MINUTO_MS):
+        """Retorna [(início do intervalo, compra, venda)] entre inicio_ms e fim_ms.
+
+        Os buckets de minuto são somados em intervalos de `intervalo_ms`; a
+        lista cobre todos os intervalos entre inicio_ms e fim_ms, com zeros nos
+        minutos sem trades (inclusive no começo e no fim da janela).
+        """
+        agregados = {}
+        for minuto, (compra, venda) in self.buckets.items():
+            if inicio_ms <= minuto <= fim_ms:
+                intervalo = agregados.setdefault(minuto - minuto % intervalo_ms, [0.0, 0.0])
+                intervalo[0] += compra
+                intervalo[1] += venda
+        return [
+            (inicio, *agregados.get(inicio, [0.0, 0.0]))
+            for inicio in range(inicio_ms - inicio_ms % intervalo_ms, fim_ms + 1, intervalo_ms)
+        ]
+
+# Converte um aggTrade para o formato de /historicalTrades
+def _converter_agg_trade(agg):
+    return {
+        'id': agg['l'],  # Último trade agregado: só serve de cursor, não é um id de trade individual
+        'time': agg['T'],
+        'price': agg['p'],
+        'qty': agg['q'],
+        'isBuyerMaker': agg['m'],
+    }
+
+async def buscar_agg_trades(symbol, inicio_ms, fim_ms, limit=1000):
+    """Busca todos os aggTrades entre inicio_ms e fim_ms, paginando pelo id quando necessário."""
+    params = {"symbol": symbol, "startTime": inicio_ms, "endTime": fim_ms, "limit": limit}
+    trades = []
+    while True:
+        lote = await cliente.get("/api/v3/aggTrades", params)
+        trades.extend(t for t in lote if t['T'] <= fim_ms)
+        if len(lote) < limit or lote[-1]['T'] > fim_ms:
+            break
+        params = {"symbol": symbol, "fromId": lote[-1]['a'] + 1, "limit": limit}
+    return [_converter_agg_trade(t) for t in trades]
+
+async def backfill_paralelo(symbol, inicio_ms, fim_ms, fatia_ms=FATIA_BACKFILL_MS, workers=WORKERS_BACKFILL):
+    """Preenche um intervalo grande com aggTrades, buscando fatias de tempo em paralelo."""
+    fatias = [(inicio, min(inicio + fatia_ms - 1, fim_ms)) for inicio in range(inicio_ms, fim_ms + 1, fatia_ms)]
+    semaforo = asyncio.Semaphore(workers)
+
+    async def buscar(fatia):
+        async with semaforo:
+            return await buscar_agg_trades(symbol, *fatia)
+
+    resultados = await asyncio.gather(*(buscar(fatia) for fatia in fatias))
+    trades = [trade for lote in resultados for trade in lote]
+    trades.sort(key=lambda trade: trade['id'])
+    logging.debug(f"Backfill de {symbol}: {len(trades)} trades em {len(fatias)} fatias")
+    return trades
+
+async def coletar_agg_trades(cursor, lookback_ms):
+    """Busca apenas os aggTrades posteriores ao cursor e os aplica.
+
+    Usa /aggTrades (peso 2 e sem chave de API): /historicalTrades (peso 25) não
+    cabe no limite de peso com centenas de pares. O ciclo normal busca por
+    tempo a partir do último trade do cursor, e os trades do mesmo
+    milissegundo que já foram aplicados são descartados pelo id; quando o
+    buraco é maior que BURACO_BACKFILL_MS, usa o backfill paralelo.
+    Retorna a lista de trades novos.
+    """
+    agora_ms = int(time.time() * 1000)
+    inicio_janela = agora_ms - lookback_ms
+
+    if cursor.ultimo_tempo is None or agora_ms - cursor.ultimo_tempo > BURACO_BACKFILL_MS:
+        inicio = inicio_janela if cursor.ultimo_tempo is None else max(cursor.ultimo_tempo + 1, inicio_janela)
+        novos = await backfill_paralelo(cursor.symbol, inicio, agora_ms)
+    else:
+        novos = await buscar_agg_trades(cursor.symbol, cursor.ultimo_tempo, agora_ms)
+        novos = [trade for trade in novos if trade['id'] > cursor.ultimo_id]
+
+    cursor.aplicar(novos)
+    cursor.podar(inicio_janela - inicio_janela % MINUTO_MS)
+    cursor.salvar()
+    return novos
+
+# ----- Verificação -----
+
+def verificar():
+    """Confere saldos() com minutos vazios no começo, no meio e no fim da janela."""
+    inicio = 1_700_000_040_000 - 1_700_000_040_000 % MINUTO_MS
+    cursor = CursorTrades("TESTE", caminho=os.devnull)
+    cursor.aplicar([
+        {'id': 1, 'time': inicio + 2 * MINUTO_MS + 5, 'price': '1', 'qty': '3', 'isBuyerMaker': False},
+        {'id': 2, 'time': inicio + 4 * MINUTO_MS + 7, 'price': '1', 'qty': '2', 'isBuyerMaker': True},
+    ])
+    fim = inicio + 7 * MINUTO_MS - 1
+
+    minutos = cursor.saldos(inicio, fim)
+    assert [m for m, _, _ in minutos] == [inicio + i * MINUTO_MS for i in range(7)], minutos
+    assert [(c, v) for _, c, v in minutos] == [(0, 0), (0, 0), (3, 0), (0, 0), (0, 2), (0, 0), (0, 0)], minutos
+
+    # Intervalos de 5 minutos: o início da janela é alinhado ao intervalo
+    cinco = cursor.saldos(inicio + MINUTO_MS, fim, 5 * MINUTO_MS)
+    base = inicio + MINUTO_MS - (inicio + MINUTO_MS) % (5 * MINUTO_MS)
+    assert [m for m, _, _ in cinco] == list(range(base, fim + 1, 5 * MINUTO_MS)), cinco
+    assert sum(c for _, c, _ in cinco) == 3 and sum(v for _, _, v in cinco) == 2, cinco
+
+    # Janela sem nenhum trade: só zeros, mas com todos os intervalos
+    vazia = CursorTrades("TESTE", caminho=os.devnull).saldos(inicio, fim)
+    assert len(vazia) == 7 and not any(c or v for _, c, v in vazia), vazia
+    print("saldos: ok")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verificações do cursor de trades")
+    parser.add_argument("acao", choices=["verificar"])
+    parser.parse_args()
+    verificar()
@@ -0,0 +1,173 @@
+import struct
+import zlib
+import numpy as np
+
+# Formato compacto de trades no DynamoDB.
+#
+# Em vez de um item por trade, cada item guarda um bloco de trades do mesmo
+# símbolo e do mesmo intervalo de tempo (bucket):
+#
+#   pk    (S) "<SYMBOL>#<início do bucket em epoch-ms>"
+#   sk    (N) epoch-ms do primeiro trade do bloco
+#   n     (N) quantidade de trades
+#   v     (N) versão do formato
+#   dados (B) colunas binárias comprimidas (ver codificar_trades)
+#
+# Trades vindos de /aggTrades têm como id o último trade agregado, que colide
+# com os ids reais de /historicalTrades; por isso ficam sob "AGG#<SYMBOL>"
+# (ver simbolo_agregado) e nunca se misturam com os trades individuais.
+#
+# Uma leitura de intervalo de tempo vira uma Query por bucket, sem Scan.
+
+VERSAO = 1
+MINUTO_MS = 60 * 1000
+SEGUNDO_MS = 1000
+MAX_TRADES_ITEM = 8000  # Mantém cada item bem abaixo do limite de 400 KB
+PREFIXO_AGG = "AGG#"    # Partições dos aggTrades, separadas das dos trades individuais
+
+_CABECALHO = struct.Struct('<BIqq')  # versão, n, primeiro id, primeiro timestamp
+
+def inicio_bucket(timestamp_ms, granularidade_ms=MINUTO_MS):
+    return timestamp_ms - timestamp_ms % granularidade_ms
+
+def chave_particao(symbol, timestamp_ms, granularidade_ms=MINUTO_MS):
+    return f"{symbol}#{inicio_bucket(timestamp_ms, granularidade_ms)}"
+
+def simbolo_agregado(symbol):
+    """Símbolo usado nas chaves dos aggTrades: 'BTCUSDT' -> 'AGG#BTCUSDT'."""
+    return f"{PREFIXO_AGG}{symbol}"
+
+# Codifica trades em colunas binárias
+def codificar_trades(ids, tempos, precos, quantidades, buyer_is_maker):
+    """Codifica as colunas de um bloco de trades ordenado por id.
+
+    ids e tempos são gravados como diferença em relação ao primeiro trade
+    (int64 e int32), preços e quantidades como float64 e o lado como bits.
+    As colunas são concatenadas e comprimidas com zlib.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    tempos = np.asarray(tempos, dtype=np.int64)
+    n = len(ids)
+    cabecalho = _CABECALHO.pack(VERSAO, n, int(ids[0]), int(tempos[0]))
+    colunas = b"".join([
+        np.diff(ids, prepend=ids[0]).astype('<i8').tobytes(),
+        (tempos - tempos[0]).astype('<i4').tobytes(),
+        np.asarray(precos, dtype='<f8').tobytes(),
+        np.asarray(quantidades, dtype='<f8').tobytes(),
+        np.packbits(np.asarray(buyer_is_maker, dtype=bool)).tobytes(),
+    ])
+    return cabecalho + zlib.compress(colunas, 6)
+
+def decodificar_trades(dados):
+    """Decodifica um bloco e retorna um dicionário de arrays NumPy."""
+    dados = bytes(dados)
+    versao, n, primeiro_id, primeiro_tempo = _CABECALHO.unpack_from(dados)
+    if versao != VERSAO:
+        raise ValueError(f"Versão de bloco de trades não suportada: {versao}")
+    colunas = zlib.decompress(dados[_CABECALHO.size:])
+    posicao = 0
+
+    def ler(dtype, quantidade):
+        nonlocal posicao
+        array = np.frombuffer(colunas, dtype=dtype, count=quantidade, offset=posicao)
+        posicao += array.nbytes
+        return array
+
+    ids = primeiro_id + np.cumsum(ler('<i8', n))
+    tempos = primeiro_tempo + ler('<i4', n).astype(np.int64)
+    precos = ler('<f8', n)
+    quantidades = ler('<f8', n)
+    lados = np.unpackbits(ler('u1', (n + 7) // 8))[:n].astype(bool)
+    return {'id': ids, 'time': tempos, 'price': precos, 'qty': quantidades, 'is_buyer_maker': lados}
+
+def montar_itens(symbol, trades, granularidade_ms=MINUTO_MS, max_trades=MAX_TRADES_ITEM):
+    """Agrupa trades (formato de /historicalTrades) em itens compactos por bucket."""
+    por_bucket = {}
+    for trade in trades:
+        por_bucket.setdefault(inicio_bucket(trade['time'], granularidade_ms), []).append(trade)
+
+    itens = []
+    for bucket, lista in sorted(por_bucket.items()):
+        lista.sort(key=lambda trade: trade['id'])
+        for i in range(0, len(lista), max_trades):
+            bloco = lista[i:i + max_trades]
+            itens.append({
+                'pk': f"{symbol}#{bucket}",
+                'sk': bloco[0]['time'],
+                'n': len(bloco),
+                'v': VERSAO,
+                'dados': codificar_trades(
+                    [t['id'] for t in bloco],
+                    [t['time'] for t in bloco],
+                    [float(t['price']) for t in bloco],
+                    [float(t['qty']) for t in bloco],
+                    [t['isBuyerMaker'] for t in bloco],
+                ),
+            })
+    return itens
+
+class AgrupadorTrades:
+    """Acumula trades por (símbolo, bucket) e libera os itens quando o bucket fecha.
+
+    Um bucket é considerado fechado `tolerancia_ms` depois do seu fim. Trades
+    que chegam atrasados para um bucket já gravado viram um novo item no mesmo
+    pk; o sk é ajustado em 1 ms se já tiver sido usado, para não sobrescrever.
+    """
+
+    def __init__(self, granularidade_ms=MINUTO_MS, tolerancia_ms=2000):
+        self.granularidade_ms = granularidade_ms
+        self.tolerancia_ms = tolerancia_ms
+        self.abertos = {}     # (symbol, bucket) -> lista de trades
+        self.sks_usados = {}  # (symbol, bucket) -> sks já gravados
+
+    def adicionar(self, symbol, trade):
+        chave = (symbol, inicio_bucket(trade['time'], self.granularidade_ms))
+        self.abertos.setdefault(chave, []).append(trade)
+
+    def fechar_vencidos(self, agora_ms, todos=False):
+        """Retorna os itens dos buckets encerrados (ou de todos, ao desligar)."""
+        itens = []
+        for chave in list(self.abertos):
+            symbol, bucket = chave
+            if todos or bucket + self.granularidade_ms + self.tolerancia_ms <= agora_ms:
+                usados = self.sks_usados.setdefault(chave, set())
+                for item in montar_itens(symbol, self.abertos.pop(chave), self.granularidade_ms):
+                    while item['sk'] in usados:
+                        item['sk'] += 1
+                    usados.add(item['sk'])
+                    itens.append(item)
+        # Esquece os sks de buckets antigos (mais de uma hora)
+        for chave in [c for c in self.sks_usados if c[1] < agora_ms - 3600 * 1000]:
+            del self.sks_usados[chave]
+        return itens
+
+def ler_intervalo(client, table_name, symbol, inicio_ms, fim_ms, granularidade_ms=MINUTO_MS):
+    """Lê os trades de um símbolo entre inicio_ms e fim_ms com uma Query por bucket.
+
+    Retorna um dicionário de arrays NumPy ordenados por id, sem repetições:
+    blocos regravados (nova tentativa, buraco preenchido pelo coletor com sk+1)
+    trazem de novo trades que já vieram em outro bloco.
+    """
+    blocos = []
+    for bucket in range(inicio_bucket(inicio_ms, granularidade_ms), fim_ms + 1, granularidade_ms):
+        params = {
+            'TableName': table_name,
+            'KeyConditionExpression': 'pk = :pk',
+            'ExpressionAttributeValues': {':pk': {'S': f"{symbol}#{bucket}"}},
+        }
+        while True:
+            resposta = client.query(**params)
+            for item in resposta['Items']:
+                blocos.append(decodificar_trades(item['dados']['B']))
+            if 'LastEvaluatedKey' not in resposta:
+                break
+            params['ExclusiveStartKey'] = resposta['LastEvaluatedKey']
+
+    colunas = ('id', 'time', 'price', 'qty', 'is_buyer_maker')
+    if not blocos:
+        return {coluna: np.array([]) for coluna in colunas}
+    juntos = {coluna: np.concatenate([bloco[coluna] for bloco in blocos]) for coluna in colunas}
+    # np.unique devolve os ids ordenados e o índice da primeira ocorrência de cada um
+    _, ordem = np.unique(juntos['id'], return_index=True)
+    filtro = (juntos['time'][ordem] >= inicio_ms) & (juntos['time'][ordem] <= fim_ms)
+    return {coluna: valores[ordem][filtro] for coluna, valores in juntos.items()}
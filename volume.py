@@ -1,11 +1,18 @@
-import ccxt.async_support as ccxt
+import argparse
+import numpy as np
 import pandas as pd
 import time
-import telebot
 from os import getenv
 import dotenv
 import logging
 import asyncio
+from candle_store import CandleStore
+from notificador import notificador_compartilhado
+from exchange_pool import get_exchange, close_exchange
+from market_snapshot import fonte_compartilhada
+from kline_stream import StreamKlines
+from agendador import Agendador
+import metricas
 
 # Configurações de logging
 logging.basicConfig(level=logging.INFO)
@@ -15,123 +22,203 @@ dotenv.load_dotenv()
 CHAVE_API = getenv("CHAVE_API")
 CHANNEL_ID = getenv("CHANNEL_ID")
 CHANNEL_IDB = getenv("CHANNEL_IDB")
-bot = telebot.TeleBot(CHAVE_API, parse_mode=None)
+notificador = notificador_compartilhado(CHAVE_API)
 
-# Inicializa a exchange Binance
-async def get_exchange():
-    """Retorna uma instância da exchange Binance (versão assíncrona)."""
-    return ccxt.binance()
+# Modo de execução: "stream" (klines por WebSocket) ou "rest" (consulta a cada minuto)
+MODO = getenv("VOLUME_MODO", "stream")
+INTERVALO_SIMBOLOS = 300  # No modo stream, a lista de símbolos é revista a cada 5 minutos
+JANELA_ALERTAS = 0.5      # Alertas de fechamentos quase simultâneos vão numa única mensagem
 
-async def close_exchange(exchange):
-    """Fecha corretamente a instância da exchange."""
-    if exchange:
-        await exchange.close()
+# Candles já baixados por (símbolo, timeframe); a cada rodada só os novos são buscados
+candle_store = CandleStore(capacidade=16)
+
+# Tickers de 24h compartilhados com os outros monitores
+snapshots = fonte_compartilhada(get_exchange)
 
 # Função para enviar mensagem para o Telegram de forma assíncrona
 async def send_telegram_message(message, chat_ids=[CHANNEL_ID, CHANNEL_IDB]):
-    try:
-        for chat_id in chat_ids:
-            bot.send_message(chat_id, message)
-            logging.info(f"Mensagem enviada para o chat {chat_id}: {message}")
-    except Exception as e:
-        logging.error(f"Erro ao enviar mensagem: {e}")
+    # Apenas enfileira; os chats recebem em paralelo, em segundo plano
+    notificador.enviar(message, chat_ids)
+    logging.debug(f"Mensagem enfileirada para os chats {chat_ids}")
 
 
 # Função para obter dados da Binance de forma assíncrona
 async def get_binance_data(binance, symbol, timeframe, limit):
-    logging.info(f"Obtendo dados de {symbol} para o timeframe {timeframe}")
-    ohlcv = await binance.fetch_ohlcv(symbol, timeframe, limit=limit)
+    logging.debug(f"Obtendo dados de {symbol} para o timeframe {timeframe}")
+    ohlcv = await candle_store.obter(binance, symbol, timeframe, limit)
+    return dataframe_candles(ohlcv)
+
+# Monta o DataFrame de candles com os volumes de compra e venda
+def dataframe_candles(ohlcv):
     df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-    df['buy_volume'] = df.apply(lambda row: row['volume'] * row['close'] if row['close'] > row['open'] else 0, axis=1)
-    df['sell_volume'] = df.apply(lambda row: row['volume'] * row['close'] if row['close'] <= row['open'] else 0, axis=1)
+    # Colunas inteiras de uma vez: candle de alta conta como compra, o resto como venda
+    abertura = df['open'].to_numpy(dtype=float)
+    fechamento = df['close'].to_numpy(dtype=float)
+    financeiro = df['volume'].to_numpy(dtype=float) * fechamento
+    df['buy_volume'] = np.where(fechamento > abertura, financeiro, 0.0)
+    df['sell_volume'] = np.where(fechamento <= abertura, financeiro, 0.0)
     return df
 
 # Função para filtrar símbolos por volume diário
-async def filter_symbols_by_daily_volume(binance, min_volume):
+async def filter_symbols_by_daily_volume(min_volume):
     logging.info(f"Filtrando símbolos com volume diário maior que {min_volume}")
-    tickers = await binance.fetch_tickers()
-    symbols = [symbol for symbol, ticker in tickers.items() if ticker['quoteVolume'] > min_volume and symbol.endswith('/USDT')]
-    logging.info(f"Símbolos filtrados: {symbols}")
+    snapshot = await snapshots.obter()
+    symbols = snapshot.acima_de(min_volume, usdt=True)
+    logging.debug(f"Símbolos filtrados: {symbols}")
     return symbols
 
-# Função principal para monitorar o volume
-async def monitor_volume():
+# Uma rodada de monitoramento de volume (modo rest)
+async def rodada_volume():
     min_daily_volume = 200_000_000  # Volume diário mínimo de 100 milhões de USDT
     timeframe_15m = '15m'
     timeframe_1m = '1m'
     limit = 3  # Limite para obter dados das últimas velas
 
-    while True:
-        binance = await get_exchange()
-        try:
-            logging.info("Iniciando nova rodada de monitoramento de volume")
-            symbols = await filter_symbols_by_daily_volume(binance, min_daily_volume)
+    binance = await get_exchange()
+    inicio = time.monotonic()
+    logging.info("Iniciando nova rodada de monitoramento de volume")
+    symbols = await filter_symbols_by_daily_volume(min_daily_volume)
 
-            tasks = []
-            results = []
-            for symbol in symbols:
-                tasks.append(process_symbol(binance, symbol, timeframe_15m, timeframe_1m, limit, results))
+    tasks = []
+    results = []
+    for symbol in symbols:
+        tasks.append(process_symbol(binance, symbol, timeframe_15m, timeframe_1m, limit, results))
 
-            # Executa todas as tarefas de forma assíncrona
-            await asyncio.gather(*tasks)
+    # Executa todas as tarefas de forma assíncrona
+    await asyncio.gather(*tasks)
+    metricas.registrar_ciclo("volume", len(symbols), time.monotonic() - inicio, len(results))
 
-            # Enviar uma única mensagem com os resultados
-            if results:
-                message = "результат поиска / Search result:\n"
-                for result in results:
-                    message += result + "\n"
-                await send_telegram_message(message)
-            else:
-                logging.info("no recommendations at the last minute.")
-        finally:
-            await close_exchange(binance)
+    # Enviar uma única mensagem com os resultados
+    if results:
+        await send_telegram_message(formatar_resultados(results))
+    else:
+        logging.info("no recommendations at the last minute.")
 
-
-        # Aguardar 1 minutos antes da próxima verificação
-        logging.info("Aguardando 1 minutos para a próxima rodada de verificação")
-        await asyncio.sleep(60)
+# Função principal para monitorar o volume: uma rodada logo após o fechamento de cada candle de 1 minuto
+async def monitor_volume():
+    agendador = Agendador()
+    agendador.adicionar("volume", rodada_volume, "1m")
+    await agendador.executar()
+
+# Mensagem única com todos os resultados de uma rodada
+def formatar_resultados(results):
+    message = "результат поиска / Search result:\n"
+    for result in results:
+        message += result + "\n"
+    return message
+
+# Monitoramento pelos streams de kline: cada símbolo é avaliado quando o candle de 1 minuto fecha
+async def monitor_volume_stream(symbols_fixos=None, usar_rest=True):
+    min_daily_volume = 200_000_000  # Volume diário mínimo de 100 milhões de USDT
+    timeframe_15m = '15m'
+    timeframe_1m = '1m'
+    limit = 3  # Limite para obter dados das últimas velas
+    pendentes = []
+    envios = set()
+
+    async def enviar_pendentes():
+        await asyncio.sleep(JANELA_ALERTAS)
+        results = pendentes[:]
+        pendentes.clear()
+        await send_telegram_message(formatar_resultados(results))
+
+    def ao_fechar(symbol, timeframe):
+        if timeframe != timeframe_1m:
+            return
+        ohlcv_15m = stream.ultimos(symbol, timeframe_15m, limit)
+        ohlcv_1m = stream.ultimos(symbol, timeframe_1m, limit)
+        if len(ohlcv_1m) < limit or not len(ohlcv_15m):
+            return  # Séries ainda se formando (sem preenchimento pela API REST)
+        result = avaliar_volume(symbol, dataframe_candles(ohlcv_15m), dataframe_candles(ohlcv_1m))
+        # No modo stream não há ciclo: cada fechamento conta um símbolo processado
+        metricas.simbolos_processados.inc(monitor="volume")
+        if result:
+            metricas.alertas_enviados.inc(monitor="volume")
+            pendentes.append(result)
+            if len(pendentes) == 1:
+                tarefa = asyncio.create_task(enviar_pendentes())
+                envios.add(tarefa)
+                tarefa.add_done_callback(envios.discard)
+
+    stream = StreamKlines((timeframe_1m, timeframe_15m), ao_fechar=ao_fechar, capacidade=limit + 1)
+    try:
+        while True:
+            symbols = symbols_fixos or await filter_symbols_by_daily_volume(min_daily_volume)
+            exchange = await get_exchange() if usar_rest else None
+            await stream.atualizar_simbolos(symbols, exchange)
+            logging.info(f"Streams de kline: {stream.metricas}")
+            await asyncio.sleep(INTERVALO_SIMBOLOS)
+    finally:
+        await stream.encerrar()
 
 # Função para processar cada símbolo e verificar volume
 async def process_symbol(binance, symbol, timeframe_15m, timeframe_1m, limit, results):
     try:
         # Obter dados dos últimos 15 minutos
-        logging.info(f"Obtendo volume dos últimos 15 minutos para {symbol}")
+        logging.debug(f"Obtendo volume dos últimos 15 minutos para {symbol}")
         df_15m = await get_binance_data(binance, symbol, timeframe_15m, limit)
-        buy_volume_15m = df_15m['buy_volume'].sum()
-        sell_volume_15m = df_15m['sell_volume'].sum()
-        volume_balance_15m = buy_volume_15m - sell_volume_15m
 
         # Obter dados do último minuto
-        logging.info(f"Obtendo volume do último minuto para {symbol}")
+        logging.debug(f"Obtendo volume do último minuto para {symbol}")
         df_1m = await get_binance_data(binance, symbol, timeframe_1m, limit)
-        buy_volume_1m = df_1m['buy_volume'].sum()
-        sell_volume_1m = df_1m['sell_volume'].sum()
-        volume_balance_1m = buy_volume_1m - sell_volume_1m
-
-        # Verificar se o módulo do saldo do último minuto é superior a 80% do módulo do saldo dos últimos 15 minutos
-        if abs(volume_balance_1m) > 2 * abs(volume_balance_15m):
-            if volume_balance_1m > 0:
-                alert_message = "сильная покупка / Strong Buy"
-            else:
-                alert_message = "Сильная продажа / Strong sell"
-            quantidade = abs(volume_balance_1m / df_1m['close'].iloc[-1])
-            valor = abs(volume_balance_1m)
-            preco_medio = valor / quantidade
-
-            logging.info(f"{alert_message} para {symbol}")
-            result_message = (
-                f"{alert_message}: {symbol}\n"
-                f"Количество / Quantity: {quantidade:,.2f} {symbol.split('/')[0]}\n"
-                f"Стоимость  / Value: {valor:,.2f} USDT\n"
-                f"Средняя цена / Average Price: {preco_medio:,.8f} USDT\n"
-            )
+
+        result_message = avaliar_volume(symbol, df_15m, df_1m)
+        if result_message:
             results.append(result_message)
-        else:
-            logging.info(f"Saldo do último minuto para {symbol} não excedeu 80% do saldo dos últimos 15 minutos")
     except Exception as e:
         logging.error(f"Erro ao processar {symbol}: {e}")
 
+# Compara o saldo do último minuto com o dos últimos 15 minutos; retorna a mensagem de alerta ou None
+def avaliar_volume(symbol, df_15m, df_1m):
+    buy_volume_15m = df_15m['buy_volume'].sum()
+    sell_volume_15m = df_15m['sell_volume'].sum()
+    volume_balance_15m = buy_volume_15m - sell_volume_15m
+
+    buy_volume_1m = df_1m['buy_volume'].sum()
+    sell_volume_1m = df_1m['sell_volume'].sum()
+    volume_balance_1m = buy_volume_1m - sell_volume_1m
+
+    # Verificar se o módulo do saldo do último minuto é superior a 80% do módulo do saldo dos últimos 15 minutos
+    if abs(volume_balance_1m) > 2 * abs(volume_balance_15m):
+        if volume_balance_1m > 0:
+            alert_message = "сильная покупка / Strong Buy"
+        else:
+            alert_message = "Сильная продажа / Strong sell"
+        quantidade = abs(volume_balance_1m / df_1m['close'].iloc[-1])
+        valor = abs(volume_balance_1m)
+        preco_medio = valor / quantidade
+
+        logging.info(f"{alert_message} para {symbol}")
+        result_message = (
+            f"{alert_message}: {symbol}\n"
+            f"Количество / Quantity: {quantidade:,.2f} {symbol.split('/')[0]}\n"
+            f"Стоимость  / Value: {valor:,.2f} USDT\n"
+            f"Средняя цена / Average Price: {preco_medio:,.8f} USDT\n"
+        )
+        return result_message
+    logging.debug(f"Saldo do último minuto para {symbol} não excedeu 80% do saldo dos últimos 15 minutos")
+    return None
+
+async def main(modo=MODO, symbols=None, usar_rest=True):
+    await metricas.servir()
+    try:
+        if modo == "stream":
+            await monitor_volume_stream(symbols, usar_rest)
+        else:
+            await monitor_volume()
+    finally:
+        await metricas.encerrar()
+        await snapshots.encerrar()
+        await close_exchange()
+        await notificador.encerrar()
+
 if __name__ == "__main__":
     # Iniciar o monitoramento de volume de forma assíncrona
-    logging.info("Iniciando o monitoramento de volume")
-    asyncio.run(monitor_volume())
+    parser = argparse.ArgumentParser(description="Monitor de volume")
+    parser.add_argument("--modo", choices=("stream", "rest"), default=MODO)
+    parser.add_argument("--simbolos", help="Lista fixa de símbolos (ex.: BTC/USDT,ETH/USDT) em vez do filtro por volume")
+    parser.add_argument("--sem-rest", action="store_true",
+                        help="Modo stream sem preencher as séries pela API REST (ex.: contra um servidor de replay)")
+    args = parser.parse_args()
+    logging.info(f"Iniciando o monitoramento de volume (modo {args.modo})")
+    asyncio.run(main(args.modo, args.simbolos.split(",") if args.simbolos else None, not args.sem_rest))